@@ -0,0 +1,314 @@
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "myCode"))
+sys.path.append(os.path.join(ROOT, "commands"))
+
+RESOLUTIONS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+}
+FPS = 30
+FONT_PATH = os.path.join(ROOT, "myCode", "PermanentMarker-Regular.ttf")
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baselines.json")
+MEDIA_DIR = os.path.join(ROOT, "benchmarks", "media")
+
+VOCABULARY = (
+    "the quick brown fox jumps over lazy dog stream chat clip highlight "
+    "play game win round team push back right left wait what yes no "
+    "absolutely incredible moment everyone watching tonight"
+).split()
+
+Renderer = Callable[[np.ndarray, float], np.ndarray]
+
+
+def make_test_video(resolution: str, duration: float, media_dir: str = MEDIA_DIR) -> str:
+    """Generate (once) a testsrc2 video with a sine tone using ffmpeg lavfi"""
+    os.makedirs(media_dir, exist_ok=True)
+    width, height = RESOLUTIONS[resolution]
+    path = os.path.join(media_dir, f"testsrc2_{resolution}_{duration:g}s.mp4")
+    if os.path.exists(path):
+        return path
+
+    command = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate={FPS}:duration={duration}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=48000:duration={duration}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-shortest', path
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Error generating {path}: {result.stderr}")
+    return path
+
+
+def synthetic_words(duration: float, words_per_second: float = 2.5, seed: int = 0) -> List[Dict]:
+    """Whisper-style word timings at a given density, with an occasional pause"""
+    rng = random.Random(seed)
+    words = []
+    t = 0.2
+    slot = 1 / words_per_second
+    while t + slot <= duration:
+        length = rng.uniform(0.4, 0.9) * slot
+        words.append({"word": " " + rng.choice(VOCABULARY), "start": t, "end": t + length})
+        t += slot
+        # Pauses longer than 0.5s split caption groups
+        if rng.random() < 0.08:
+            t += rng.uniform(0.6, 1.5)
+    return words
+
+
+def _sprite_renderer(sprites_at: Callable[[float], list]) -> Renderer:
+    from compositor import composite_frame
+    return lambda frame, t: composite_frame(frame, sprites_at(t))
+
+
+def setup_customized_captioner(video_path: str, size: Tuple[int, int], words: List[Dict]) -> Renderer:
+    from customizedCaptioner import VideoProcessor, CaptionGroup, CaptionStyle
+    from compositor import IntervalIndex
+
+    processor = VideoProcessor(video_path, os.devnull)
+    transcriptions = processor._process_transcription({"segments": [{"words": words}]})
+    style = CaptionStyle()
+    groups = [CaptionGroup(t["words"], style) for t in transcriptions]
+    index = IntervalIndex(groups, start=lambda g: g.start_time, end=lambda g: g.end_time)
+    return _sprite_renderer(lambda t: [g.placement(t, size) for g in index.active(t)])
+
+
+def setup_video_captions(video_path: str, size: Tuple[int, int], words: List[Dict]) -> Renderer:
+    from videoCaptions import VideoProcessor, CaptionGroup
+
+    processor = VideoProcessor(video_path, os.devnull)
+    processor.video_size = size
+    transcriptions = processor._process_transcription({"segments": [{"words": words}]})
+    groups = [
+        CaptionGroup(t["words"], processor.font_size, processor.font, processor.fade_steps)
+        for t in transcriptions
+    ]
+    return _sprite_renderer(processor._create_caption_layer(groups))
+
+
+def setup_clip_livestream(video_path: str, size: Tuple[int, int], words: List[Dict]) -> Renderer:
+    from clip_livestream import EnhancedVideoCaptioner
+    from compositor import PremultipliedSprite, IntervalIndex
+    from sprites import textclip_to_rgba
+
+    captioner = EnhancedVideoCaptioner(video_path, os.devnull)
+    placed = []
+    for word_data in words:
+        word_data = dict(word_data, word=word_data["word"].strip())
+        clip = captioner.create_text_clip(word_data, *size)
+        # Same placement as ('center', 'bottom') in moviepy
+        x, y = (size[0] - clip.w) // 2, size[1] - clip.h
+        placed.append((clip.start, clip.end, PremultipliedSprite(textclip_to_rgba(clip), x, y)))
+
+    index = IntervalIndex(placed, start=lambda item: item[0], end=lambda item: item[1])
+    return _sprite_renderer(lambda t: [(sprite, 0, 0) for _, _, sprite in index.active(t)])
+
+
+def _resolve_position(pos, clip_size: Tuple[int, int], size: Tuple[int, int]) -> Tuple[int, int]:
+    """Resolve moviepy 'center' positions to pixels"""
+    x, y = pos
+    if x == "center":
+        x = (size[0] - clip_size[0]) / 2
+    if y == "center":
+        y = (size[1] - clip_size[1]) / 2
+    return int(x), int(y)
+
+
+def setup_caption_package(video_path: str, size: Tuple[int, int], words: List[Dict]) -> Renderer:
+    from caption.render import render_caption
+    from caption.types import CaptionStyle, CaptionPosition, CaptionAnimation
+    from compositor import PremultipliedSprite
+
+    style = CaptionStyle(font_path=FONT_PATH, font_size=70, color="white", stroke_width=3)
+    placed = []
+    for start in range(0, len(words), 5):
+        group = words[start:start + 5]
+        group_start, group_end = group[0]["start"], group[-1]["end"]
+        clip = render_caption(
+            " ".join(w["word"].strip() for w in group),
+            group_end - group_start,
+            style,
+            CaptionPosition.BOTTOM,
+            CaptionAnimation.BOUNCE,
+            [w["start"] - group_start for w in group],
+            video_size=size,
+            fps=FPS,
+        )
+        placed.append((group_start, group_end, clip))
+
+    # Rasterize every frame's sprites up front, so the timed loop only composites, like the other cases.
+    # Frames that look the same (a held keyframe scale) share one sprite.
+    sprites = {}
+    frames = {}
+    for start, end, clip in placed:
+        for index in range(math.ceil(start * FPS), math.ceil(end * FPS)):
+            local_t = index / FPS - start
+            rgb = clip.get_frame(local_t)
+            alpha = clip.mask.get_frame(local_t) if clip.mask is not None else np.ones(rgb.shape[:2])
+            rgba = np.dstack([rgb, (alpha * 255).astype(np.uint8)]).astype(np.uint8)
+            x, y = _resolve_position(clip.pos(local_t), rgba.shape[1::-1], size)
+            key = (x, y, rgba.shape, hashlib.blake2b(rgba.tobytes(), digest_size=16).digest())
+            if key not in sprites:
+                sprites[key] = PremultipliedSprite(rgba, x, y)
+            frames.setdefault(index, []).append((sprites[key], 0, 0))
+
+    return _sprite_renderer(lambda t: frames.get(round(t * FPS), []))
+
+
+CASES = {
+    "customizedCaptioner": setup_customized_captioner,
+    "videoCaptions": setup_video_captions,
+    "clip_livestream": setup_clip_livestream,
+    "caption.render": setup_caption_package,
+}
+
+
+def _run_case(job: Dict) -> Dict:
+    """Time one render path over every frame of a synthetic video (runs in its own process)"""
+    from ffmpeg_pipe import FrameReader
+
+    size = RESOLUTIONS[job["resolution"]]
+    words = synthetic_words(job["duration"], job["density"])
+
+    setup_start = time.perf_counter()
+    render = CASES[job["case"]](job["video_path"], size, words)
+    setup_time = time.perf_counter() - setup_start
+
+    # Only the caption render and compositing are timed, not the decode
+    latencies = []
+    reader = FrameReader(job["video_path"], size)
+    try:
+        for index, frame in enumerate(reader):
+            start = time.perf_counter()
+            render(frame, index / FPS)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        reader.close()
+
+    latencies = np.array(latencies) * 1000
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    return {
+        "frames": len(latencies),
+        "words": len(words),
+        "setup_s": setup_time,
+        "render_fps": len(latencies) / max(latencies.sum() / 1000, 1e-9),
+        "p50_ms": float(p50),
+        "p90_ms": float(p90),
+        "p99_ms": float(p99),
+        "max_ms": float(latencies.max()),
+        # Linux reports kilobytes
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_benchmarks(
+    cases: List[str],
+    resolutions: List[str],
+    durations: List[float],
+    density: float
+) -> Dict[str, Dict]:
+    results = {}
+    # A fresh process per case keeps peak RSS and caches from leaking between runs
+    context = multiprocessing.get_context("spawn")
+    for resolution in resolutions:
+        for duration in durations:
+            video_path = make_test_video(resolution, duration)
+            for case in cases:
+                key = f"{case}/{resolution}/{duration:g}s/{density:g}wps"
+                print(f"Running {key}...")
+                job = {
+                    "case": case,
+                    "resolution": resolution,
+                    "duration": duration,
+                    "density": density,
+                    "video_path": video_path,
+                }
+                with context.Pool(1) as pool:
+                    results[key] = pool.apply(_run_case, (job,))
+                print(
+                    f"  {results[key]['render_fps']:.1f} fps, "
+                    f"p50 {results[key]['p50_ms']:.2f} ms, p99 {results[key]['p99_ms']:.2f} ms, "
+                    f"peak RSS {results[key]['peak_rss_mb']:.0f} MB"
+                )
+    return results
+
+
+def compare_to_baseline(results: Dict[str, Dict], baselines: Dict[str, Dict], tolerance: float) -> List[str]:
+    """Describe every metric that got worse than its baseline by more than tolerance"""
+    regressions = []
+    for key, result in results.items():
+        baseline = baselines.get(key)
+        if baseline is None:
+            continue
+        if result["render_fps"] < baseline["render_fps"] * (1 - tolerance):
+            regressions.append(
+                f"{key}: render fps {result['render_fps']:.1f} < baseline {baseline['render_fps']:.1f}"
+            )
+        for metric in ("p99_ms", "peak_rss_mb"):
+            if result[metric] > baseline[metric] * (1 + tolerance):
+                regressions.append(f"{key}: {metric} {result[metric]:.2f} > baseline {baseline[metric]:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark caption render paths on synthetic media")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--resolutions", nargs="+", choices=list(RESOLUTIONS), default=["1080p"])
+    parser.add_argument("--durations", nargs="+", type=float, default=[10.0],
+                        help="Video lengths in seconds, e.g. 10 60 600")
+    parser.add_argument("--density", type=float, default=2.5, help="Words per second")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Record these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Allowed slowdown before a result counts as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.cases, args.resolutions, args.durations, args.density)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    if args.save_baseline:
+        baselines.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to: {args.baseline}")
+        return
+
+    regressions = compare_to_baseline(results, baselines, args.tolerance)
+    if regressions:
+        print("\nRegressions against baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("\nNo regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
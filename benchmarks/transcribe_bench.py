@@ -0,0 +1,93 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "myCode"))
+
+MODES = ("sequential", "batched")
+
+
+def _cpu_seconds() -> float:
+    """User plus system CPU time of this process, across all of its threads"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _run_mode(job: Dict) -> Dict:
+    """Transcribe every file once in one mode (runs in its own process)"""
+    from audio import DecodedAudio
+    from model_pool import preload_models
+    from transcription import transcribe, transcribe_many
+
+    # Decoding and model loading are not what is measured
+    media = [DecodedAudio(path) for path in job["media"]]
+    preload_models([job["model"]], job["device"])
+    options = dict(language=job["language"], word_timestamps=True, verbose=None, temperature=0.0)
+
+    cpu_start, wall_start = _cpu_seconds(), time.perf_counter()
+    if job["mode"] == "batched":
+        results = transcribe_many(media, job["model"], job["device"], jobs=job["jobs"], cache=None, **options)
+    else:
+        results = [transcribe(item, job["model"], job["device"], cache=None, **options) for item in media]
+    cpu, wall = _cpu_seconds() - cpu_start, time.perf_counter() - wall_start
+
+    words = sum(len(segment.get("words", [])) for result in results for segment in result["segments"])
+    audio_seconds = sum(len(item.samples) / item.sample_rate for item in media)
+    return {
+        "words": words,
+        "audio_s": audio_seconds,
+        "cpu_s": cpu,
+        "wall_s": wall,
+        "words_per_cpu_s": words / max(cpu, 1e-9),
+        "words_per_wall_s": words / max(wall, 1e-9),
+        "realtime_factor": audio_seconds / max(wall, 1e-9),
+        # Linux reports kilobytes
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_benchmarks(media: List[str], modes: List[str], model: str, device: str, jobs: int, language: str) -> Dict[str, Dict]:
+    results = {}
+    # A fresh process per mode keeps warm caches and peak RSS from leaking between runs
+    context = multiprocessing.get_context("spawn")
+    for mode in modes:
+        key = f"{mode}/{model}/{len(media)}files"
+        print(f"Running {key}...")
+        job = {"mode": mode, "media": media, "model": model, "device": device, "jobs": jobs, "language": language}
+        with context.Pool(1) as pool:
+            results[key] = pool.apply(_run_mode, (job,))
+        print(
+            f"  {results[key]['words_per_cpu_s']:.1f} words/CPU-s, "
+            f"{results[key]['words_per_wall_s']:.1f} words/s, "
+            f"{results[key]['realtime_factor']:.1f}x realtime, "
+            f"peak RSS {results[key]['peak_rss_mb']:.0f} MB"
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sequential and batched Whisper transcription throughput")
+    parser.add_argument("media", nargs="+", help="Audio or video files with speech")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--jobs", type=int, default=4, help="Concurrent files in batched mode")
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.media, args.modes, args.model, args.device, args.jobs, args.language)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,3 @@
-from .types import CaptionPosition, CaptionAnimation
+from .types import CaptionPosition, CaptionAnimation, CaptionStyle, TextBackend
 from .render import render_caption
 from .positioning import position_caption
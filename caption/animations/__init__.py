@@ -1,12 +1,27 @@
+from typing import Dict
 from .word_by_word_fade import word_by_word_fade
 from .bounce import bounce
+from .pop import pop
+from .keyframes import scale_keyframes
 from ..types import CaptionAnimation, AnimationFunction
 
+# Scale curves; every curve registered here is rendered from precomputed keyframes
+SCALE_ANIMATIONS: Dict[CaptionAnimation, AnimationFunction] = {
+    CaptionAnimation.BOUNCE: bounce,
+    CaptionAnimation.POP: pop,
+}
+
+
+def register_scale_animation(
+    animation: CaptionAnimation, animation_func: AnimationFunction
+) -> None:
+    SCALE_ANIMATIONS[animation] = animation_func
+
 
 def get_animation_function(animation: CaptionAnimation) -> AnimationFunction:
     if animation == CaptionAnimation.WORD_BY_WORD_FADE:
         return word_by_word_fade
-    elif animation == CaptionAnimation.BOUNCE:
-        return bounce
+    elif animation in SCALE_ANIMATIONS:
+        return SCALE_ANIMATIONS[animation]
     else:
         return lambda t: t  # No animation
@@ -0,0 +1,51 @@
+from typing import Dict
+import numpy as np
+from moviepy.editor import VideoClip
+from PIL import Image
+
+from ..types import AnimationFunction
+
+
+def sample_scales(
+    animation_func: AnimationFunction,
+    duration: float,
+    fps: float,
+    quantum: float = 0.005,
+) -> np.ndarray:
+    # One sample per output frame, snapped so near-equal scales share a sprite
+    n_frames = max(int(np.ceil(duration * fps)), 1)
+    scales = np.array([animation_func(i / fps) for i in range(n_frames)], dtype=float)
+    return np.round(scales / quantum) * quantum
+
+
+def scale_keyframes(
+    clip: VideoClip,
+    animation_func: AnimationFunction,
+    fps: float,
+    quantum: float = 0.005,
+) -> VideoClip:
+    rgb = clip.get_frame(0)
+    if clip.mask is not None:
+        alpha = np.round(clip.mask.get_frame(0) * 255)
+    else:
+        alpha = np.full(rgb.shape[:2], 255)
+    base = np.dstack([rgb, alpha]).astype(np.uint8)
+
+    scales = sample_scales(animation_func, clip.duration, fps, quantum)
+    sprites: Dict[float, np.ndarray] = {1.0: base}
+
+    def sprite_at(t: float) -> np.ndarray:
+        scale = float(scales[min(int(t * fps + 1e-6), len(scales) - 1)])
+        if scale not in sprites:
+            height, width = base.shape[:2]
+            size = (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+            sprites[scale] = np.asarray(
+                Image.fromarray(base, "RGBA").resize(size, Image.LANCZOS)
+            )
+        return sprites[scale]
+
+    animated = VideoClip(lambda t: sprite_at(t)[:, :, :3], duration=clip.duration)
+    mask = VideoClip(
+        lambda t: sprite_at(t)[:, :, 3] / 255.0, ismask=True, duration=clip.duration
+    )
+    return animated.set_mask(mask)
@@ -0,0 +1,12 @@
+def pop(t):
+    duration = 0.25
+    overshoot = 1.7
+
+    if t >= duration:
+        return 1
+
+    # Ease-out-back: grows past full size, then settles back
+    progress = t / duration - 1
+    scale_factor = 1 + progress**3 * (overshoot + 1) + progress**2 * overshoot
+
+    return max(scale_factor, 0.05)
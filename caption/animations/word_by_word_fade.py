@@ -1,5 +1,10 @@
-from typing import List
-from moviepy.editor import CompositeVideoClip, TextClip
+from typing import List, Optional
+import warnings
+import numpy as np
+from moviepy.editor import VideoClip
+
+from ..text import text_rgba
+from ..types import CaptionStyle, TextBackend
 
 
 def word_by_word_fade(
@@ -9,80 +14,61 @@ def word_by_word_fade(
     color: str,
     word_timings: List[float],
     clip_duration: float,
-    method: str = "label",
+    method: Optional[str] = None,
     kerning: int = -2,
     fade_duration: float = 0.5,
     stroke_color: str = "#000000",
     stroke_width: int = 0,
-) -> CompositeVideoClip:
+    backend: TextBackend = TextBackend.PILLOW,
+) -> VideoClip:
+    if method is not None:
+        # Each word is a single-line label, so TextClip's method never changed the output
+        warnings.warn(
+            "word_by_word_fade's method argument is ignored and will be removed",
+            DeprecationWarning,
+            stacklevel=2,
+        )
     words = clause.split()
-    word_clips = []
 
-    # Create a clip for each word to get their sizes
-    temp_clips = [
-        TextClip(
-            txt=word,
-            fontsize=font_size,
-            font=font_path,
-            color=color,
-            method=method,
-            kerning=kerning,
-            align="West",
-            stroke_color=stroke_color,
-            stroke_width=stroke_width,
-        )
-        for word in words
-    ]
+    style = CaptionStyle(
+        font_path=font_path,
+        font_size=font_size,
+        color=color,
+        stroke_color=stroke_color,
+        stroke_width=stroke_width,
+        backend=backend,
+    )
+
+    # Rasterize each word once
+    rasters = [text_rgba(word, style, align="left", kerning=kerning) for word in words]
 
     # Calculate the maximum width and total height
-    max_width = max(clip.w for clip in temp_clips)
-    total_height = sum(clip.h for clip in temp_clips)
+    max_width = max(raster.shape[1] for raster in rasters)
+    total_height = sum(raster.shape[0] for raster in rasters)
 
+    # Stack the words into one left-aligned sprite, remembering each row's word
+    sprite = np.zeros((total_height, max_width, 4), dtype=np.uint8)
+    row_word = np.empty(total_height, dtype=np.intp)
     y_offset = 0
-    for i, (word, start_time) in enumerate(zip(words, word_timings)):
-        word_clip = TextClip(
-            txt=word,
-            fontsize=font_size,
-            font=font_path,
-            color=color,
-            method=method,
-            kerning=kerning,
-            align="West",
-            size=(max_width, None),
-            stroke_color=stroke_color,
-            stroke_width=stroke_width,
-        ).set_duration(clip_duration - start_time)
+    for i, raster in enumerate(rasters):
+        h, w = raster.shape[:2]
+        sprite[y_offset : y_offset + h, :w] = raster
+        row_word[y_offset : y_offset + h] = i
+        y_offset += h
 
-        # Create a transparent clip for crossfade
-        transparent_clip = (
-            TextClip(
-                txt=" ",
-                fontsize=font_size,
-                font=font_path,
-                color=color,
-                method=method,
-                kerning=kerning,
-                align="West",
-                size=word_clip.size,
-                stroke_color=stroke_color,
-                stroke_width=stroke_width,
-            )
-            .set_opacity(0)
-            .set_duration(clip_duration - start_time)
-        )
-
-        # Apply crossfade effect
-        word_clip = CompositeVideoClip([transparent_clip, word_clip])
-        word_clip = word_clip.crossfadein(fade_duration)  # type: ignore (crossfadein is not recognized)
+    rgb = sprite[:, :, :3]
+    alpha = sprite[:, :, 3].astype(np.float32) / 255
 
-        # Set the position after applying the crossfade
-        word_clip = word_clip.set_position((0, y_offset))
-
-        word_clip = word_clip.set_start(start_time).set_duration(
-            clip_duration - start_time
-        )
-        word_clips.append(word_clip)
+    # Words without a timing never appear
+    starts = np.full(len(words), np.inf)
+    n_timed = min(len(words), len(word_timings))
+    starts[:n_timed] = word_timings[:n_timed]
 
-        y_offset += word_clip.h
+    def make_mask(t):
+        # Linear fade-in per word, expanded to rows and applied in one blend
+        opacity = np.clip((t - starts) / max(fade_duration, 1e-6), 0, 1).astype(np.float32)
+        return alpha * opacity[row_word][:, None]
 
-    return CompositeVideoClip(word_clips, size=(max_width, total_height))
+    clip = VideoClip(lambda t: rgb, duration=clip_duration)
+    mask = VideoClip(make_mask, ismask=True, duration=clip_duration)
+    return clip.set_mask(mask)
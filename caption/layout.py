@@ -0,0 +1,123 @@
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from .text import load_font, measure_text
+from .types import CaptionStyle, LineBox, TextBackend, TextLayout
+
+
+class FontMetrics:
+    def __init__(self, font_path: str, font_size: int, stroke_width: int = 0):
+        self.font = load_font(font_path, font_size)
+        self.stroke_width = stroke_width
+        ascent, descent = self.font.getmetrics()
+        self.line_height = ascent + descent + 2 * stroke_width
+        self._advances: Dict[str, float] = {}
+        self._kerning: Dict[Tuple[str, str], float] = {}
+
+    def advance(self, char: str) -> float:
+        if char not in self._advances:
+            self._advances[char] = self.font.getlength(char)
+        return self._advances[char]
+
+    def kerning(self, left: str, right: str) -> float:
+        pair = (left, right)
+        if pair not in self._kerning:
+            self._kerning[pair] = (
+                self.font.getlength(left + right) - self.advance(left) - self.advance(right)
+            )
+        return self._kerning[pair]
+
+    def text_width(self, text: str) -> float:
+        width = sum(self.advance(char) for char in text)
+        width += sum(self.kerning(a, b) for a, b in zip(text, text[1:]))
+        return width
+
+
+class ImageMagickMetrics:
+    """Word widths measured by ImageMagick, for styles that TextClip renders
+
+    ImageMagick fonts are names like "Arial-Bold" that Pillow cannot open,
+    and its glyph advances differ from FreeType's, so words are measured
+    whole by the same rasterizer that draws them. Kerning is already part
+    of each measured word.
+    """
+    def __init__(self, font: str, font_size: int, stroke_width: int = 0):
+        # Stroke is measured without; layout_text adds it like for Pillow
+        self.style = CaptionStyle(
+            font_path=font, font_size=font_size, color="white", backend=TextBackend.IMAGEMAGICK
+        )
+        self.stroke_width = stroke_width
+        self.line_height = measure_text("Ag", self.style)[1] + 2 * stroke_width
+        self._widths: Dict[str, float] = {}
+
+    def text_width(self, text: str) -> float:
+        if text not in self._widths:
+            self._widths[text] = measure_text(text, self.style)[0]
+        return self._widths[text]
+
+    def advance(self, char: str) -> float:
+        if char == " ":
+            # A lone space renders as an empty label, so measure it between two glyphs
+            return self.text_width("x x") - self.text_width("xx")
+        return self.text_width(char)
+
+    def kerning(self, left: str, right: str) -> float:
+        return 0.0
+
+
+@lru_cache(maxsize=64)
+def get_metrics(
+    font_path: str,
+    font_size: int,
+    stroke_width: int = 0,
+    backend: TextBackend = TextBackend.PILLOW,
+):
+    if backend == TextBackend.IMAGEMAGICK:
+        return ImageMagickMetrics(font_path, font_size, stroke_width)
+    return FontMetrics(font_path, font_size, stroke_width)
+
+
+def layout_text(
+    text: str,
+    style: CaptionStyle,
+    max_width: int,
+    align: str = "center",
+) -> TextLayout:
+    metrics = get_metrics(style.font_path, style.font_size, style.stroke_width, style.backend)
+    stroke = 2 * style.stroke_width
+    space = metrics.advance(" ")
+
+    # Greedy wrap on pixel widths, carrying each line's width as it grows
+    lines: List[Tuple[str, float]] = []
+    current, current_width = "", 0.0
+    for word in text.split():
+        word_width = metrics.text_width(word)
+        if current:
+            candidate = (
+                current_width
+                + metrics.kerning(current[-1], " ")
+                + space
+                + metrics.kerning(" ", word[0])
+                + word_width
+            )
+            if candidate + stroke <= max_width:
+                current, current_width = f"{current} {word}", candidate
+                continue
+            lines.append((current, current_width))
+        current, current_width = word, word_width
+    if current:
+        lines.append((current, current_width))
+
+    block_width = int(max((width for _, width in lines), default=0) + stroke + 0.5)
+    boxes = []
+    for i, (line, width) in enumerate(lines):
+        line_width = int(width + stroke + 0.5)
+        if align == "center":
+            x = (block_width - line_width) // 2
+        elif align == "right":
+            x = block_width - line_width
+        else:
+            x = 0
+        boxes.append(LineBox(line, x, i * metrics.line_height, line_width, metrics.line_height))
+
+    return TextLayout(boxes, block_width, len(boxes) * metrics.line_height)
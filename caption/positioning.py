@@ -1,12 +1,22 @@
+from typing import Optional
 from moviepy.editor import CompositeVideoClip, VideoClip
-from .types import CaptionPosition
+from .types import CaptionPosition, TextLayout
 
 
 def position_caption(
-    clip: VideoClip, position: CaptionPosition, video_size: tuple[int, int]
+    clip: VideoClip,
+    position: CaptionPosition,
+    video_size: tuple[int, int],
+    layout: Optional[TextLayout] = None,
 ) -> CompositeVideoClip:
     w, h = video_size
 
+    # A precomputed layout gives the block size, so edges stay inside the frame
+    if layout is not None and position == CaptionPosition.RIGHT:
+        return clip.set_position((w - 10 - layout.width, "center"))
+    if layout is not None and position == CaptionPosition.BOTTOM:
+        return clip.set_position(("center", h - 10 - layout.height))
+
     if position == CaptionPosition.CENTER:
         pos = ("center", "center")
     elif position == CaptionPosition.LEFT:
@@ -1,18 +1,18 @@
-from textwrap import wrap
 from typing import List, Optional
-from moviepy.editor import TextClip, CompositeVideoClip
+from moviepy.editor import CompositeVideoClip, VideoClip
 
-from artisanads import video
-from animations.bounce import bounce
-from animations.word_by_word_fade import word_by_word_fade
 from .types import (
     AnimationFunction,
     CaptionStyle,
     CaptionPosition,
     CaptionAnimation,
+    TextLayout,
 )
 from .positioning import position_caption
-from .animations import get_animation_function
+from .animations import get_animation_function, scale_keyframes
+from .animations.word_by_word_fade import word_by_word_fade
+from .layout import layout_text
+from .text import layout_clip
 
 
 def render_caption(
@@ -23,24 +23,32 @@ def render_caption(
     animation: CaptionAnimation,
     word_timings: List[float],
     video_size: tuple[int, int] = (1920, 1080),
+    fps: float = 30,
+    max_width_percentage: float = 0.7,
 ) -> CompositeVideoClip:
     if animation == CaptionAnimation.WORD_BY_WORD_FADE and word_timings is None:
         raise ValueError("Word timings are required for word-by-word fade animation")
 
     animation_func = get_animation_function(animation)
+    layout = None
 
     if animation == CaptionAnimation.WORD_BY_WORD_FADE:
         clip = render_word_by_word(text, duration, style, word_timings, animation)
-    elif animation == CaptionAnimation.NONE:
-        clip = render_full_text(
-            text, duration, style, animation_func=None, video_size=video_size
-        )
     else:
+        # Lay the text out once; the renderer and positioning both reuse it
+        layout = layout_text(text, style, int(video_size[0] * max_width_percentage))
         clip = render_full_text(
-            text, duration, style, animation_func, video_size=video_size
+            text,
+            duration,
+            style,
+            animation_func=None if animation == CaptionAnimation.NONE else animation_func,
+            video_size=video_size,
+            max_width_percentage=max_width_percentage,
+            layout=layout,
+            fps=fps,
         )
 
-    positioned_clip = position_caption(clip, position, video_size)
+    positioned_clip = position_caption(clip, position, video_size, layout)
     return positioned_clip
 
 
@@ -50,7 +58,7 @@ def render_word_by_word(
     style: CaptionStyle,
     word_timings: List[float],
     animation: CaptionAnimation,
-) -> CompositeVideoClip:
+) -> VideoClip:
     if animation == CaptionAnimation.WORD_BY_WORD_FADE:
         return word_by_word_fade(
             text,
@@ -61,6 +69,7 @@ def render_word_by_word(
             duration,
             stroke_color=style.stroke_color,
             stroke_width=style.stroke_width,
+            backend=style.backend,
         )
     else:
         # Implement other word-by-word animations here if needed
@@ -77,41 +86,16 @@ def render_full_text(
     video_size: tuple[int, int] = (1920, 1080),
     position: CaptionPosition = CaptionPosition.CENTER,
     max_width_percentage: float = 0.7,
-) -> TextClip:
-    # Calculate maximum width for text
-    max_width = int(video_size[0] * max_width_percentage)
-
-    # Create a temporary TextClip to measure text width
-    temp_clip = TextClip(
-        txt="test",
-        fontsize=style.font_size,
-        font=style.font_path,
-        color=style.color,
-        stroke_color=style.stroke_color,
-        stroke_width=style.stroke_width,
-    )
-
-    # Estimate characters per line
-    char_width = temp_clip.w / 4  # Assuming 'test' is representative
-    chars_per_line = int(max_width / char_width)
-
-    # Wrap text
-    wrapped_text = "\n".join(wrap(text, width=chars_per_line))
+    layout: Optional[TextLayout] = None,
+    fps: float = 30,
+) -> VideoClip:
+    if layout is None:
+        layout = layout_text(text, style, int(video_size[0] * max_width_percentage))
 
-    # Create the actual TextClip with wrapped text
-    clip = TextClip(
-        txt=wrapped_text,
-        fontsize=style.font_size,
-        font=style.font_path,
-        color=style.color,
-        stroke_color=style.stroke_color,
-        stroke_width=style.stroke_width,
-        method="caption",  # This method better handles multiline text
-        align="center",
-        size=(max_width, None),  # Set maximum width, height will adjust automatically
-    ).set_duration(duration)
+    clip = layout_clip(layout, style).set_duration(duration)
 
     if animation_func:
-        clip = clip.resize(lambda t: animation_func(t))
+        # Sample the curve once per output frame and reuse one sprite per scale
+        clip = scale_keyframes(clip, animation_func, fps)
 
     return clip
@@ -0,0 +1,187 @@
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import numpy as np
+from moviepy.editor import ImageClip, TextClip, VideoClip
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+from .types import CaptionStyle, TextBackend, TextLayout
+
+
+@lru_cache(maxsize=64)
+def load_font(font_path: str, font_size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(font_path, font_size)
+
+
+def _parse_color(color: str) -> Tuple[int, int, int, int]:
+    rgba = ImageColor.getrgb(color)
+    return rgba if len(rgba) == 4 else rgba + (255,)
+
+
+def measure_text(text: str, style: CaptionStyle) -> Tuple[int, int]:
+    if style.backend == TextBackend.IMAGEMAGICK:
+        clip = TextClip(
+            txt=text,
+            fontsize=style.font_size,
+            font=style.font_path,
+            color=style.color,
+            stroke_color=style.stroke_color,
+            stroke_width=style.stroke_width,
+        )
+        return clip.w, clip.h
+
+    font = load_font(style.font_path, style.font_size)
+    left, top, right, bottom = font.getbbox(text, stroke_width=style.stroke_width)
+    return right - left, bottom - top
+
+
+def _rasterize_tracked(
+    text: str,
+    style: CaptionStyle,
+    width: Optional[int],
+    align: str,
+    kerning: int,
+) -> np.ndarray:
+    """One line with kerning extra pixels between characters, like ImageMagick's -kerning"""
+    font = load_font(style.font_path, style.font_size)
+    stroke_width = style.stroke_width if style.stroke_color else 0
+
+    left, top, right, bottom = font.getbbox(text, stroke_width=stroke_width)
+    text_width = max(right - left + kerning * (len(text) - 1), 1)
+    canvas_width = max(width or 0, text_width)
+
+    if align == "center":
+        x = (canvas_width - text_width) // 2 - left
+    elif align == "right":
+        x = canvas_width - text_width - left
+    else:
+        x = -left
+
+    image = Image.new("RGBA", (canvas_width, max(bottom - top, 1)))
+    draw = ImageDraw.Draw(image)
+    for i, char in enumerate(text):
+        # The advance of the prefix keeps the font's own pair kerning
+        draw.text(
+            (x + font.getlength(text[:i]) + i * kerning, -top),
+            char,
+            font=font,
+            fill=_parse_color(style.color),
+            stroke_width=stroke_width,
+            stroke_fill=_parse_color(style.stroke_color) if stroke_width else None,
+        )
+    return np.asarray(image)
+
+
+def rasterize_text(
+    text: str,
+    style: CaptionStyle,
+    width: Optional[int] = None,
+    align: str = "center",
+    kerning: Optional[int] = None,
+) -> np.ndarray:
+    # Kerning applies to single lines; multi-line text keeps the font's spacing
+    if kerning and text and "\n" not in text:
+        return _rasterize_tracked(text, style, width, align, kerning)
+
+    font = load_font(style.font_path, style.font_size)
+    stroke_width = style.stroke_width if style.stroke_color else 0
+
+    # Measure the ink box, stroke included
+    probe = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+    left, top, right, bottom = probe.multiline_textbbox(
+        (0, 0), text, font=font, align=align, stroke_width=stroke_width
+    )
+    text_width = right - left
+    canvas_width = max(width or 0, text_width)
+
+    if align == "center":
+        x = (canvas_width - text_width) // 2 - left
+    elif align == "right":
+        x = canvas_width - text_width - left
+    else:
+        x = -left
+
+    image = Image.new("RGBA", (max(canvas_width, 1), max(bottom - top, 1)))
+    ImageDraw.Draw(image).multiline_text(
+        (x, -top),
+        text,
+        font=font,
+        fill=_parse_color(style.color),
+        align=align,
+        stroke_width=stroke_width,
+        stroke_fill=_parse_color(style.stroke_color) if stroke_width else None,
+    )
+    return np.asarray(image)
+
+
+def text_rgba(
+    text: str,
+    style: CaptionStyle,
+    align: str = "center",
+    kerning: Optional[int] = None,
+) -> np.ndarray:
+    if style.backend == TextBackend.PILLOW:
+        return rasterize_text(text, style, align=align, kerning=kerning)
+
+    clip = text_clip(text, style, align=align, kerning=kerning)
+    alpha = np.round(clip.mask.get_frame(0) * 255)
+    return np.dstack([clip.get_frame(0), alpha]).astype(np.uint8)
+
+
+def text_clip(
+    text: str,
+    style: CaptionStyle,
+    width: Optional[int] = None,
+    align: str = "center",
+    kerning: Optional[int] = None,
+) -> VideoClip:
+    if style.backend == TextBackend.IMAGEMAGICK:
+        return TextClip(
+            txt=text,
+            fontsize=style.font_size,
+            font=style.font_path,
+            color=style.color,
+            stroke_color=style.stroke_color,
+            stroke_width=style.stroke_width,
+            method="caption" if width else "label",
+            align={"left": "West", "right": "East"}.get(align, "center"),
+            size=(width, None) if width else None,
+            kerning=kerning,
+        )
+
+    return ImageClip(rasterize_text(text, style, width, align, kerning), transparent=True)
+
+
+def rasterize_layout(layout: TextLayout, style: CaptionStyle) -> np.ndarray:
+    font = load_font(style.font_path, style.font_size)
+    stroke_width = style.stroke_width if style.stroke_color else 0
+
+    image = Image.new("RGBA", (max(layout.width, 1), max(layout.height, 1)))
+    draw = ImageDraw.Draw(image)
+    for line in layout.lines:
+        draw.text(
+            (line.x + style.stroke_width, line.y + style.stroke_width),
+            line.text,
+            font=font,
+            fill=_parse_color(style.color),
+            anchor="la",
+            stroke_width=stroke_width,
+            stroke_fill=_parse_color(style.stroke_color) if stroke_width else None,
+        )
+    return np.asarray(image)
+
+
+def layout_clip(layout: TextLayout, style: CaptionStyle) -> VideoClip:
+    if style.backend == TextBackend.IMAGEMAGICK:
+        return TextClip(
+            txt="\n".join(line.text for line in layout.lines),
+            fontsize=style.font_size,
+            font=style.font_path,
+            color=style.color,
+            stroke_color=style.stroke_color,
+            stroke_width=style.stroke_width,
+            method="label",
+            align="center",
+        )
+
+    return ImageClip(rasterize_layout(layout, style), transparent=True)
@@ -1,6 +1,6 @@
 from enum import Enum
 from dataclasses import dataclass
-from typing import Callable, Any
+from typing import Callable, Any, List
 
 
 class CaptionPosition(str, Enum):
@@ -15,6 +15,12 @@ class CaptionAnimation(str, Enum):
     NONE = "none"
     WORD_BY_WORD_FADE = "word_by_word_fade"
     BOUNCE = "bounce"
+    POP = "pop"
+
+
+class TextBackend(str, Enum):
+    PILLOW = "pillow"
+    IMAGEMAGICK = "imagemagick"
 
 
 @dataclass
@@ -24,6 +30,23 @@ class CaptionStyle:
     color: str
     stroke_color: str = "black"
     stroke_width: int = 0
+    backend: TextBackend = TextBackend.PILLOW
+
+
+@dataclass
+class LineBox:
+    text: str
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+@dataclass
+class TextLayout:
+    lines: List[LineBox]
+    width: int
+    height: int
 
 
 AnimationFunction = Callable[[Any], Any]  # Placeholder for more specific type hints
@@ -1,43 +1,84 @@
-import whisper
 import torch
 from moviepy.editor import VideoFileClip, TextClip, CompositeVideoClip
 from moviepy.config import change_settings
+from concurrent.futures import ThreadPoolExecutor
 import os
+import sys
 import time
 
+# Shared caption rendering helpers live in myCode/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "myCode"))
+from audio import DecodedAudio
+from compositor import composite_clips, composite_frame
+from ffmpeg_pipe import check_engine, probe_video, render_clips
+from profiling import Profiler
+from transcription import transcribe
+from live_transcribe import live_pcm, LiveTranscriber, SrtWriter
+
 # Configure MoviePy to use ImageMagick
 change_settings({"IMAGEMAGICK_BINARY": "convert"})
 
 class EnhancedVideoCaptioner:
-    def __init__(self, input_video="input.mp4", output_video="output_captioned.mp4"):
+    def __init__(
+        self,
+        input_video="input.mp4",
+        output_video="output_captioned.mp4",
+        engine="moviepy",
+        profile_path=None,
+        trace_path=None,
+        chunk_seconds=None,
+        workers=None,
+        batched=False
+    ):
         self.input_video = input_video
         self.output_video = output_video
+        self.engine = check_engine(engine)
+        self.profile_path = profile_path
+        self.trace_path = trace_path
+        self.profiler = Profiler(
+            "clip_livestream",
+            enabled=profile_path is not None or trace_path is not None
+        )
+        # Long recordings: transcribe silence-bounded chunks of at most this many seconds in parallel
+        self.chunk_seconds = chunk_seconds
+        self.workers = workers
+        # Share batched Whisper decoding with other captioners running in this process
+        self.batched = batched
+        # Decoded PCM is memory-mapped from disk next to the output, not held in RAM
+        self.store_path = os.path.splitext(output_video)[0] + '_audio.npy'
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         print(f"Using device: {self.device}")
 
     def get_word_timestamps(self):
         """Extract word-level timestamps using Whisper"""
-        print("Loading Whisper model...")
-        model = whisper.load_model("base", device=self.device)
+        with self.profiler.stage("audio_extraction"):
+            audio = DecodedAudio(self.input_video, store_path=self.store_path)
 
         print("Transcribing audio...")
-        result = model.transcribe(
-            self.input_video,
+        result = transcribe(
+            audio,
+            "base",
+            device=self.device,
+            profiler=self.profiler,
+            chunk_seconds=self.chunk_seconds,
+            workers=self.workers,
+            batched=self.batched,
             language="en",
             word_timestamps=True,
             verbose=False
         )
 
-        words_with_times = []
-        if 'segments' in result:
-            for segment in result['segments']:
-                if 'words' in segment:
-                    for word_data in segment['words']:
-                        words_with_times.append({
-                            'word': word_data['word'].strip(),
-                            'start': word_data['start'],
-                            'end': word_data['end']
-                        })
+        with self.profiler.stage("word_grouping"):
+            words_with_times = []
+            if 'segments' in result:
+                for segment in result['segments']:
+                    if 'words' in segment:
+                        for word_data in segment['words']:
+                            words_with_times.append({
+                                'word': word_data['word'].strip(),
+                                'start': word_data['start'],
+                                'end': word_data['end']
+                            })
 
         print(f"Found {len(words_with_times)} words in the audio")
         return words_with_times
@@ -59,6 +100,103 @@ class EnhancedVideoCaptioner:
                 .set_duration(word_data['end'] - word_data['start'])
                 .set_position(('center', 'bottom')))
 
+    def render_with_ffmpeg(self, text_clips, video_width, video_height):
+        """Burn the word clips in through ffmpeg pipes, copying the audio stream"""
+        render_clips(
+            self.input_video,
+            self.output_video,
+            text_clips,
+            encoder_params=['-c:v', 'libx264', '-preset', 'ultrafast', '-threads', '4'],
+            composite=self.profiler.timed("composite", composite_frame),
+            # Same placement as ('center', 'bottom') in moviepy
+            position=lambda clip: ((video_width - clip.w) // 2, video_height - clip.h)
+        )
+
+    def caption_segment(self, path, words, output_path):
+        """Burn finalized words, timed from the start of the segment, into a copy of one recording"""
+        info = probe_video(path)
+        video_width, video_height = info['width'], info['height']
+        text_clips = [self.create_text_clip(word, video_width, video_height) for word in words]
+        render_clips(
+            path,
+            output_path,
+            text_clips,
+            encoder_params=['-c:v', 'libx264', '-preset', 'ultrafast', '-threads', '4'],
+            position=lambda clip: ((video_width - clip.w) // 2, video_height - clip.h)
+        )
+        print(f"Captioned segment written to: {output_path}")
+
+    def caption_live(self, srt_path="live_captions.srt", step_seconds=2.0, idle_timeout=10.0, overlay_dir=None):
+        """Caption a recording while it is still being written
+
+        input_video may be a growing file (fragmented MP4 or MPEG-TS), "-"
+        for a pipe on stdin, or a directory such as recorded_clips/ that
+        segments land in. Finished caption cues are appended to srt_path a
+        few seconds after the words are spoken. For a directory, each
+        segment whose words are all final is also rendered with burned-in
+        captions into overlay_dir (default: <output_video>_segments/).
+        """
+        print(f"Following {self.input_video} for live captions...")
+        segments = None
+        if os.path.isdir(self.input_video):
+            segments = []
+            overlay_dir = overlay_dir or os.path.splitext(self.output_video)[0] + "_segments"
+            os.makedirs(overlay_dir, exist_ok=True)
+        with self.profiler.stage("model_load"):
+            transcriber = LiveTranscriber(
+                "base",
+                device=self.device,
+                step_seconds=step_seconds,
+                batched=self.batched,
+                language="en"
+            )
+        writer = SrtWriter(srt_path)
+        latency = self.profiler.timed("live_step", transcriber.feed)
+        # Segments render in the background so transcription keeps up with the stream
+        overlays = ThreadPoolExecutor(max_workers=1)
+        renders = []
+        recent_words = []
+
+        def caption_finished_segments(horizon):
+            while segments and segments[0][2] <= horizon:
+                path, start, end = segments.pop(0)
+                segment_words = [
+                    dict(word, start=word['start'] - start, end=min(word['end'], end) - start)
+                    for word in recent_words if start <= word['start'] < end
+                ]
+                recent_words[:] = [word for word in recent_words if word['start'] >= end]
+                if path.lower().endswith(('.m4a', '.wav', '.mp3')):
+                    continue  # Nothing to draw on
+                name = os.path.splitext(os.path.basename(path))[0] + "_captioned.mp4"
+                renders.append(overlays.submit(
+                    self.caption_segment, path, segment_words, os.path.join(overlay_dir, name)
+                ))
+
+        try:
+            for samples in live_pcm(self.input_video, idle_timeout=idle_timeout, segments=segments):
+                words = latency(samples)
+                writer.add(words)
+                writer.expire(transcriber.horizon)
+                for word in words:
+                    print(f"[{word['start']:8.2f}] {word['word']}")
+                if segments is not None:
+                    recent_words.extend(words)
+                    caption_finished_segments(transcriber.horizon)
+            words = transcriber.flush()
+            writer.add(words)
+            if segments is not None:
+                recent_words.extend(words)
+                caption_finished_segments(float("inf"))
+            for render in renders:
+                render.result()
+        finally:
+            overlays.shutdown()
+            transcriber.close()
+            writer.close()
+            self.profiler.save(self.profile_path, self.trace_path)
+
+        print(f"Wrote {writer.count} live captions to: {srt_path}")
+
     def process_video(self):
         """Main processing function"""
         start_time = time.time()
@@ -76,44 +214,54 @@ class EnhancedVideoCaptioner:
 
             # Create text clips
             print("Creating caption clips...")
-            text_clips = []
-            batch_size = 20  # Process words in batches for better memory management
-
-            for i in range(0, len(word_timings), batch_size):
-                batch = word_timings[i:i + batch_size]
-                for word_data in batch:
-                    if word_data['word'].strip():
-                        try:
-                            clip = self.create_text_clip(word_data, video.w, video.h)
-                            text_clips.append(clip)
-                        except Exception as e:
-                            print(f"Warning: Skipped word '{word_data['word']}' due to error: {str(e)}")
-                            continue
-
-                print(f"Processed {min(i + batch_size, len(word_timings))}/{len(word_timings)} words")
-
-            # Combine video and captions
-            print("Creating final video...")
-            final_video = CompositeVideoClip([video] + text_clips)
-
-            # Write output video
-            print("Writing final video...")
-            final_video.write_videofile(
-                self.output_video,
-                codec='libx264',
-                audio_codec='aac',
-                threads=4,
-                fps=video.fps,
-                preset='ultrafast',
-                audio=True,
-                logger=None
-            )
+            with self.profiler.stage("caption_clips"):
+                text_clips = []
+                batch_size = 20  # Process words in batches for better memory management
+
+                for i in range(0, len(word_timings), batch_size):
+                    batch = word_timings[i:i + batch_size]
+                    for word_data in batch:
+                        if word_data['word'].strip():
+                            try:
+                                clip = self.create_text_clip(word_data, video.w, video.h)
+                                text_clips.append(clip)
+                            except Exception as e:
+                                print(f"Warning: Skipped word '{word_data['word']}' due to error: {str(e)}")
+                                continue
+
+                    print(f"Processed {min(i + batch_size, len(word_timings))}/{len(word_timings)} words")
+
+            if self.engine == "ffmpeg":
+                print("Writing final video through ffmpeg...")
+                with self.profiler.stage("encode"):
+                    self.render_with_ffmpeg(text_clips, video.w, video.h)
+                video.close()
+            else:
+                # Combine video and captions
+                print("Creating final video...")
+                final_video = composite_clips(video, text_clips, self.profiler.timed)
+
+                # Write output video
+                print("Writing final video...")
+                with self.profiler.stage("encode"):
+                    final_video.write_videofile(
+                        self.output_video,
+                        codec='libx264',
+                        audio_codec='aac',
+                        threads=4,
+                        fps=video.fps,
+                        preset='ultrafast',
+                        audio=True,
+                        logger=None
+                    )
+
+                video.close()
+                final_video.close()
 
             # Cleanup
-            video.close()
-            final_video.close()
-            for clip in text_clips:
-                clip.close()
+            with self.profiler.stage("cleanup"):
+                for clip in text_clips:
+                    clip.close()
 
             end_time = time.time()
             print(f"Finished processing at: {time.strftime('%H:%M:%S')}")
@@ -123,6 +271,11 @@ class EnhancedVideoCaptioner:
             print(f"Error during processing: {str(e)}")
             raise
 
+        finally:
+            if os.path.exists(self.store_path):
+                os.remove(self.store_path)
+            self.profiler.save(self.profile_path, self.trace_path)
+
 if __name__ == "__main__":
     try:
         captioner = EnhancedVideoCaptioner(
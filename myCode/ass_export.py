@@ -0,0 +1,197 @@
+from typing import List, Dict, Optional, Tuple
+import os
+import subprocess
+from PIL import ImageFont
+
+from sprites import parse_color
+from ffmpeg_pipe import audio_codec_args
+
+# ASS numpad alignment for each caption position
+ALIGNMENTS = {"bottom": 2, "center": 5, "top": 8}
+
+# Style suffixes of ImageMagick font names, as (bold, italic)
+FONT_STYLES = {
+    "Bold": (True, False),
+    "Italic": (False, True),
+    "Oblique": (False, True),
+    "BoldItalic": (True, True),
+    "BoldOblique": (True, True),
+}
+
+
+def ass_color(color: str) -> str:
+    """Convert a color name or rgb() string to ASS &HBBGGRR& notation"""
+    r, g, b = parse_color(color)
+    return f"&H00{b:02X}{g:02X}{r:02X}&"
+
+
+def ass_time(seconds: float) -> str:
+    """Format seconds as H:MM:SS.cc"""
+    centiseconds = int(round(max(seconds, 0) * 100))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    secs, centiseconds = divmod(centiseconds, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+
+
+def resolve_font(font: str) -> Tuple[str, Optional[str]]:
+    """Return the font family name and, for font files, the directory libass should search"""
+    if os.path.isfile(font):
+        family = ImageFont.truetype(font, 10).getname()[0]
+        return family, os.path.dirname(os.path.abspath(font))
+    return font, None
+
+
+def font_style(name: str) -> Tuple[str, bool, bool]:
+    """Split an ImageMagick font name like Arial-Bold into the family libass knows and its style
+
+    Returns (family, bold, italic); ImageMagick writes the spaces of a family as hyphens.
+    """
+    parts = name.split("-")
+    bold = italic = False
+    while len(parts) > 1 and parts[-1] in FONT_STYLES:
+        is_bold, is_italic = FONT_STYLES[parts.pop()]
+        bold, italic = bold or is_bold, italic or is_italic
+    return " ".join(parts), bold, italic
+
+
+def _escape_text(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("{", "(").replace("}", ")")
+
+
+def _karaoke_line(
+    words: List[Dict],
+    group_start: float,
+    color: str,
+    active_color: str,
+    font_size: int,
+    active_size_increase: int,
+    fade: float
+) -> str:
+    """Build one dialogue line with \\k timing and a highlight on each spoken word"""
+    parts = []
+    cursor = group_start
+    normal, active = ass_color(color), ass_color(active_color)
+    fade_ms = max(int(fade * 1000), 1)
+
+    for word in words:
+        # Silent karaoke syllable for any gap before the word
+        gap = int(round((word["start"] - cursor) * 100))
+        if gap > 0:
+            parts.append(f"{{\\k{gap}}}")
+
+        duration = max(int(round((word["end"] - word["start"]) * 100)), 1)
+        on = int((word["start"] - group_start) * 1000)
+        off = int((word["end"] - group_start) * 1000)
+
+        # Reset to the normal look first: override tags carry over to later words
+        tags = f"\\k{duration}\\1c{normal}\\fs{font_size}"
+        tags += f"\\t({on},{on + fade_ms},\\1c{active}"
+        if active_size_increase:
+            tags += f"\\fs{font_size + active_size_increase}"
+        tags += f")\\t({max(off - fade_ms, on)},{off},\\1c{normal}"
+        if active_size_increase:
+            tags += f"\\fs{font_size}"
+        tags += ")"
+
+        parts.append(f"{{{tags}}}{_escape_text(word['word'].strip())} ")
+        cursor = word["end"]
+
+    return "".join(parts).rstrip()
+
+
+def write_ass(
+    transcriptions: List[Dict],
+    output_path: str,
+    video_size: Tuple[int, int],
+    font: str,
+    font_size: int,
+    color: str = "white",
+    active_color: str = "lime",
+    stroke_color: str = "black",
+    stroke_width: int = 4,
+    position: str = "bottom",
+    margin: int = 50,
+    active_size_increase: int = 0,
+    fade: float = 0.0
+) -> Optional[str]:
+    """Export grouped word timings as an ASS karaoke script
+
+    Returns the directory libass should load the font from, if the font is a file.
+    """
+    family, fonts_dir = resolve_font(font)
+    bold = italic = False
+    if fonts_dir is None:
+        family, bold, italic = font_style(family)
+
+    # ImageMagick strokes are centered on the glyph edge, ASS outlines are outside it
+    outline = stroke_width / 2
+
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {video_size[0]}",
+        f"PlayResY: {video_size[1]}",
+        "WrapStyle: 2",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, "
+        "BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, "
+        "BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding",
+        # Primary is the sung color, secondary the not-yet-sung one
+        f"Style: Caption,{family},{font_size},{ass_color(active_color)},{ass_color(color)},"
+        f"{ass_color(stroke_color)},&H00000000&,{-int(bold)},{-int(italic)},0,0,100,100,0,0,1,{outline:g},0,"
+        f"{ALIGNMENTS[position]},10,10,{margin},1",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+
+    for group in transcriptions:
+        text = _karaoke_line(
+            group["words"], group["start_time"], color, active_color,
+            font_size, active_size_increase, fade
+        )
+        lines.append(
+            f"Dialogue: 0,{ass_time(group['start_time'])},{ass_time(group['end_time'])},"
+            f"Caption,,0,0,0,,{text}"
+        )
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+    return fonts_dir
+
+
+def _filter_path(path: str) -> str:
+    """Quote a path for use inside an ffmpeg filter argument"""
+    path = os.path.abspath(path).replace("\\", "/")
+    return "'" + path.replace("'", "'\\''") + "'"
+
+
+def burn_in_ass(
+    input_path: str,
+    output_path: str,
+    ass_path: str,
+    encoder_params: List[str],
+    fonts_dir: Optional[str] = None,
+    size: Optional[Tuple[int, int]] = None
+):
+    """Render the subtitles onto the video in a single ffmpeg pass, copying the audio"""
+    filters = []
+    if size is not None:
+        filters.append(f"scale={size[0]}:{size[1]}")
+    ass_filter = f"ass=filename={_filter_path(ass_path)}"
+    if fonts_dir is not None:
+        ass_filter += f":fontsdir={_filter_path(fonts_dir)}"
+    filters.append(ass_filter)
+
+    command = [
+        'ffmpeg', '-y', '-v', 'error', '-i', input_path,
+        '-vf', ",".join(filters)
+    ] + audio_codec_args(input_path, output_path) + encoder_params + [output_path]
+
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg ass burn-in failed: {result.stderr}")
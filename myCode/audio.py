@@ -0,0 +1,244 @@
+from typing import Callable, Iterator, Optional
+import hashlib
+import os
+import struct
+import subprocess
+import numpy as np
+
+# Whisper's input format: 16 kHz mono
+SAMPLE_RATE = 16000
+
+
+def _decode_command(path: str, sample_rate: int = SAMPLE_RATE):
+    return [
+        'ffmpeg', '-v', 'error', '-nostdin', '-threads', '0',
+        '-i', path,
+        '-vn', '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(sample_rate),
+        '-'
+    ]
+
+
+def has_audio_stream(path: str) -> bool:
+    """Whether the file has any audio stream, via ffprobe without decoding"""
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'a', '-show_entries', 'stream=index',
+         '-of', 'csv=p=0', path],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Error probing {path}: {result.stderr}")
+    return bool(result.stdout.strip())
+
+
+def stream_pcm(path: str, sample_rate: int = SAMPLE_RATE, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+    """Decode the audio track to 16-bit mono PCM through an ffmpeg pipe, chunk by chunk"""
+    process = subprocess.Popen(
+        _decode_command(path, sample_rate), stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    try:
+        while True:
+            chunk = process.stdout.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise RuntimeError(f"Error decoding audio from {path}: {stderr.decode(errors='replace')}")
+
+
+def hash_pcm(chunks) -> str:
+    """Content hash of decoded PCM, independent of container and codec"""
+    digest = hashlib.blake2b(digest_size=20)
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_audio(path: str) -> str:
+    """Hash the audio exactly as Whisper will hear it, without holding it in memory"""
+    return hash_pcm(stream_pcm(path))
+
+
+def load_pcm(path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Decode the whole audio track to 16-bit mono samples in memory, with no temp file"""
+    result = subprocess.run(_decode_command(path, sample_rate), capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Error decoding audio from {path}: {result.stderr.decode(errors='replace')}")
+    return np.frombuffer(result.stdout, dtype=np.int16)
+
+
+def pcm_to_float(pcm: np.ndarray) -> np.ndarray:
+    return pcm.astype(np.float32) / 32768.0
+
+
+def load_audio(path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Mono float32 samples in [-1, 1] at the requested rate"""
+    return pcm_to_float(load_pcm(path, sample_rate))
+
+
+def frame_energy(
+    samples: np.ndarray,
+    sample_rate: int = SAMPLE_RATE,
+    frame_seconds: float = 0.03,
+    block_frames: int = 8192
+) -> np.ndarray:
+    """Mean-square energy of consecutive non-overlapping frames, read in blocks"""
+    frame = max(int(frame_seconds * sample_rate), 1)
+    n_frames = len(samples) // frame
+    energy = np.empty(n_frames, dtype=np.float32)
+    for lo in range(0, n_frames, block_frames):
+        hi = min(lo + block_frames, n_frames)
+        frames = samples[lo * frame:hi * frame].reshape(hi - lo, frame).astype(np.float32)
+        energy[lo:hi] = np.einsum('ij,ij->i', frames, frames) / frame
+    return energy
+
+
+def map_frames(
+    samples: np.ndarray,
+    hop_length: int,
+    func: Callable[[np.ndarray], np.ndarray],
+    block_frames: int = 4096,
+    context_frames: int = 8
+) -> np.ndarray:
+    """Run a centered frame-wise feature (librosa style) over the samples one window at a time
+
+    func maps a window of samples to features along the last axis, with
+    frame k centered on sample k * hop_length. Each window carries
+    context_frames of extra audio on both sides so frames near its edges
+    see the same samples as in a single pass over the whole signal. That
+    makes the result exact only for features local to each frame: anything
+    func normalizes over its input (a dB floor under the loudest bin, a
+    peak normalization) is per window unless its reference is passed in.
+    """
+    n_frames = 1 + len(samples) // hop_length
+    pieces = []
+    for lo in range(0, n_frames, block_frames):
+        hi = min(lo + block_frames, n_frames)
+        first = max(lo - context_frames, 0)
+        window = samples[first * hop_length:min((hi + context_frames) * hop_length, len(samples))]
+        pieces.append(func(window)[..., lo - first:hi - first])
+    return np.concatenate(pieces, axis=-1)
+
+
+def last_voiced_frames(energy: np.ndarray, first: np.ndarray, stop: np.ndarray, ratio: float = 0.3):
+    """For each [first, stop) span of an energy envelope, the last frame above ratio * span mean
+
+    Returns (found, index): spans are rows of one padded matrix, so every
+    span is handled in a single pass.
+    """
+    n_frames = len(energy)
+    lengths = stop - first
+
+    cumulative = np.concatenate([[0.0], np.cumsum(energy, dtype=np.float64)])
+    means = (cumulative[stop] - cumulative[first]) / np.maximum(lengths, 1)
+
+    width = max(int(lengths.max(initial=0)), 1)
+    frames = first[:, None] + np.arange(width)[None, :]
+    inside = frames < stop[:, None]
+    voiced = inside & (energy[np.minimum(frames, n_frames - 1)] > ratio * means[:, None])
+
+    found = voiced.any(axis=1)
+    last = first + width - 1 - np.argmax(voiced[:, ::-1], axis=1)
+    return found, last
+
+
+# A fixed-size .npy header, so the shape can be written once the decode has finished
+NPY_HEADER_SIZE = 128
+
+
+def _npy_header(n_samples: int) -> bytes:
+    header = repr({'descr': '<i2', 'fortran_order': False, 'shape': (n_samples,)})
+    size = NPY_HEADER_SIZE - len(np.lib.format.magic(1, 0)) - 2
+    return np.lib.format.magic(1, 0) + struct.pack('<H', size) + header.ljust(size - 1).encode('latin1') + b'\n'
+
+
+class PcmStore:
+    """16-bit mono PCM in a memory-mapped .npy file, read one window at a time
+
+    Slicing returns float32 samples in [-1, 1] for just that window, so code
+    that walks the audio in blocks (energy envelopes, VAD, librosa features
+    through map_frames) keeps a working set bounded by the block size rather
+    than the recording length. Pages already read stay in the OS page cache,
+    which the kernel reclaims under pressure, not in the process heap.
+    """
+    dtype = np.dtype(np.float32)
+
+    def __init__(self, path: str, sample_rate: int = SAMPLE_RATE):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.pcm = np.load(path, mmap_mode='r')
+
+    @classmethod
+    def decode(cls, media_path: str, store_path: str, sample_rate: int = SAMPLE_RATE) -> "PcmStore":
+        """Stream the decoded audio track straight to store_path, never holding it in memory"""
+        tmp_path = store_path + '.part'
+        n_bytes = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(_npy_header(0))
+                for chunk in stream_pcm(media_path, sample_rate):
+                    f.write(chunk)
+                    n_bytes += len(chunk)
+                f.seek(0)
+                f.write(_npy_header(n_bytes // 2))
+            os.replace(tmp_path, store_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return cls(store_path, sample_rate)
+
+    def __len__(self) -> int:
+        return len(self.pcm)
+
+    def __getitem__(self, key) -> np.ndarray:
+        return pcm_to_float(self.pcm[key])
+
+    def chunks(self, chunk_samples: int = 1 << 20) -> Iterator[memoryview]:
+        for lo in range(0, len(self.pcm), chunk_samples):
+            yield memoryview(np.ascontiguousarray(self.pcm[lo:lo + chunk_samples]))
+
+
+class DecodedAudio:
+    """One decode of a file's audio track, shared by every analysis step and Whisper
+
+    With store_path the PCM goes to a memory-mapped PcmStore instead of
+    memory, and samples is that store: analysis reads it in windows, and
+    only the audio Whisper actually hears is materialized.
+    """
+    def __init__(self, path: str, sample_rate: int = SAMPLE_RATE, store_path: Optional[str] = None):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.has_audio = has_audio_stream(path)
+        self.store = None
+        if not self.has_audio:
+            self.pcm = np.zeros(0, dtype=np.int16)
+        elif store_path is not None:
+            self.store = PcmStore.decode(path, store_path, sample_rate)
+            self.pcm = self.store.pcm
+        else:
+            self.pcm = load_pcm(path, sample_rate)
+        self._samples = None
+        self._digest = None
+
+    @property
+    def samples(self) -> np.ndarray:
+        """Float32 samples in [-1, 1], converted on first use (or the store, read lazily)"""
+        if self.store is not None:
+            return self.store
+        if self._samples is None:
+            self._samples = pcm_to_float(self.pcm)
+        return self._samples
+
+    @property
+    def digest(self) -> str:
+        if self._digest is None:
+            chunks = self.store.chunks() if self.store is not None else [memoryview(self.pcm)]
+            self._digest = hash_pcm(chunks)
+        return self._digest
+
+    @property
+    def duration(self) -> float:
+        return len(self.pcm) / self.sample_rate
@@ -0,0 +1,401 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import Future
+from contextlib import ExitStack, contextmanager
+import threading
+import time
+import numpy as np
+import torch
+from whisper.audio import FRAMES_PER_SECOND, HOP_LENGTH, N_FRAMES, N_SAMPLES, SAMPLE_RATE, log_mel_spectrogram, pad_or_trim
+from whisper.decoding import DecodingOptions, decode
+from whisper.timing import add_word_timestamps
+from whisper.tokenizer import get_tokenizer
+from whisper.utils import get_end
+
+from chunked_transcribe import plan_chunks
+from model_pool import MODEL_POOL, resolve_device
+
+DEFAULT_TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+
+
+class _Job:
+    """One caller's audio: its windows, options and the future its result is routed to"""
+    def __init__(self, n_windows: int, options: Dict, mel: Optional[torch.Tensor] = None):
+        self.options = options
+        self.mel = mel  # The whole padded spectrogram, for windows queued again after a partial decode
+        self.segments: List[Optional[List[Dict]]] = [None] * n_windows
+        self.languages: List[Optional[str]] = [None] * n_windows
+        self.remaining = n_windows
+        self.future: Future = Future()
+
+    def add_window(self) -> int:
+        """Reserve a slot for one more window; returns its index"""
+        self.segments.append(None)
+        self.languages.append(None)
+        self.remaining += 1
+        return len(self.segments) - 1
+
+    def window_done(self, index: int, segments: List[Dict], language: str):
+        self.segments[index] = segments
+        self.languages[index] = language
+        self.remaining -= 1
+        if self.remaining == 0 and not self.future.done():
+            self.future.set_result(self._result())
+
+    def _result(self) -> Dict:
+        # Windows queued again come last in index order, so order by time
+        ordered = sorted((s for window in self.segments for s in window), key=lambda segment: segment["start"])
+        segments = [dict(segment, id=i) for i, segment in enumerate(ordered)]
+        language = self.options["decode"].get("language") or next(
+            (language for language, window in zip(self.languages, self.segments) if window),
+            self.languages[0] if self.languages else None
+        )
+        return {
+            "text": "".join(segment["text"] for segment in segments),
+            "segments": segments,
+            "language": language
+        }
+
+
+class _Window:
+    """A window of at most 30 seconds of one job, decoded as one row of a batch"""
+    def __init__(self, job: _Job, index: int, mel: torch.Tensor, seek: int, num_frames: int):
+        self.job = job
+        self.index = index
+        self.mel = mel
+        self.seek = seek
+        self.num_frames = num_frames
+        self.attempt = 0  # Index into the job's temperature fallback list
+        self.queued = time.monotonic()
+
+    def decoding_options(self) -> DecodingOptions:
+        temperature = self.job.options["temperatures"][self.attempt]
+        kwargs = dict(self.job.options["decode"], prompt=self.job.options["prompt"])
+        # Same rule as whisper.transcribe: beams at t == 0, best-of sampling above
+        if temperature > 0:
+            kwargs.pop("beam_size", None)
+            kwargs.pop("patience", None)
+        else:
+            kwargs.pop("best_of", None)
+        return DecodingOptions(**kwargs, temperature=temperature)
+
+
+class BatchTranscriber:
+    """Share one Whisper model between concurrent jobs and decode their windows in batches
+
+    Each job's audio is cut into windows of at most 30 seconds at its
+    quietest pauses. Windows from every job that decode with the same
+    options are stacked into one encoder/decoder call of up to max_batch
+    rows; a partial batch is sent once its oldest window has waited
+    max_wait seconds. Results, with word timestamps, are routed back to
+    each caller. Windows are decoded independently, so
+    condition_on_previous_text is not supported; initial_prompt is given
+    to every window of its job.
+    """
+    def __init__(
+        self,
+        model_name: str = "base",
+        device: Optional[str] = None,
+        max_batch: int = 8,
+        max_wait: float = 0.05
+    ):
+        self.device = resolve_device(device)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        # Pinned in the pool for as long as the service is open
+        self._stack = ExitStack()
+        self.model = self._stack.enter_context(MODEL_POOL.use(model_name, self.device))
+
+        self._pending: List[_Window] = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def transcribe(self, audio: np.ndarray, **options) -> Dict:
+        """Drop-in for model.transcribe on a float32 16 kHz array; blocks until the job is done"""
+        return self.submit(audio, **options).result()
+
+    def submit(self, audio: np.ndarray, **options) -> Future:
+        """Queue a job and return a future for its transcription result"""
+        job_options = self._job_options(options)
+        windows = [
+            (start, end)
+            for start, end in plan_chunks(audio, SAMPLE_RATE, max_seconds=N_SAMPLES / SAMPLE_RATE, search_seconds=5.0)
+            if end > start
+        ]
+        if not windows:
+            job = _Job(0, job_options)
+            job.future.set_result(job._result())
+            return job.future
+
+        # The mel spectrogram is computed here, on the caller's thread, in parallel with decoding
+        mel = log_mel_spectrogram(audio, self.model.dims.n_mels, padding=N_SAMPLES)
+        job = _Job(len(windows), job_options, mel)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("BatchTranscriber is closed")
+            for index, (start, end) in enumerate(windows):
+                seek = start // HOP_LENGTH
+                num_frames = min(-(-(end - start) // HOP_LENGTH), N_FRAMES)
+                segment = pad_or_trim(mel[:, seek:seek + num_frames], N_FRAMES)
+                self._pending.append(_Window(job, index, segment, seek, num_frames))
+            self._condition.notify()
+        return job.future
+
+    def close(self):
+        """Finish the queued windows, then release the model"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._worker.join()
+        self._stack.close()
+
+    def _job_options(self, options: Dict) -> Dict:
+        options = dict(options)
+        options.pop("verbose", None)
+        options.pop("condition_on_previous_text", None)
+        temperatures = options.pop("temperature", DEFAULT_TEMPERATURES)
+        if isinstance(temperatures, (int, float)):
+            temperatures = (temperatures,)
+        initial_prompt = options.pop("initial_prompt", None)
+
+        job_options = {
+            "temperatures": tuple(temperatures),
+            "compression_ratio_threshold": options.pop("compression_ratio_threshold", 2.4),
+            "logprob_threshold": options.pop("logprob_threshold", -1.0),
+            "no_speech_threshold": options.pop("no_speech_threshold", 0.6),
+            "word_timestamps": options.pop("word_timestamps", False),
+            "prepend_punctuations": options.pop("prepend_punctuations", "\"'“¿([{-"),
+            "append_punctuations": options.pop("append_punctuations", "\"'.。,，!！?？:：”)]}、"),
+        }
+        # Half precision only helps (and only works) on the GPU
+        options.setdefault("fp16", self.device.startswith("cuda"))
+        if options.get("language") is None and not self.model.is_multilingual:
+            options["language"] = "en"
+        job_options["decode"] = options
+
+        prompt = []
+        if initial_prompt:
+            tokenizer = get_tokenizer(
+                self.model.is_multilingual, num_languages=self.model.num_languages,
+                task=options.get("task", "transcribe")
+            )
+            prompt = tokenizer.encode(" " + initial_prompt.strip())
+        job_options["prompt"] = prompt
+        return job_options
+
+    def _next_batch(self) -> Optional[List[_Window]]:
+        """Wait for a full batch, or for the oldest window's max_wait, and take it off the queue"""
+        with self._condition:
+            while True:
+                if not self._pending:
+                    if self._closed:
+                        return None
+                    self._condition.wait()
+                    continue
+
+                # The oldest window decides which options are decoded next
+                key = repr(self._pending[0].decoding_options())
+                batch = [w for w in self._pending if repr(w.decoding_options()) == key][:self.max_batch]
+                waited = time.monotonic() - self._pending[0].queued
+                if len(batch) < self.max_batch and waited < self.max_wait and not self._closed:
+                    self._condition.wait(self.max_wait - waited)
+                    continue
+
+                taken = set(map(id, batch))
+                self._pending = [w for w in self._pending if id(w) not in taken]
+                return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._decode_batch(batch)
+            except Exception as e:
+                for window in batch:
+                    if not window.job.future.done():
+                        window.job.future.set_exception(e)
+
+    def _decode_batch(self, batch: List[_Window]):
+        options = batch[0].decoding_options()
+        dtype = torch.float16 if options.fp16 else torch.float32
+        mel = torch.stack([window.mel for window in batch]).to(self.model.device).to(dtype)
+        results = decode(self.model, mel, options)
+
+        retry = []
+        for window, segment_mel, result in zip(batch, mel, results):
+            if window.job.future.done():
+                continue  # An earlier batch of this job failed
+            job_options = window.job.options
+            if self._needs_fallback(result, job_options) and window.attempt + 1 < len(job_options["temperatures"]):
+                # A higher temperature is another set of options, so it joins another batch
+                window.attempt += 1
+                window.queued = time.monotonic()
+                retry.append(window)
+                continue
+            segments, resume = self._segments(window, segment_mel, result)
+            if resume is not None:
+                # Like whisper.transcribe: the unfinished tail is decoded again from its last timestamp
+                end = window.seek + window.num_frames
+                mel_segment = pad_or_trim(window.job.mel[:, resume:end], N_FRAMES)
+                retry.append(_Window(window.job, window.job.add_window(), mel_segment, resume, end - resume))
+            window.job.window_done(window.index, segments, result.language)
+
+        if retry:
+            with self._condition:
+                self._pending.extend(retry)
+                self._condition.notify()
+
+    @staticmethod
+    def _needs_fallback(result, job_options: Dict) -> bool:
+        """whisper.transcribe's retry rule: too repetitive or too improbable, unless it is silence"""
+        compression_ratio_threshold = job_options["compression_ratio_threshold"]
+        logprob_threshold = job_options["logprob_threshold"]
+        no_speech_threshold = job_options["no_speech_threshold"]
+        if logprob_threshold is not None and no_speech_threshold is not None and (
+            result.no_speech_prob > no_speech_threshold and result.avg_logprob < logprob_threshold
+        ):
+            return False
+        return (
+            (compression_ratio_threshold is not None and result.compression_ratio > compression_ratio_threshold)
+            or (logprob_threshold is not None and result.avg_logprob < logprob_threshold)
+        )
+
+    def _segments(self, window: _Window, mel: torch.Tensor, result) -> Tuple[List[Dict], Optional[int]]:
+        """Split one window's tokens into segments at timestamp pairs, like whisper.transcribe
+
+        Also returns the mel frame to decode again from when the tokens end
+        in an unfinished segment, or None when the window is done.
+        """
+        job_options = window.job.options
+        no_speech_threshold = job_options["no_speech_threshold"]
+        logprob_threshold = job_options["logprob_threshold"]
+        if no_speech_threshold is not None and result.no_speech_prob > no_speech_threshold and not (
+            logprob_threshold is not None and result.avg_logprob > logprob_threshold
+        ):
+            return [], None
+
+        tokenizer = get_tokenizer(
+            self.model.is_multilingual, num_languages=self.model.num_languages,
+            language=result.language, task=job_options["decode"].get("task", "transcribe")
+        )
+        time_offset = window.seek * HOP_LENGTH / SAMPLE_RATE
+        input_stride = N_FRAMES // self.model.dims.n_audio_ctx
+        time_precision = input_stride * HOP_LENGTH / SAMPLE_RATE
+
+        def new_segment(start: float, end: float, tokens: List[int]) -> Dict:
+            return {
+                "seek": window.seek,
+                "start": start,
+                "end": end,
+                "text": tokenizer.decode([token for token in tokens if token < tokenizer.eot]),
+                "tokens": tokens,
+                "temperature": result.temperature,
+                "avg_logprob": result.avg_logprob,
+                "compression_ratio": result.compression_ratio,
+                "no_speech_prob": result.no_speech_prob,
+            }
+
+        tokens = list(result.tokens)
+        is_timestamp = [token >= tokenizer.timestamp_begin for token in tokens]
+        slices = [i for i in range(1, len(tokens)) if is_timestamp[i - 1] and is_timestamp[i]]
+
+        single_timestamp_ending = is_timestamp[-2:] == [False, True]
+        resume = None
+        segments = []
+        if slices:
+            if single_timestamp_ending:
+                slices.append(len(tokens))
+            last_slice = 0
+            for current_slice in slices:
+                sliced = tokens[last_slice:current_slice]
+                segments.append(new_segment(
+                    time_offset + (sliced[0] - tokenizer.timestamp_begin) * time_precision,
+                    time_offset + (sliced[-1] - tokenizer.timestamp_begin) * time_precision,
+                    sliced
+                ))
+                last_slice = current_slice
+            if not single_timestamp_ending:
+                # The segment after the last pair is unfinished: it is dropped and decoded again
+                resume = window.seek + (tokens[last_slice - 1] - tokenizer.timestamp_begin) * input_stride
+                if resume <= window.seek:
+                    # Decoding again from the same frame would loop: keep the tail up to the window end
+                    segments.append(new_segment(
+                        time_offset, time_offset + window.num_frames * HOP_LENGTH / SAMPLE_RATE, tokens[last_slice:]
+                    ))
+        else:
+            duration = window.num_frames * HOP_LENGTH / SAMPLE_RATE
+            timestamps = [token for token, stamp in zip(tokens, is_timestamp) if stamp]
+            if timestamps and timestamps[-1] != tokenizer.timestamp_begin:
+                duration = (timestamps[-1] - tokenizer.timestamp_begin) * time_precision
+            segments.append(new_segment(time_offset, time_offset + duration, tokens))
+
+        if job_options["word_timestamps"]:
+            add_word_timestamps(
+                segments=segments,
+                model=self.model,
+                tokenizer=tokenizer,
+                mel=mel,
+                num_frames=window.num_frames,
+                prepend_punctuations=job_options["prepend_punctuations"],
+                append_punctuations=job_options["append_punctuations"],
+                last_speech_timestamp=time_offset
+            )
+            last_word_end = get_end(segments)
+            if not single_timestamp_ending and last_word_end is not None and last_word_end > time_offset:
+                resume = round(last_word_end * FRAMES_PER_SECOND)
+
+        if resume is not None and not window.seek < resume < window.seek + window.num_frames:
+            resume = None
+
+        # Instantaneous or empty segments are cleared, as whisper.transcribe does
+        for segment in segments:
+            if segment["start"] == segment["end"] or not segment["text"].strip():
+                segment.update(text="", tokens=[], words=[])
+        return segments, resume
+
+
+_BATCH_TRANSCRIBERS: Dict[Tuple[str, str], BatchTranscriber] = {}
+_BATCH_USERS: Dict[Tuple[str, str], int] = {}
+_BATCH_LOCK = threading.Lock()
+
+
+@contextmanager
+def batch_transcriber(model_name: str, device: Optional[str] = None) -> Iterator[BatchTranscriber]:
+    """The process-wide service for a model, so every concurrent job shares its batches
+
+    The service is closed, and its model unpinned, when its last user leaves.
+    """
+    key = (model_name, resolve_device(device))
+    with _BATCH_LOCK:
+        if key not in _BATCH_TRANSCRIBERS:
+            _BATCH_TRANSCRIBERS[key] = BatchTranscriber(model_name, key[1])
+            _BATCH_USERS[key] = 0
+        transcriber = _BATCH_TRANSCRIBERS[key]
+        _BATCH_USERS[key] += 1
+    try:
+        yield transcriber
+    finally:
+        with _BATCH_LOCK:
+            _BATCH_USERS[key] -= 1
+            last = _BATCH_USERS[key] == 0
+            if last:
+                del _BATCH_TRANSCRIBERS[key], _BATCH_USERS[key]
+        if last:
+            transcriber.close()
+
+
+@contextmanager
+def whisper_transcriber(model_name: str, device: Optional[str] = None, batched: bool = False) -> Iterator:
+    """Whatever transcribes for a call site: the shared BatchTranscriber, or the pooled model itself
+
+    Both have model.transcribe's signature, and both stay pinned for the block.
+    """
+    if batched:
+        with batch_transcriber(model_name, device) as transcriber:
+            yield transcriber
+    else:
+        with MODEL_POOL.use(model_name, device) as model:
+            yield model
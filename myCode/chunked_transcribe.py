@@ -0,0 +1,223 @@
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import partial
+from multiprocessing import cpu_count, get_context
+import re
+import numpy as np
+import torch
+
+from audio import SAMPLE_RATE, frame_energy
+from model_pool import load_model, preload_models, resolve_device
+
+
+def plan_chunks(
+    samples: np.ndarray,
+    sample_rate: int = SAMPLE_RATE,
+    max_seconds: float = 300.0,
+    search_seconds: float = 30.0,
+    frame_seconds: float = 0.03
+) -> List[Tuple[int, int]]:
+    """Split into (start, end) sample windows of at most max_seconds, cut in the quietest pause
+
+    Each cut is placed at the lowest smoothed energy within the last
+    search_seconds before the limit, so words are rarely split.
+    """
+    frame = max(int(frame_seconds * sample_rate), 1)
+    if max_seconds * sample_rate < 2 * frame:
+        raise ValueError(f"max_seconds must be at least {2 * frame / sample_rate:g}s, got {max_seconds:g}")
+    energy = frame_energy(samples, sample_rate, frame_seconds)
+    # Smooth over ~300ms so a stop consonant does not look like a pause
+    width = max(int(0.3 / frame_seconds), 1)
+    energy = np.convolve(energy, np.ones(width) / width, mode='same')
+
+    max_length = int(max_seconds * sample_rate)
+    search = min(int(search_seconds * sample_rate), max_length - frame)
+    cuts = [0]
+    while len(samples) - cuts[-1] > max_length:
+        lo = (cuts[-1] + max_length - search) // frame
+        hi = (cuts[-1] + max_length) // frame
+        if hi <= lo or lo * frame <= cuts[-1]:
+            # No frame to search in a window this short: cut at the limit
+            cuts.append(cuts[-1] + max_length)
+            continue
+        quietest = lo + int(np.argmin(energy[lo:hi]))
+        cuts.append(quietest * frame + frame // 2)
+    cuts.append(len(samples))
+    return list(zip(cuts, cuts[1:]))
+
+
+def _init_worker(model_name: str, device: str, threads: int):
+    torch.set_num_threads(threads)
+    preload_models([model_name], device)
+
+
+def _transcribe_window(job: Dict, transcriber: Optional[Any] = None) -> List[Dict]:
+    """Transcribe one padded window and keep the words that start inside its own span"""
+    model = transcriber if transcriber is not None else load_model(job["model_name"], job["device"])
+    result = model.transcribe(job["samples"], **job["options"])
+
+    offset = job["offset"]
+    keep_start, keep_end = job["keep"]
+    segments = []
+    for segment in result["segments"]:
+        words = [
+            dict(word, start=word["start"] + offset, end=word["end"] + offset)
+            for word in segment.get("words", [])
+            if keep_start <= word["start"] + offset < keep_end
+        ]
+        if not words:
+            continue
+        segments.append(dict(
+            segment,
+            start=words[0]["start"],
+            end=words[-1]["end"],
+            text="".join(word["word"] for word in words),
+            words=words
+        ))
+    return segments
+
+
+def _window_jobs(
+    samples: np.ndarray,
+    windows: List[Tuple[int, int]],
+    pad: int,
+    sample_rate: int,
+    **job
+) -> Iterator[Dict]:
+    """One job per window, its padded samples sliced only when the job is drawn"""
+    for start, end in windows:
+        padded_start = max(start - pad, 0)
+        yield dict(
+            job,
+            samples=samples[padded_start:min(end + pad, len(samples))],
+            offset=padded_start / sample_rate,
+            keep=(start / sample_rate, end / sample_rate if end < len(samples) else float("inf"))
+        )
+
+
+def _map_bounded(pool: Executor, func: Callable, jobs: Iterator, limit: int) -> List:
+    """Like pool.map, but submits lazily so at most limit jobs (and their samples) are in flight"""
+    results = {}
+    pending = {}
+    for index, job in enumerate(jobs):
+        if len(pending) >= limit:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+        pending[pool.submit(func, job)] = index
+    for future, index in pending.items():
+        results[index] = future.result()
+    return [results[index] for index in range(len(results))]
+
+
+def _normalize(word: str) -> str:
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def _seam_tail(merged: List[Dict], seam: float, tolerance: float) -> List[Dict]:
+    """Already merged words close enough to the seam to be transcribed again after it"""
+    tail = []
+    for segment in reversed(merged):
+        if segment["end"] < seam - tolerance:
+            break
+        tail.extend(segment["words"])
+    return tail
+
+
+def merge_segments(chunks: List[List[Dict]], tolerance: float = 0.3) -> List[Dict]:
+    """Concatenate chunk results, dropping words repeated on both sides of a seam
+
+    A word after the seam is a repeat when a word with the same text
+    starts within tolerance seconds of it before the seam, so several
+    repeated words (not only the first) are removed.
+    """
+    merged: List[Dict] = []
+    for segments in chunks:
+        if merged and segments:
+            tail = _seam_tail(merged, segments[0]["start"], tolerance)
+            deduped = []
+            for segment in segments:
+                words = [
+                    word for word in segment["words"]
+                    if not any(
+                        _normalize(word["word"]) == _normalize(seen["word"])
+                        and abs(word["start"] - seen["start"]) < tolerance
+                        for seen in tail
+                    )
+                ]
+                if len(words) == len(segment["words"]):
+                    deduped.append(segment)
+                elif words:
+                    deduped.append(dict(
+                        segment,
+                        start=words[0]["start"],
+                        text="".join(word["word"] for word in words),
+                        words=words
+                    ))
+            segments = deduped
+        merged.extend(segments)
+    return merged
+
+
+def transcribe_chunked(
+    samples: np.ndarray,
+    model_name: str,
+    device: Optional[str] = None,
+    workers: Optional[int] = None,
+    max_seconds: float = 300.0,
+    overlap_seconds: float = 1.0,
+    sample_rate: int = SAMPLE_RATE,
+    transcriber: Optional[Any] = None,
+    **options
+) -> Dict:
+    """Transcribe long audio as silence-bounded windows in a process pool
+
+    Windows are padded by overlap_seconds on both sides so seam words get
+    full context; each word is then kept only by the window its start
+    falls in, with offsets restored to the original timeline. Windows are
+    sliced and sent to the pool a couple per worker at a time, so a
+    memory-mapped store is never copied whole. With a transcriber (such as
+    a BatchTranscriber), windows are instead sent to it from worker threads
+    in this process.
+    """
+    device = resolve_device(device)
+    options = dict(options, word_timestamps=True)
+    windows = plan_chunks(samples, sample_rate, max_seconds)
+    pad = int(overlap_seconds * sample_rate)
+
+    jobs = _window_jobs(
+        samples, windows, pad, sample_rate,
+        model_name=model_name, device=device, options=options
+    )
+
+    if len(windows) == 1:
+        chunks = [_transcribe_window(next(jobs), transcriber)]
+    elif transcriber is not None:
+        # The transcriber holds the model; threads only keep its queue full
+        workers = min(workers or 8, len(windows))
+        print(f"Transcribing {len(windows)} chunks through {workers} threads...")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            chunks = _map_bounded(pool, partial(_transcribe_window, transcriber=transcriber), jobs, 2 * workers)
+    else:
+        if workers is None:
+            # One GPU is shared, so only CPU runs fan out across cores
+            workers = 1 if device.startswith("cuda") else max(cpu_count() - 1, 1)
+        workers = min(workers, len(windows))
+        threads = max(cpu_count() // workers, 1)
+
+        print(f"Transcribing {len(windows)} chunks with {workers} workers...")
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, device, threads)
+        ) as pool:
+            # One queued job per worker keeps them busy while the rest stay unsliced
+            chunks = _map_bounded(pool, _transcribe_window, jobs, 2 * workers)
+
+    segments = merge_segments(chunks)
+    return {
+        "text": "".join(segment["text"] for segment in segments),
+        "segments": segments,
+        "language": options.get("language")
+    }
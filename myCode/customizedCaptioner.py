@@ -1,9 +1,8 @@
-from typing import List, Dict, Literal
+from typing import List, Dict, Literal, Tuple, Callable, Hashable
 from moviepy.editor import (
     VideoFileClip, TextClip, CompositeVideoClip,
     ColorClip, VideoClip, concatenate_videoclips
 )
-import whisper
 import os
 from multiprocessing import cpu_count
 import time
@@ -11,6 +10,37 @@ from pathlib import Path
 from tqdm import tqdm
 import numpy as np
 
+from sprites import textclip_to_rgba, blit, hstack_sprites
+from compositor import (
+    PremultipliedSprite, Placement, IntervalIndex, burn_in, composite_frame
+)
+from ffmpeg_pipe import (
+    ENGINES, check_engine, probe_video, render_video,
+    FrameReader, FrameWriter, split_at_keyframes, concat_segments
+)
+from ass_export import write_ass, burn_in_ass
+from overlay_track import merge_spans, render_overlay_track, overlay_onto
+from profiling import Profiler
+from transcription import transcribe
+import shutil
+import tempfile
+import copy
+from concurrent.futures import ProcessPoolExecutor
+
+# x264 settings shared by the moviepy and ffmpeg render engines
+ENCODER_PARAMS = [
+    '-crf', '20',
+    '-tune', 'fastdecode',
+    '-movflags', '+faststart',
+    '-bf', '2',
+    '-g', '30',
+    '-profile:v', 'high',
+    '-level', '4.1',
+    '-bufsize', '20000k',
+    '-maxrate', '25000k',
+    '-pix_fmt', 'yuv420p'
+]
+
 class FontManager:
     def __init__(self):
         self.custom_fonts = {}
@@ -84,54 +114,95 @@ class Word:
         self.start = start
         self.end = end
 
+class WordSprite:
+    """A word rasterized once in its normal and active states"""
+    def __init__(self, word: Word, style: CaptionStyle):
+        self.word = word
+        self.normal = self._rasterize(word.text, style.font_size, style.color, style)
+        self.active = self._rasterize(
+            word.text,
+            style.font_size + style.active_size_increase,
+            style.active_color,
+            style
+        )
+
+    @staticmethod
+    def _rasterize(text: str, font_size: int, color: str, style: CaptionStyle) -> np.ndarray:
+        """Render one word state to an RGBA array"""
+        clip = TextClip(
+            txt=text + " ",
+            fontsize=font_size,
+            font=FONT_MANAGER.get_font_path(style.font),
+            color=color,
+            stroke_color=style.stroke_color,
+            stroke_width=style.stroke_width,
+            method='caption'
+        )
+        return textclip_to_rgba(clip)
+
 class CaptionGroup:
     def __init__(self, words: List[Dict], style: CaptionStyle):
         self.words = [Word(w["word"].strip(), w["start"], w["end"]) for w in words]
         self.start_time = words[0]["start"]
         self.end_time = words[-1]["end"]
         self.style = style
+        self._sprites = None
+        self._height = 0
+        self._strips = {}  # RGBA strip per combination of active words
+        self._overlays = {}  # Premultiplied sprite per combination of active words
+
+    def _get_sprites(self) -> List[WordSprite]:
+        """Rasterize every word state on first use"""
+        if self._sprites is None:
+            self._sprites = [WordSprite(word, self.style) for word in self.words]
+            self._height = max(
+                max(s.normal.shape[0], s.active.shape[0]) for s in self._sprites
+            )
+        return self._sprites
+
+    def active_state(self, t: float) -> Tuple[bool, ...]:
+        """Which words are active at absolute time t"""
+        return tuple(word.start <= t <= word.end for word in self.words)
+
+    def render_state(self, state: Tuple[bool, ...], width: int) -> np.ndarray:
+        """RGBA band of the given width with the words laid out for one active state"""
+        key = (state, width)
+        if key not in self._strips:
+            sprites = [
+                s.active if is_active else s.normal
+                for s, is_active in zip(self._get_sprites(), state)
+            ]
+            strip = hstack_sprites(sprites, self._height)
 
-    def create_clip(self, video_size: tuple) -> VideoClip:
-        """Create a text clip with animated words"""
-        def make_frame(t):
-            word_clips = []
-            x_offset = 0
-
-            for word in self.words:
-                # Determine if word is active
-                is_active = word.start <= t <= word.end
-
-                # Create text clip for word with appropriate styling
-                font_size = (self.style.font_size + self.style.active_size_increase
-                           if is_active else self.style.font_size)
-                color = self.style.active_color if is_active else self.style.color
-                font_weight = 'bold' if is_active else 'normal'
-
-                word_clip = TextClip(
-                    txt=word.text + " ",
-                    fontsize=font_size,
-                    font=FONT_MANAGER.get_font_path(self.style.font),
-                    color=color,
-                    stroke_color=self.style.stroke_color,
-                    stroke_width=self.style.stroke_width,
-                    method='caption'
-                )
+            # Center the words inside the band
+            band = np.zeros((self._height, width, 4), dtype=np.uint8)
+            blit(band, strip, (width - strip.shape[1]) // 2, 0)
+            self._strips[key] = band
+        return self._strips[key]
 
-                # Position word clip
-                word_clip = word_clip.set_position((x_offset, 0))
-                word_clips.append(word_clip)
-                x_offset += word_clip.w
+    def placement(self, t: float, video_size: tuple) -> Placement:
+        """Premultiplied caption sprite and its position at absolute time t"""
+        state = self.active_state(t)
+        if state not in self._overlays:
+            self._overlays[state] = PremultipliedSprite(self.render_state(state, video_size[0]))
 
-            # Create background for the group
-            bg = ColorClip((video_size[0], max(clip.h for clip in word_clips)),
-                         color=(0,0,0,0))
+        y_pos = (video_size[1] - self._height - self.style.margin
+                if self.style.position == "bottom"
+                else self.style.margin)
+        return self._overlays[state], 0, y_pos
+
+    def create_clip(self, video_size: tuple) -> VideoClip:
+        """Create a text clip with animated words"""
+        self._get_sprites()
 
-            # Compose all word clips
-            comp = CompositeVideoClip([bg] + word_clips)
-            return comp.get_frame(0)
+        def band_at(t):
+            # Clip time is relative to the group start
+            return self.render_state(self.active_state(self.start_time + t), video_size[0])
 
         duration = self.end_time - self.start_time
-        clip = VideoClip(make_frame, duration=duration)
+        clip = VideoClip(lambda t: band_at(t)[:, :, :3], duration=duration)
+        mask = VideoClip(lambda t: band_at(t)[:, :, 3] / 255.0, ismask=True, duration=duration)
+        clip = clip.set_mask(mask)
 
         # Position the entire caption group
         x_pos = (video_size[0] - clip.w) // 2
@@ -141,13 +212,43 @@ class CaptionGroup:
 
         return clip.set_position((x_pos, y_pos))
 
+def _render_segment(job: Dict) -> str:
+    """Render one time shard in a worker process, with its own caption state"""
+    start, end = job["start"], job["end"]
+    video_size, fps = job["video_size"], job["fps"]
+
+    caption_groups = [CaptionGroup(t["words"], job["style"]) for t in job["transcriptions"]]
+    group_index = IntervalIndex(
+        caption_groups,
+        start=lambda g: g.start_time,
+        end=lambda g: g.end_time
+    )
+
+    reader = FrameReader(job["input_path"], video_size, start=start, duration=end - start)
+    writer = FrameWriter(job["segment_path"], video_size, fps, job["encoder_params"])
+    try:
+        for index, frame in enumerate(reader):
+            t = start + index / fps
+            placements = [g.placement(t, video_size) for g in group_index.active(t)]
+            writer.write(composite_frame(frame, placements))
+    finally:
+        reader.close()
+        writer.close()
+
+    return job["segment_path"]
+
 class VideoProcessor:
     def __init__(
         self,
         input_path: str,
         output_path: str,
         caption_style: CaptionStyle = None,
-        resize_to_1080p: bool = False
+        resize_to_1080p: bool = False,
+        engine: str = "moviepy",
+        parallel: bool = False,
+        profile_path: str = None,
+        trace_path: str = None,
+        draft_model: str = None
     ):
         if not os.path.exists(input_path):
             raise FileNotFoundError(f"Input video not found: {input_path}")
@@ -167,6 +268,21 @@ class VideoProcessor:
         self.max_words = 5
         self.caption_style = caption_style or CaptionStyle()
         self.n_cores = max(cpu_count() - 1, 1)
+        self.engine = check_engine(engine, ENGINES + ("ass", "overlay"))
+        # Render keyframe-aligned time shards in a process pool; shards go through ffmpeg pipes
+        if parallel and self.engine != "ffmpeg":
+            raise ValueError(f"parallel rendering requires engine='ffmpeg', got {self.engine!r}")
+        self.parallel = parallel
+
+        # Stage timings are written as a JSON report and/or a Chrome trace when requested
+        self.profile_path = profile_path
+        self.trace_path = trace_path
+        self.profiler = Profiler(
+            "customizedCaptioner",
+            enabled=profile_path is not None or trace_path is not None
+        )
+        # Opt-in tiered mode: a smaller model drafts and only its unsure segments go to "small"
+        self.draft_model = draft_model
 
     def process(self):
         """Main processing pipeline"""
@@ -177,60 +293,47 @@ class VideoProcessor:
                 print("No transcriptions were generated. Check if the video has audio.")
                 return
 
-            # Load the original video once
-            original_video = VideoFileClip(self.input_path)
-            if self.video_size != self.original_size:
-                original_video = original_video.resize(self.video_size)
+            if self.engine == "ass":
+                print("\nBurning in ASS karaoke captions...")
+                self._render_ass(transcriptions)
+                print("\nProcessing complete! Output saved to:", self.output_path)
+                return
+
+            if self.parallel:
+                print("\nRendering time shards in parallel...")
+                self._render_parallel(transcriptions)
+                print("\nProcessing complete! Output saved to:", self.output_path)
+                return
 
             # Create caption clips
-            caption_groups = [
-                CaptionGroup(t["words"], self.caption_style)
-                for t in transcriptions
-            ]
-
-            # Create caption overlay clips with proper timing
-            caption_clips = []
-            for group in caption_groups:
-                clip = group.create_clip(self.video_size)
-                clip = clip.set_start(group.start_time).set_end(group.end_time)
-                caption_clips.append(clip)
-
-            # Combine original video with captions
-            final_video = CompositeVideoClip(
-                [original_video] + caption_clips,
-                size=self.video_size
+            with self.profiler.stage("caption_clips"):
+                caption_groups = [
+                    CaptionGroup(t["words"], self.caption_style)
+                    for t in transcriptions
+                ]
+
+            # Blend only the active caption's bounding box onto each frame
+            group_index = IntervalIndex(
+                caption_groups,
+                start=lambda g: g.start_time,
+                end=lambda g: g.end_time
             )
+            placements_at = self.profiler.timed("caption_render", lambda t: [
+                g.placement(t, self.video_size) for g in group_index.active(t)
+            ])
 
             # Write final video
             print("\nRendering final video...")
-            with ProgressBar(desc="Rendering video") as progress:
-                final_video.write_videofile(
-                    self.output_path,
-                    codec='libx264',
-                    audio_codec='aac',
-                    temp_audiofile='temp_audio_final.m4a',
-                    remove_temp=True,
-                    fps=original_video.fps,
-                    threads=self.n_cores,
-                    preset='veryfast',
-                    ffmpeg_params=[
-                        '-crf', '20',
-                        '-tune', 'fastdecode',
-                        '-movflags', '+faststart',
-                        '-bf', '2',
-                        '-g', '30',
-                        '-profile:v', 'high',
-                        '-level', '4.1',
-                        '-bufsize', '20000k',
-                        '-maxrate', '25000k',
-                        '-pix_fmt', 'yuv420p'
-                    ],
-                    logger=progress,
-                    verbose=False
+            if self.engine == "ffmpeg":
+                self._render_ffmpeg(placements_at)
+            elif self.engine == "overlay":
+                self._render_overlay(
+                    caption_groups,
+                    placements_at,
+                    lambda t: tuple((id(g), g.active_state(t)) for g in group_index.active(t))
                 )
-
-            original_video.close()
-            final_video.close()
+            else:
+                self._render_moviepy(placements_at)
             print("\nProcessing complete! Output saved to:", self.output_path)
 
         except Exception as e:
@@ -238,30 +341,193 @@ class VideoProcessor:
             import traceback
             traceback.print_exc()
 
-    def _transcribe_video(self) -> List[Dict]:
-        """Extract audio and transcribe with word-level timing"""
-        print("\nLoading Whisper model...")
-        model = whisper.load_model("small")
-
-        print("Extracting audio...")
-        audio_path = "temp_audio.wav"
-        video = VideoFileClip(self.input_path)
-
-        with ProgressBar(desc="Extracting audio") as progress:
-            video.audio.write_audiofile(
-                audio_path,
-                fps=16000,
+        finally:
+            self.profiler.save(self.profile_path, self.trace_path)
+
+    def _render_moviepy(self, placements_at: Callable[[float], List[Placement]]):
+        """Render through moviepy's frame loop"""
+        # Load the original video once
+        original_video = VideoFileClip(self.input_path)
+        if self.video_size != self.original_size:
+            original_video = original_video.resize(self.video_size)
+
+        final_video = burn_in(
+            original_video, placements_at,
+            composite=self.profiler.timed("composite", composite_frame)
+        )
+        with ProgressBar(desc="Rendering video") as progress, self.profiler.stage("encode"):
+            final_video.write_videofile(
+                self.output_path,
+                codec='libx264',
+                audio_codec='aac',
+                temp_audiofile=os.path.splitext(self.output_path)[0] + '_temp_audio.m4a',  # Unique per job
+                remove_temp=True,
+                fps=original_video.fps,
+                threads=self.n_cores,
+                preset='veryfast',
+                ffmpeg_params=ENCODER_PARAMS,
                 logger=progress,
                 verbose=False
             )
 
+        with self.profiler.stage("cleanup"):
+            original_video.close()
+            final_video.close()
+
+    def _render_ffmpeg(self, placements_at: Callable[[float], List[Placement]]):
+        """Render through ffmpeg decode/encode pipes, copying the audio stream"""
+        info = probe_video(self.input_path)
+        total_frames = int(info['duration'] * info['fps'])
+
+        composite = self.profiler.timed("composite", composite_frame)
+
+        with ProgressBar(total=total_frames, desc="Rendering video") as progress, self.profiler.stage("encode"):
+            render_video(
+                self.input_path,
+                self.output_path,
+                lambda frame, t: composite(frame, placements_at(t)),
+                encoder_params=[
+                    '-c:v', 'libx264',
+                    '-preset', 'veryfast',
+                    '-threads', str(self.n_cores)
+                ] + ENCODER_PARAMS,
+                size=self.video_size,
+                progress=lambda index: progress(t=index)
+            )
+
+    def _render_overlay(
+        self,
+        caption_groups: List[CaptionGroup],
+        placements_at: Callable[[float], List[Placement]],
+        state_at: Callable[[float], Hashable]
+    ):
+        """Encode only the caption layer, then overlay it with one native ffmpeg pass"""
+        info = probe_video(self.input_path)
+        spans = merge_spans(
+            [(g.start_time, g.end_time) for g in caption_groups],
+            info['duration']
+        )
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            with self.profiler.stage("overlay_track"):
+                track = render_overlay_track(placements_at, spans, info['fps'], work_dir, state_at=state_at)
+            if track is None:
+                shutil.copyfile(self.input_path, self.output_path)
+                return
+
+            list_path, origin = track
+            with self.profiler.stage("encode"):
+                overlay_onto(
+                    self.input_path,
+                    self.output_path,
+                    list_path,
+                    origin,
+                    encoder_params=[
+                        '-c:v', 'libx264',
+                        '-preset', 'veryfast',
+                        '-threads', str(self.n_cores)
+                    ] + ENCODER_PARAMS,
+                    size=self.video_size if self.video_size != self.original_size else None
+                )
+
+    def _render_parallel(self, transcriptions: List[Dict]):
+        """Render time shards in worker processes, then join them with a stream copy"""
+        info = probe_video(self.input_path)
+        segments = split_at_keyframes(self.input_path, info['duration'], self.n_cores)
+
+        # Workers may not share this process's font registry, so pass a resolved path
+        style = copy.copy(self.caption_style)
+        style.font = FONT_MANAGER.get_font_path(style.font)
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            jobs = [
+                {
+                    "input_path": self.input_path,
+                    "segment_path": os.path.join(work_dir, f"segment_{i:04d}.mp4"),
+                    "start": start,
+                    "end": end,
+                    "fps": info['fps'],
+                    "video_size": self.video_size,
+                    "style": style,
+                    "encoder_params": [
+                        '-c:v', 'libx264',
+                        '-preset', 'veryfast',
+                        '-threads', '1'
+                    ] + ENCODER_PARAMS,
+                    # Only the groups that overlap this shard
+                    "transcriptions": [
+                        t for t in transcriptions
+                        if t["end_time"] > start and t["start_time"] < end
+                    ]
+                }
+                for i, (start, end) in enumerate(segments)
+            ]
+
+            # Workers run in other processes, so each shard is timed as a whole here
+            with ProcessPoolExecutor(max_workers=len(jobs)) as pool, self.profiler.stage("encode"):
+                segment_paths = list(tqdm(
+                    pool.map(_render_segment, jobs),
+                    total=len(jobs),
+                    desc="Rendering segments"
+                ))
+
+            with self.profiler.stage("concat"):
+                concat_segments(
+                    segment_paths,
+                    self.output_path,
+                    os.path.join(work_dir, "segments.txt"),
+                    audio_source=self.input_path if info['has_audio'] else None
+                )
+
+    def _render_ass(self, transcriptions: List[Dict]):
+        """Export the word groups as ASS karaoke and burn them in with one ffmpeg pass"""
+        style = self.caption_style
+        with tempfile.TemporaryDirectory() as work_dir:
+            ass_path = os.path.join(work_dir, "captions.ass")
+            with self.profiler.stage("caption_clips"):
+                fonts_dir = write_ass(
+                    transcriptions,
+                    ass_path,
+                    self.video_size,
+                    font=FONT_MANAGER.get_font_path(style.font),
+                    font_size=style.font_size,
+                    color=style.color,
+                    active_color=style.active_color,
+                    stroke_color=style.stroke_color,
+                    stroke_width=style.stroke_width,
+                    position=style.position,
+                    margin=style.margin,
+                    active_size_increase=style.active_size_increase
+                )
+            with self.profiler.stage("encode"):
+                burn_in_ass(
+                    self.input_path,
+                    self.output_path,
+                    ass_path,
+                    encoder_params=[
+                        '-c:v', 'libx264',
+                        '-preset', 'veryfast',
+                        '-threads', str(self.n_cores)
+                    ] + ENCODER_PARAMS,
+                    fonts_dir=fonts_dir,
+                    size=self.video_size if self.video_size != self.original_size else None
+                )
+
+    def _transcribe_video(self) -> List[Dict]:
+        """Transcribe with word-level timing, reusing a cached transcript when the audio is unchanged"""
         print("\nTranscribing audio...")
-        result = model.transcribe(audio_path, language="en", word_timestamps=True)
-        video.close()
-        os.remove(audio_path)
+        result = transcribe(
+            self.input_path,
+            self.draft_model or "small",
+            escalate_to="small" if self.draft_model else None,
+            profiler=self.profiler,
+            language="en",
+            word_timestamps=True
+        )
         print("Transcription complete!")
 
-        return self._process_transcription(result)
+        with self.profiler.stage("word_grouping"):
+            return self._process_transcription(result)
 
     def _process_transcription(self, result: Dict) -> List[Dict]:
         """Process whisper output into word groups"""
@@ -333,7 +599,9 @@ if __name__ == "__main__":
             input_path="default.mp4",  # Change this to your input video file
             output_path="output.mp4",  # Change this to your desired output file
             caption_style=custom_style,
-            resize_to_1080p=False
+            resize_to_1080p=False,
+            engine="moviepy",  # Also "ffmpeg" (pipes), "ass" (libass) or "overlay" (caption track only)
+            profile_path=None  # e.g. "profile.json" to see where the render time went
         )
 
         processor.process()
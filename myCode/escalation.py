@@ -0,0 +1,169 @@
+from typing import Dict, List, Optional, Tuple
+from bisect import bisect_right
+from contextlib import ExitStack
+import numpy as np
+
+from audio import SAMPLE_RATE
+from batch_transcribe import whisper_transcriber
+from profiling import Profiler, NULL_PROFILER
+
+Span = Tuple[float, float]
+
+
+def weak_segments(
+    segments: List[Dict],
+    min_logprob: float = -0.7,
+    max_compression_ratio: float = 2.0,
+    max_no_speech: float = 0.4
+) -> List[Span]:
+    """(start, end) of the segments a small model was unsure about
+
+    A segment is weak when its average token log-probability is low, its
+    text is repetitive (a high gzip compression ratio, the usual sign of a
+    decoding loop) or the model nearly called it silence.
+    """
+    return [
+        (segment["start"], segment["end"])
+        for segment in segments
+        if segment.get("avg_logprob", 0.0) < min_logprob
+        or segment.get("compression_ratio", 0.0) > max_compression_ratio
+        or segment.get("no_speech_prob", 0.0) > max_no_speech
+    ]
+
+
+def merge_spans(spans: List[Span], duration: float, padding: float = 0.5, gap: float = 1.0) -> List[Span]:
+    """Pad the spans, clip them to the audio and join those closer than gap"""
+    merged: List[Span] = []
+    for start, end in sorted(spans):
+        start, end = max(start - padding, 0.0), min(end + padding, duration)
+        if merged and start - merged[-1][1] <= gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def snap_spans(spans: List[Span], words: List[Dict], duration: float) -> List[Span]:
+    """Move span edges that cut through a draft word out to the middle of the pause beyond it
+
+    An edge inside a word would give the larger model a truncated copy
+    while the draft's whole copy is dropped. Once snapped, every draft word
+    is either wholly inside a span or wholly outside; spans that now touch
+    are joined.
+    """
+    words = sorted(words, key=lambda word: word["start"])
+    starts = [word["start"] for word in words]
+
+    def containing(t: float) -> int:
+        index = bisect_right(starts, t) - 1
+        return index if index >= 0 and words[index]["start"] < t < words[index]["end"] else -1
+
+    snapped = []
+    for start, end in spans:
+        index = containing(start)
+        if index >= 0:
+            before = min(words[index - 1]["end"], starts[index]) if index > 0 else 0.0
+            start = (before + starts[index]) / 2
+        index = containing(end)
+        if index >= 0:
+            after = max(starts[index + 1], words[index]["end"]) if index + 1 < len(words) else duration
+            end = (words[index]["end"] + after) / 2
+        snapped.append((start, end))
+    return merge_spans(snapped, duration, padding=0.0, gap=0.0)
+
+
+def _inside(t: float, spans: List[Span], starts: List[float]) -> bool:
+    index = bisect_right(starts, t) - 1
+    return index >= 0 and t < spans[index][1]
+
+
+def _keep_words(segments: List[Dict], keep, offset: float = 0.0) -> List[Dict]:
+    """Shift segments by offset and keep only the words that start where keep(t) is true"""
+    kept = []
+    for segment in segments:
+        words = [
+            dict(word, start=word["start"] + offset, end=word["end"] + offset)
+            for word in segment.get("words", [])
+            if keep(word["start"] + offset)
+        ]
+        if not words:
+            continue
+        kept.append(dict(
+            segment,
+            start=words[0]["start"],
+            end=words[-1]["end"],
+            text="".join(word["word"] for word in words),
+            words=words
+        ))
+    return kept
+
+
+def transcribe_tiered(
+    samples: np.ndarray,
+    draft_model: str,
+    final_model: str,
+    device: Optional[str] = None,
+    profiler: Profiler = NULL_PROFILER,
+    max_fraction: float = 0.6,
+    sample_rate: int = SAMPLE_RATE,
+    batched: bool = False,
+    **options
+) -> Dict:
+    """Transcribe with a small model, then redo only its weak segments with a larger one
+
+    Words from the larger model replace the draft's inside each escalated
+    span; everywhere else the draft is kept. When most of the audio would be
+    escalated anyway, the larger model simply transcribes all of it. With
+    batched, both models run through the shared BatchTranscriber and the
+    escalated spans are queued together.
+    """
+    options = dict(options, word_timestamps=True)
+    duration = len(samples) / sample_rate
+
+    with ExitStack() as stack:
+        with profiler.stage("model_load"):
+            model = stack.enter_context(whisper_transcriber(draft_model, device, batched))
+        with profiler.stage("transcription"):
+            draft = model.transcribe(samples, **options)
+
+    draft_words = [word for segment in draft["segments"] for word in segment.get("words", [])]
+    spans = snap_spans(merge_spans(weak_segments(draft["segments"]), duration), draft_words, duration)
+    escalated_seconds = sum(end - start for start, end in spans)
+    if not spans:
+        print(f"Transcription by {draft_model} is confident throughout")
+        return draft
+
+    with ExitStack() as stack:
+        with profiler.stage("model_load"):
+            model = stack.enter_context(whisper_transcriber(final_model, device, batched))
+
+        if escalated_seconds > max_fraction * duration:
+            print(f"Transcription by {draft_model} is weak in most of the audio, using {final_model}")
+            with profiler.stage("escalation"):
+                return model.transcribe(samples, **options)
+
+        print(f"Re-transcribing {escalated_seconds:.1f}s of {duration:.1f}s with {final_model}...")
+        starts = [start for start, _ in spans]
+        segments = _keep_words(draft["segments"], lambda t: not _inside(t, spans, starts))
+        bounds = [(int(start * sample_rate), int(end * sample_rate), end) for start, end in spans]
+        with profiler.stage("escalation"):
+            if batched:
+                # Queued at once, the spans are decoded in shared batches
+                futures = [model.submit(samples[lo:hi], **options) for lo, hi, _ in bounds]
+                results = [future.result() for future in futures]
+            else:
+                results = [model.transcribe(samples[lo:hi], **options) for lo, hi, _ in bounds]
+        for (lo, _, end), result in zip(bounds, results):
+            segments.extend(_keep_words(
+                result["segments"],
+                lambda t, end=end: t < end,
+                offset=lo / sample_rate
+            ))
+
+    segments.sort(key=lambda segment: segment["start"])
+    segments = [dict(segment, id=i) for i, segment in enumerate(segments)]
+    return {
+        "text": "".join(segment["text"] for segment in segments),
+        "segments": segments,
+        "language": draft.get("language")
+    }
@@ -0,0 +1,258 @@
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from fractions import Fraction
+import json
+import os
+import subprocess
+import tempfile
+import numpy as np
+
+from sprites import textclip_to_rgba
+from compositor import PremultipliedSprite, IntervalIndex, composite_frame
+
+ENGINES = ("moviepy", "ffmpeg")
+
+# Audio codecs the MP4/MOV muxer accepts as a stream copy
+MP4_AUDIO_CODECS = ("aac", "mp3", "alac", "ac3", "eac3")
+
+
+def check_engine(engine: str, engines: Tuple[str, ...] = ENGINES) -> str:
+    """Validate a render engine name"""
+    if engine not in engines:
+        raise ValueError(f"Unknown render engine: {engine} (expected one of {engines})")
+    return engine
+
+
+def probe_video(path: str) -> Dict:
+    """Read size, frame rate, duration and audio presence with ffprobe"""
+    probe_command = [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'stream=codec_type,codec_name,width,height,r_frame_rate:format=duration',
+        '-of', 'json', path
+    ]
+    result = subprocess.run(probe_command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Error probing {path}: {result.stderr}")
+
+    info = json.loads(result.stdout)
+    video_info = {'has_audio': False, 'duration': float(info.get('format', {}).get('duration', 0))}
+    for stream in info.get('streams', []):
+        if stream['codec_type'] == 'video' and 'width' not in video_info:
+            video_info['width'] = int(stream['width'])
+            video_info['height'] = int(stream['height'])
+            video_info['fps'] = float(Fraction(stream.get('r_frame_rate', '30/1')))
+        elif stream['codec_type'] == 'audio' and not video_info['has_audio']:
+            video_info['has_audio'] = True
+            video_info['audio_codec'] = stream.get('codec_name')
+    return video_info
+
+
+def audio_codec_args(source_path: str, output_path: str) -> List[str]:
+    """Copy the source's audio when the output container can hold it, otherwise encode AAC"""
+    if os.path.splitext(output_path)[1].lower() in ('.mp4', '.m4v', '.mov'):
+        if probe_video(source_path).get('audio_codec') not in MP4_AUDIO_CODECS:
+            return ['-c:a', 'aac', '-b:a', '192k']
+    return ['-c:a', 'copy']
+
+
+def _read_exact(stream, buffer: np.ndarray) -> bool:
+    """Fill buffer from a pipe; False at end of stream"""
+    view = memoryview(buffer).cast('B')
+    filled = 0
+    while filled < len(view):
+        n = stream.readinto(view[filled:])
+        if not n:
+            return False
+        filled += n
+    return True
+
+
+class FrameReader:
+    """Decode RGB frames from an ffmpeg subprocess into one reusable buffer"""
+    def __init__(
+        self,
+        path: str,
+        size: Tuple[int, int],
+        start: Optional[float] = None,
+        duration: Optional[float] = None
+    ):
+        self.size = size
+        command = ['ffmpeg', '-v', 'error', '-nostdin']
+        if start is not None:
+            command += ['-ss', f'{start:.6f}']
+        command += ['-i', path]
+        if duration is not None:
+            command += ['-t', f'{duration:.6f}']
+        command += [
+            '-vf', f'scale={size[0]}:{size[1]}',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-'
+        ]
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE)
+        self._buffer = np.empty((size[1], size[0], 3), dtype=np.uint8)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        """Yield the same buffer refilled with each frame"""
+        while _read_exact(self.process.stdout, self._buffer):
+            yield self._buffer
+
+    def close(self):
+        self.process.stdout.close()
+        self.process.wait()
+
+
+class FrameWriter:
+    """Encode RGB (or RGBA, with pixel_format='rgba') frames piped into an ffmpeg subprocess"""
+    def __init__(
+        self,
+        output_path: str,
+        size: Tuple[int, int],
+        fps: float,
+        encoder_params: List[str],
+        audio_source: Optional[str] = None,
+        audio_start: Optional[float] = None,
+        pixel_format: str = 'rgb24'
+    ):
+        command = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'rawvideo', '-pix_fmt', pixel_format,
+            '-s', f'{size[0]}x{size[1]}', '-r', f'{fps}',
+            '-i', '-'
+        ]
+        if audio_source is not None:
+            # Copy the original audio stream without re-encoding where the container allows
+            if audio_start is not None:
+                command += ['-ss', f'{audio_start:.6f}']
+            command += ['-i', audio_source, '-map', '0:v:0', '-map', '1:a:0?', '-shortest']
+            command += audio_codec_args(audio_source, output_path)
+        command += encoder_params + [output_path]
+        # A file, not a pipe: nobody reads stderr while frames are written, so a pipe could fill and block
+        self._stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self._stderr)
+
+    def write(self, frame: np.ndarray):
+        self.process.stdin.write(memoryview(np.ascontiguousarray(frame)).cast('B'))
+
+    def close(self):
+        self.process.stdin.close()
+        returncode = self.process.wait()
+        self._stderr.seek(0)
+        stderr = self._stderr.read()
+        self._stderr.close()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg encoding failed: {stderr.decode(errors='replace')}")
+
+
+def render_video(
+    input_path: str,
+    output_path: str,
+    draw: Callable[[np.ndarray, float], np.ndarray],
+    encoder_params: List[str],
+    size: Optional[Tuple[int, int]] = None,
+    progress: Optional[Callable[[int], None]] = None
+):
+    """Decode, draw on and re-encode a video through ffmpeg pipes, copying its audio"""
+    info = probe_video(input_path)
+    size = size or (info['width'], info['height'])
+    fps = info['fps']
+
+    reader = FrameReader(input_path, size)
+    writer = FrameWriter(
+        output_path, size, fps, encoder_params,
+        audio_source=input_path if info['has_audio'] else None
+    )
+    try:
+        for index, frame in enumerate(reader):
+            writer.write(draw(frame, index / fps))
+            if progress is not None:
+                progress(index)
+    finally:
+        reader.close()
+        writer.close()
+
+
+def clip_sprites(
+    text_clips: List,
+    position: Optional[Callable[[Any], Tuple[int, int]]] = None
+) -> IntervalIndex:
+    """Rasterize positioned moviepy clips once into sprites indexed by their [start, end)"""
+    position = position or (lambda clip: clip.pos(0))
+    return IntervalIndex(
+        [
+            (clip.start, clip.end, PremultipliedSprite(textclip_to_rgba(clip), *position(clip)))
+            for clip in text_clips
+        ],
+        start=lambda item: item[0],
+        end=lambda item: item[1]
+    )
+
+
+def render_clips(
+    video_path: str,
+    output_path: str,
+    text_clips: List,
+    encoder_params: List[str],
+    composite: Callable[[np.ndarray, List], np.ndarray] = composite_frame,
+    position: Optional[Callable[[Any], Tuple[int, int]]] = None
+):
+    """Burn moviepy text clips in through ffmpeg pipes, copying the audio stream"""
+    sprites = clip_sprites(text_clips, position)
+    render_video(
+        video_path,
+        output_path,
+        lambda frame, t: composite(frame, [(sprite, 0, 0) for _, _, sprite in sprites.active(t)]),
+        encoder_params
+    )
+
+
+def keyframe_times(path: str) -> List[float]:
+    """Presentation times of the video keyframes, read from packet flags without decoding"""
+    probe_command = [
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0', path
+    ]
+    result = subprocess.run(probe_command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Error probing keyframes of {path}: {result.stderr}")
+
+    times = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags and pts_time not in ('', 'N/A'):
+            times.append(float(pts_time))
+    return sorted(times)
+
+
+def split_at_keyframes(path: str, duration: float, n_segments: int) -> List[Tuple[float, float]]:
+    """Split the timeline into up to n_segments (start, end) ranges on keyframe boundaries"""
+    keyframes = keyframe_times(path)
+    boundaries = [0.0]
+    for i in range(1, n_segments):
+        target = duration * i / n_segments
+        nearest = min(keyframes, key=lambda k: abs(k - target), default=None)
+        if nearest is not None and boundaries[-1] < nearest < duration:
+            boundaries.append(nearest)
+    boundaries.append(duration)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def concat_segments(
+    segment_paths: List[str],
+    output_path: str,
+    list_path: str,
+    audio_source: Optional[str] = None
+):
+    """Join encoded segments with the concat demuxer (stream copy) and mux the audio once"""
+    with open(list_path, 'w') as f:
+        for segment_path in segment_paths:
+            escaped = segment_path.replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    command = ['ffmpeg', '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_path]
+    if audio_source is not None:
+        command += ['-i', audio_source, '-map', '0:v:0', '-map', '1:a:0?']
+        command += audio_codec_args(audio_source, output_path)
+    command += ['-c:v', 'copy', '-movflags', '+faststart', output_path]
+
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg concat failed: {result.stderr}")
@@ -0,0 +1,328 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+from contextlib import ExitStack
+import glob
+import os
+import queue
+import struct
+import subprocess
+import threading
+import time
+import numpy as np
+
+from audio import SAMPLE_RATE, load_pcm, pcm_to_float
+from batch_transcribe import whisper_transcriber
+from vad import speech_regions
+
+MEDIA_EXTENSIONS = (".mp4", ".mkv", ".ts", ".flv", ".mov", ".webm", ".m4a", ".wav", ".mp3")
+# ISO BMFF containers: only decodable while growing when fragmented (moov ahead of the media data)
+MP4_EXTENSIONS = (".mp4", ".m4v", ".mov", ".m4a")
+
+
+def _stable(path: str, wait: float = 1.0) -> bool:
+    """A recorder is done with a file once its size stops changing"""
+    size = os.path.getsize(path)
+    time.sleep(wait)
+    return os.path.getsize(path) == size
+
+
+def _moov_first(path: str) -> bool:
+    """Whether an MP4's moov box comes before its media data, as in a fragmented recording"""
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return False
+            size, kind = struct.unpack(">I4s", header)
+            if kind == b"moov":
+                return True
+            if kind in (b"mdat", b"moof") or size == 0:
+                return False
+            if size == 1:
+                size = struct.unpack(">Q", f.read(8))[0] - 8
+            f.seek(size - 8, os.SEEK_CUR)
+
+
+def _follow_directory(
+    directory: str,
+    sample_rate: int,
+    block_seconds: float,
+    idle_timeout: float,
+    segments: Optional[List[Tuple[str, float, float]]] = None
+) -> Iterator[np.ndarray]:
+    """Decode recording segments as they land in a directory, in name order
+
+    Each decoded segment is appended to segments as (path, start, end) on
+    the stream timeline before its audio is yielded.
+    """
+    done = set()
+    offset = 0.0
+    last_new = time.monotonic()
+    while time.monotonic() - last_new < idle_timeout:
+        paths = sorted(
+            p for p in glob.glob(os.path.join(directory, "*"))
+            if p.lower().endswith(MEDIA_EXTENSIONS) and p not in done
+        )
+        # The newest file may still be recording
+        ready = paths[:-1] + [p for p in paths[-1:] if _stable(p)]
+        for path in ready:
+            done.add(path)
+            last_new = time.monotonic()
+            print(f"Captioning {os.path.basename(path)}...")
+            samples = pcm_to_float(load_pcm(path, sample_rate))
+            if segments is not None:
+                segments.append((path, offset, offset + len(samples) / sample_rate))
+            offset += len(samples) / sample_rate
+            # Same block size as a live stream, so windows stay bounded
+            block = int(block_seconds * sample_rate)
+            for lo in range(0, len(samples), block):
+                yield samples[lo:lo + block]
+        if not ready:
+            time.sleep(0.5)
+
+
+def _follow_stream(source: str, sample_rate: int, block_seconds: float, idle_timeout: float) -> Iterator[np.ndarray]:
+    """Decode a growing file (or stdin for "-") through ffmpeg as it is written
+
+    A plain MP4 writes its moov index only when recording stops, so nothing
+    can be decoded while it grows: record fragmented MP4 or MPEG-TS instead.
+    """
+    command = ['ffmpeg', '-v', 'error']
+    if source == "-":
+        command += ['-i', 'pipe:0']
+    else:
+        if source.lower().endswith(MP4_EXTENSIONS) and not _moov_first(source):
+            raise ValueError(
+                f"{source} is not a fragmented MP4 and cannot be followed while it is recorded; "
+                "record with -movflags frag_keyframe+empty_moov, or to MPEG-TS (.ts)"
+            )
+        # The file protocol keeps reading past the current end of a growing file
+        command += ['-nostdin', '-follow', '1', '-i', f'file:{source}']
+    command += ['-vn', '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(sample_rate), '-']
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    blocks: "queue.Queue[Optional[bytes]]" = queue.Queue()
+    block_bytes = int(block_seconds * sample_rate) * 2
+
+    def reader():
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            blocks.put(data)
+        blocks.put(None)
+
+    threading.Thread(target=reader, daemon=True).start()
+    try:
+        while True:
+            try:
+                data = blocks.get(timeout=idle_timeout)
+            except queue.Empty:
+                break  # The recording stopped growing
+            if data is None:
+                break
+            # Keep whole samples only; the odd byte never happens with s16le output
+            yield pcm_to_float(np.frombuffer(data[:len(data) // 2 * 2], dtype=np.int16))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def live_pcm(
+    source: str,
+    sample_rate: int = SAMPLE_RATE,
+    block_seconds: float = 0.5,
+    idle_timeout: float = 10.0,
+    segments: Optional[List[Tuple[str, float, float]]] = None
+) -> Iterator[np.ndarray]:
+    """Mono float32 audio blocks from a growing file, a pipe ("-") or a directory of segments
+
+    Ends once no new audio has arrived for idle_timeout seconds. For a
+    directory, segments collects the (path, start, end) of each file read.
+    Growing files must be fragmented MP4, MPEG-TS or another streamable format.
+    """
+    if os.path.isdir(source):
+        return _follow_directory(source, sample_rate, block_seconds, idle_timeout, segments)
+    return _follow_stream(source, sample_rate, block_seconds, idle_timeout)
+
+
+class LiveTranscriber:
+    """Transcribe a growing stream in rolling windows and emit finalized words in order
+
+    Every step_seconds of new audio, the window (a look-behind of already
+    finalized audio for context plus everything after it) is transcribed
+    again. Words that end finalize_lag seconds before the newest audio are
+    final: later passes cannot change them, so they are emitted once and
+    the window moves past them. Latency is bounded by step_seconds plus
+    finalize_lag plus one decode. A window that reaches max_window commits
+    up to its new start before it is trimmed, so no audio goes unheard.
+    With batched, passes share the BatchTranscriber with other streams and
+    jobs in the process. The model stays pinned until close().
+    """
+    def __init__(
+        self,
+        model_name: str = "base",
+        device: Optional[str] = None,
+        step_seconds: float = 2.0,
+        look_behind: float = 2.0,
+        finalize_lag: float = 1.0,
+        max_window: float = 20.0,
+        sample_rate: int = SAMPLE_RATE,
+        batched: bool = False,
+        **options
+    ):
+        self._stack = ExitStack()
+        self.model = self._stack.enter_context(whisper_transcriber(model_name, device, batched))
+        self.step_seconds = step_seconds
+        self.look_behind = look_behind
+        self.finalize_lag = finalize_lag
+        self.max_window = max_window
+        self.sample_rate = sample_rate
+        self.options = dict(options, word_timestamps=True)
+        self._prompt = self.options.pop("initial_prompt", None) or ""
+
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._buffer_start = 0.0  # Source time of the first buffered sample
+        self._pending = 0  # Samples received since the last pass
+        self._context: List[str] = []
+        self._last_word: Optional[Dict] = None
+        self.committed = 0.0  # Everything before this has been emitted
+        self.horizon = 0.0  # Everything before this is final
+
+    def feed(self, samples: np.ndarray) -> List[Dict]:
+        """Add audio; returns the words that became final, in order"""
+        self._buffer = np.concatenate([self._buffer, samples])
+        self._pending += len(samples)
+        if self._pending < self.step_seconds * self.sample_rate:
+            return []
+        return self._transcribe(final=False)
+
+    def flush(self) -> List[Dict]:
+        """Finalize everything left at the end of the stream"""
+        if len(self._buffer) == 0:
+            return []
+        return self._transcribe(final=True)
+
+    def close(self):
+        """Release the model"""
+        self._stack.close()
+
+    def _transcribe(self, final: bool) -> List[Dict]:
+        self._pending = 0
+        buffer_end = self._buffer_start + len(self._buffer) / self.sample_rate
+        horizon = buffer_end if final else max(buffer_end - self.finalize_lag, self.committed)
+
+        words = []
+        # Silent windows cost only the VAD pass
+        if speech_regions(self._buffer, self.sample_rate):
+            prompt = " ".join([self._prompt] + self._context).strip()
+            result = self.model.transcribe(
+                self._buffer, initial_prompt=prompt or None, **self.options
+            )
+            words = [
+                dict(
+                    word=word["word"].strip(),
+                    start=word["start"] + self._buffer_start,
+                    end=word["end"] + self._buffer_start,
+                    probability=word.get("probability")
+                )
+                for segment in result["segments"]
+                for word in segment.get("words", [])
+                if word["word"].strip()
+            ]
+
+        # A full window must move on: everything before its new start is final, except a word cut in half
+        cut = buffer_end - self.max_window + self.look_behind
+        for word in words:
+            if word["start"] < cut < word["end"]:
+                cut = word["start"]
+                break
+        horizon = max(horizon, cut)
+
+        # Look-behind words were emitted already; words near the live edge may still change
+        finalized = []
+        for word in words:
+            if word["end"] > horizon:
+                break
+            # Timestamps jitter between passes: a word starting just before committed is new unless it repeats
+            new = word["start"] >= self.committed or (
+                word["start"] >= self.committed - 0.1
+                and word["end"] > self.committed
+                and not self._repeats(word)
+            )
+            if not new:
+                continue
+            finalized.append(word)
+            self._last_word = word
+        if finalized:
+            self.committed = max(self.committed, finalized[-1]["end"])
+            self._context = (self._context + [word["word"] for word in finalized])[-20:]
+        elif not words:
+            self.committed = horizon
+        self.committed = max(self.committed, cut)
+        self.horizon = horizon
+
+        # Keep a little finalized audio for context, and never drop audio that is not committed
+        keep_from = max(
+            min(buffer_end - self.max_window, self.committed),
+            self.committed - self.look_behind,
+            self._buffer_start
+        )
+        drop = int((keep_from - self._buffer_start) * self.sample_rate)
+        if drop > 0:
+            self._buffer = self._buffer[drop:]
+            self._buffer_start += drop / self.sample_rate
+        return finalized
+
+    def _repeats(self, word: Dict) -> bool:
+        last = self._last_word
+        return last is not None and word["word"].lower() == last["word"].lower()
+
+
+def srt_time(seconds: float) -> str:
+    milliseconds = int(round(max(seconds, 0) * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    secs, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{milliseconds:03d}"
+
+
+class SrtWriter:
+    """Append caption cues to an SRT file as soon as they are complete
+
+    Words are grouped like the file-based captioners: up to max_words per
+    cue, and a pause longer than max_gap starts a new one.
+    """
+    def __init__(self, path: str, max_words: int = 5, max_gap: float = 0.5):
+        self.file = open(path, "w", encoding="utf-8")
+        self.max_words = max_words
+        self.max_gap = max_gap
+        self.count = 0
+        self._words: List[Dict] = []
+
+    def add(self, words: List[Dict]):
+        for word in words:
+            if self._words and word["start"] - self._words[-1]["end"] > self.max_gap:
+                self._write_cue()
+            self._words.append(word)
+            if len(self._words) >= self.max_words:
+                self._write_cue()
+
+    def expire(self, horizon: float):
+        """Close the open cue once the stream has moved on past its pause"""
+        if self._words and horizon - self._words[-1]["end"] > self.max_gap:
+            self._write_cue()
+
+    def _write_cue(self):
+        self.count += 1
+        text = " ".join(word["word"] for word in self._words)
+        self.file.write(
+            f"{self.count}\n{srt_time(self._words[0]['start'])} --> "
+            f"{srt_time(self._words[-1]['end'])}\n{text}\n\n"
+        )
+        self.file.flush()
+        self._words = []
+
+    def close(self):
+        if self._words:
+            self._write_cue()
+        self.file.close()
@@ -0,0 +1,154 @@
+from typing import Dict, Iterable, Optional, Tuple
+from collections import OrderedDict
+from contextlib import contextmanager
+import gc
+import os
+import threading
+import time
+import torch
+import whisper
+
+
+def resolve_device(device: Optional[str] = None) -> str:
+    """Same default as whisper.load_model, so pool keys match what gets loaded"""
+    return device or ("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def model_nbytes(model: torch.nn.Module) -> int:
+    return sum(p.numel() * p.element_size() for p in model.parameters())
+
+
+class ModelPool:
+    """Load each Whisper model once per (name, device) and share it between calls
+
+    Models are evicted least recently used first when the pool grows past
+    max_bytes, or once they have been idle for max_idle seconds. Models that
+    are checked out with use() are never evicted.
+    """
+    def __init__(self, max_bytes: Optional[int] = None, max_idle: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.max_idle = max_idle
+        self._models: "OrderedDict[Tuple[str, str], torch.nn.Module]" = OrderedDict()
+        self._sizes: Dict[Tuple[str, str], int] = {}
+        self._last_used: Dict[Tuple[str, str], float] = {}
+        self._in_use: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.RLock()
+        self._loading: Dict[Tuple[str, str], threading.Lock] = {}
+
+    def get(self, name: str, device: Optional[str] = None) -> torch.nn.Module:
+        """Return the shared model, loading it on first use"""
+        key = (name, resolve_device(device))
+        with self._lock:
+            self._evict_idle()
+            if key in self._models:
+                return self._touch(key)
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        # Load outside the pool lock so other models stay available meanwhile
+        with load_lock:
+            with self._lock:
+                if key in self._models:
+                    return self._touch(key)
+
+            print(f"Loading Whisper model '{name}' on {key[1]}...")
+            model = whisper.load_model(name, device=key[1])
+            model.eval()
+
+            with self._lock:
+                self._models[key] = model
+                self._sizes[key] = model_nbytes(model)
+                self._in_use.setdefault(key, 0)
+                self._touch(key)
+                self._evict_over_budget(keep=key)
+                return model
+
+    @contextmanager
+    def use(self, name: str, device: Optional[str] = None):
+        """Check a model out for the duration of a block so it cannot be evicted"""
+        model = self.get(name, device)
+        key = (name, resolve_device(device))
+        with self._lock:
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+        try:
+            yield model
+        finally:
+            with self._lock:
+                self._in_use[key] -= 1
+                self._touch(key)
+
+    def preload(self, names: Iterable[str], device: Optional[str] = None):
+        for name in names:
+            self.get(name, device)
+
+    def evict(self, name: str, device: Optional[str] = None):
+        with self._lock:
+            self._drop((name, resolve_device(device)))
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._models):
+                self._drop(key)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return (key[0], resolve_device(key[1])) in self._models
+
+    def _touch(self, key: Tuple[str, str]) -> torch.nn.Module:
+        self._models.move_to_end(key)
+        self._last_used[key] = time.monotonic()
+        return self._models[key]
+
+    def _drop(self, key: Tuple[str, str]):
+        if key not in self._models:
+            return
+        del self._models[key]
+        del self._sizes[key]
+        self._last_used.pop(key, None)
+        gc.collect()
+        if key[1].startswith("cuda"):
+            torch.cuda.empty_cache()
+
+    def _evictable(self, keep: Optional[Tuple[str, str]] = None):
+        return [k for k in self._models if k != keep and not self._in_use.get(k)]
+
+    def _evict_idle(self):
+        if self.max_idle is None:
+            return
+        now = time.monotonic()
+        for key in self._evictable():
+            if now - self._last_used[key] > self.max_idle:
+                self._drop(key)
+
+    def _evict_over_budget(self, keep: Tuple[str, str]):
+        if self.max_bytes is None:
+            return
+        # Least recently used first
+        for key in self._evictable(keep):
+            if self.nbytes <= self.max_bytes:
+                break
+            self._drop(key)
+
+
+def _env_number(name: str) -> Optional[float]:
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+# Shared by every entry point in this process
+MODEL_POOL = ModelPool(
+    max_bytes=int(_env_number("WHISPER_POOL_MAX_BYTES") or 8 * 1024 ** 3),
+    max_idle=_env_number("WHISPER_POOL_MAX_IDLE")
+)
+
+
+def load_model(name: str, device: Optional[str] = None) -> torch.nn.Module:
+    """Drop-in for whisper.load_model that reuses already loaded models"""
+    return MODEL_POOL.get(name, device)
+
+
+def preload_models(names: Iterable[str], device: Optional[str] = None):
+    """Load models up front, e.g. as a ProcessPoolExecutor initializer"""
+    MODEL_POOL.preload(names, device)
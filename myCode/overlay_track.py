@@ -0,0 +1,155 @@
+from typing import Callable, Hashable, List, Optional, Tuple
+import math
+import os
+import subprocess
+import numpy as np
+
+from compositor import Placement, render_rgba, sprite_bounds
+from ffmpeg_pipe import FrameWriter, audio_codec_args
+
+# Encoder settings and container for each alpha-capable codec
+ALPHA_CODECS = {
+    "qtrle": (['-c:v', 'qtrle', '-pix_fmt', 'argb'], '.mov'),
+    "prores": (['-c:v', 'prores_ks', '-profile:v', '4444', '-pix_fmt', 'yuva444p10le'], '.mov'),
+    "vp9": (['-c:v', 'libvpx-vp9', '-pix_fmt', 'yuva420p', '-b:v', '0', '-crf', '30'], '.webm'),
+}
+
+
+def merge_spans(
+    intervals: List[Tuple[float, float]],
+    duration: float,
+    min_gap: float = 0.5
+) -> List[Tuple[float, float]]:
+    """Merge caption intervals whose gaps are shorter than min_gap, clamped to the video"""
+    spans = []
+    for start, end in sorted(intervals):
+        start, end = max(start, 0.0), min(end, duration)
+        if end <= start:
+            continue
+        if spans and start - spans[-1][1] < min_gap:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], end))
+        else:
+            spans.append((start, end))
+    return spans
+
+
+def _frame_times(span: Tuple[float, float], fps: float) -> List[float]:
+    """Frame-grid times covering a span"""
+    first = math.floor(span[0] * fps)
+    last = math.ceil(span[1] * fps)
+    return [i / fps for i in range(first, last)]
+
+
+def _encode(frames, path: str, size: Tuple[int, int], fps: float, codec: str):
+    """Encode straight-alpha RGBA frames with an alpha-capable codec"""
+    writer = FrameWriter(path, size, fps, ALPHA_CODECS[codec][0], pixel_format='rgba')
+    try:
+        for frame in frames:
+            writer.write(frame)
+    finally:
+        writer.close()
+
+
+def render_overlay_track(
+    placements_at: Callable[[float], List[Placement]],
+    spans: List[Tuple[float, float]],
+    fps: float,
+    work_dir: str,
+    codec: str = "qtrle",
+    state_at: Optional[Callable[[float], Hashable]] = None
+) -> Optional[Tuple[str, Tuple[int, int]]]:
+    """Encode only the caption layer, cropped to its bounding box, for the visible spans
+
+    Returns a concat-demuxer list that places the span clips on the original
+    timeline (transparent in between) and the top-left corner to overlay it at.
+    state_at keys the visual state at a time; frames of a state already seen
+    are not rendered again to find the bounding box.
+    """
+    if codec not in ALPHA_CODECS:
+        raise ValueError(f"Unknown overlay codec: {codec} (expected one of {tuple(ALPHA_CODECS)})")
+
+    # Union of every caption's ink box, so the track has one fixed size
+    left = top = math.inf
+    right = bottom = -math.inf
+    seen = set()
+    for span in spans:
+        for t in _frame_times(span, fps):
+            if state_at is not None:
+                state = state_at(t)
+                if state in seen:
+                    continue
+                seen.add(state)
+            for sprite, x, y in placements_at(t):
+                l, tp, r, b = sprite_bounds(sprite, x, y)
+                left, top = min(left, l), min(top, tp)
+                right, bottom = max(right, r), max(bottom, b)
+    if left >= right or top >= bottom:
+        return None
+
+    origin = (int(left), int(top))
+    # Even dimensions keep every codec's chroma subsampling happy
+    width, height = int(right) - origin[0], int(bottom) - origin[1]
+    size = ((width + 1) // 2 * 2, (height + 1) // 2 * 2)
+    extension = ALPHA_CODECS[codec][1]
+
+    blank_path = os.path.join(work_dir, f"blank{extension}")
+    _encode([np.zeros((size[1], size[0], 4), dtype=np.uint8)], blank_path, size, fps, codec)
+
+    entries = []
+    cursor = 0.0
+    for i, span in enumerate(spans):
+        times = _frame_times(span, fps)
+        if not times:
+            continue
+
+        # Transparent filler up to the span
+        if times[0] > cursor:
+            entries.append((blank_path, times[0] - cursor))
+
+        span_path = os.path.join(work_dir, f"overlay_{i:05d}{extension}")
+        _encode(
+            (render_rgba(placements_at(t), origin, size) for t in times),
+            span_path, size, fps, codec
+        )
+        entries.append((span_path, len(times) / fps))
+        cursor = times[0] + len(times) / fps
+
+    # Trailing filler so the last caption is not held by the overlay filter
+    entries.append((blank_path, 1 / fps))
+
+    list_path = os.path.join(work_dir, "overlay.txt")
+    with open(list_path, 'w') as f:
+        for path, duration in entries:
+            escaped = path.replace("'", "'\\''")
+            f.write(f"file '{escaped}'\nduration {duration:.6f}\n")
+
+    return list_path, origin
+
+
+def overlay_onto(
+    input_path: str,
+    output_path: str,
+    list_path: str,
+    origin: Tuple[int, int],
+    encoder_params: List[str],
+    codec: str = "qtrle",
+    size: Optional[Tuple[int, int]] = None
+):
+    """Overlay the caption track onto the original video in a single ffmpeg pass"""
+    base = '[0:v]'
+    if size is not None:
+        base = f'[0:v]scale={size[0]}:{size[1]}[base];[base]'
+
+    command = ['ffmpeg', '-y', '-v', 'error', '-i', input_path]
+    if codec == "vp9":
+        # The native VP9 decoder drops the alpha plane
+        command += ['-c:v', 'libvpx-vp9']
+    command += [
+        '-f', 'concat', '-safe', '0', '-i', list_path,
+        '-filter_complex', f'{base}[1:v]overlay={origin[0]}:{origin[1]}:eof_action=pass[v]',
+        '-map', '[v]', '-map', '0:a:0?'
+    ] + audio_codec_args(input_path, output_path) + encoder_params + [output_path]
+
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg overlay failed: {result.stderr}")
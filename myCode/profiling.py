@@ -0,0 +1,139 @@
+from typing import Callable, Dict, List, Optional
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+import numpy as np
+
+
+class Profiler:
+    """Record wall and CPU time per pipeline stage, plus per-frame timing samples"""
+    def __init__(self, name: str = "pipeline", enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self._origin = time.perf_counter()
+        self._stages: List[Dict] = []
+        self._frames: Dict[str, List] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block as one named stage; nested stages are kept as separate entries"""
+        if not self.enabled:
+            yield
+            return
+
+        start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+            with self._lock:
+                self._stages.append({
+                    "name": name,
+                    "start": start - self._origin,
+                    "wall": wall,
+                    "cpu": cpu,
+                    "thread": threading.get_ident()
+                })
+
+    def timed(self, name: str, func: Callable) -> Callable:
+        """Wrap a per-frame callable so each call is recorded as a frame sample"""
+        if not self.enabled:
+            return func
+
+        samples = self._frames.setdefault(name, [])
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                samples.append((start - self._origin, time.perf_counter() - start))
+        return wrapper
+
+    def report(self) -> Dict:
+        """Machine-readable summary: every stage, per-stage totals and frame percentiles"""
+        totals: Dict[str, Dict] = {}
+        for entry in self._stages:
+            total = totals.setdefault(entry["name"], {"calls": 0, "wall": 0.0, "cpu": 0.0})
+            total["calls"] += 1
+            total["wall"] += entry["wall"]
+            total["cpu"] += entry["cpu"]
+
+        frames = {}
+        for name, samples in self._frames.items():
+            if not samples:
+                continue
+            durations = np.array([duration for _, duration in samples]) * 1000
+            p50, p90, p99 = np.percentile(durations, [50, 90, 99])
+            frames[name] = {
+                "count": len(samples),
+                "total_ms": float(durations.sum()),
+                "mean_ms": float(durations.mean()),
+                "p50_ms": float(p50),
+                "p90_ms": float(p90),
+                "p99_ms": float(p99),
+                "max_ms": float(durations.max())
+            }
+
+        return {
+            "name": self.name,
+            "wall": time.perf_counter() - self._origin,
+            "stages": [
+                {key: entry[key] for key in ("name", "start", "wall", "cpu")}
+                for entry in self._stages
+            ],
+            "totals": totals,
+            "frames": frames
+        }
+
+    def write_report(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def write_trace(self, path: str):
+        """Write a Chrome trace (chrome://tracing, Perfetto) of stages and frame samples"""
+        pid = os.getpid()
+        events = [
+            {
+                "name": entry["name"], "cat": "stage", "ph": "X",
+                "ts": entry["start"] * 1e6, "dur": entry["wall"] * 1e6,
+                "pid": pid, "tid": entry["thread"],
+                "args": {"cpu_ms": entry["cpu"] * 1000}
+            }
+            for entry in self._stages
+        ]
+        # One track per frame callable, so samples do not hide the stages
+        for track, (name, samples) in enumerate(self._frames.items(), start=1):
+            events.append({
+                "name": "thread_name", "ph": "M", "pid": pid, "tid": track,
+                "args": {"name": f"frames: {name}"}
+            })
+            events.extend(
+                {
+                    "name": name, "cat": "frame", "ph": "X",
+                    "ts": start * 1e6, "dur": duration * 1e6,
+                    "pid": pid, "tid": track
+                }
+                for start, duration in samples
+            )
+
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def save(self, report_path: Optional[str] = None, trace_path: Optional[str] = None):
+        """Write whichever outputs were requested"""
+        if not self.enabled:
+            return
+        if report_path is not None:
+            self.write_report(report_path)
+            print(f"Profile report saved to: {report_path}")
+        if trace_path is not None:
+            self.write_trace(trace_path)
+            print(f"Chrome trace saved to: {trace_path}")
+
+
+# Default for callers that do not profile
+NULL_PROFILER = Profiler(enabled=False)
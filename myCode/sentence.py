@@ -4,85 +4,75 @@ import subprocess
 import os
 import numpy as np
 from moviepy.config import change_settings
-import whisper
 import librosa
 import torch
 
+from compositor import caption_position, composite_clips, composite_frame
+from ffmpeg_pipe import check_engine, render_clips
+from profiling import Profiler, NULL_PROFILER
+from transcription import transcribe
+from audio import DecodedAudio, last_voiced_frames, map_frames
+
 # Configure MoviePy to use ImageMagick
 change_settings({"IMAGEMAGICK_BINARY": "convert"})
 
-def get_audio_features(video_path):
-    """Extract audio features for better word boundary detection"""
-    # Extract audio from video
-    video = VideoFileClip(video_path)
-    audio = video.audio
-
-    # Save audio temporarily
-    temp_audio = "temp_audio.wav"
-    audio.write_audiofile(temp_audio, fps=16000, nbytes=2, codec='pcm_s16le')
-
-    # Load audio with librosa for better music analysis
-    y, sr = librosa.load(temp_audio)
+def get_audio_features(audio):
+    """RMS energy envelope of the audio, for extending word ends over sustained vocals"""
+    # Analyse the samples Whisper hears, at their native rate, instead of a second decode
+    if isinstance(audio, str):
+        audio = DecodedAudio(audio)
+    y, sr = audio.samples, audio.sample_rate
 
-    # Get onset strength for detecting word boundaries in music
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-    onset_frames = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr)
-    onset_times = librosa.frames_to_time(onset_frames, sr=sr)
+    # Features are computed window by window, so a memory-mapped store is never loaded whole
+    hop_length = 512
 
     # Get RMS energy for detecting sustained vocals
-    rms = librosa.feature.rms(y=y)[0]
-    rms_times = librosa.times_like(rms, sr=sr)
-
-    # Clean up
-    os.remove(temp_audio)
-    video.close()
-    audio.close()
-
-    return onset_times, rms, rms_times
+    rms = map_frames(y, hop_length, lambda w: librosa.feature.rms(y=w, hop_length=hop_length)[0])
+    rms_times = librosa.times_like(rms, sr=sr, hop_length=hop_length)
 
-def adjust_word_timing(word, start, end, onset_times, rms, rms_times, next_word_start=None):
-    """Adjust word timing based on audio features"""
-    # Find relevant RMS segment
-    start_idx = np.searchsorted(rms_times, start)
-    end_idx = np.searchsorted(rms_times, end)
+    return rms, rms_times
 
-    if start_idx >= len(rms) or end_idx >= len(rms):
-        return start, end
+def adjust_word_timings(starts, ends, next_starts, rms, rms_times):
+    """Adjust every word's end time based on audio features in one pass
 
-    word_rms = rms[start_idx:end_idx+1]
+    Ends extend to the last sustained vocal frame of the word, stopping
+    100ms before the next word (NaN when there is none) and at most 5
+    seconds after the word's start.
+    """
+    n_frames = len(rms)
+    if n_frames == 0:
+        return ends
 
-    # Find sustained vocals
-    threshold = np.mean(word_rms) * 0.3
-    is_voiced = word_rms > threshold
+    # Find relevant RMS segment of every word
+    start_idx = np.searchsorted(rms_times, starts)
+    end_idx = np.searchsorted(rms_times, ends)
+    in_range = (start_idx < n_frames) & (end_idx < n_frames)
 
-    if len(is_voiced) > 0:
-        # Extend end time if we detect sustained vocals
-        voiced_regions = np.where(is_voiced)[0]
-        if len(voiced_regions) > 0:
-            last_voiced = voiced_regions[-1]
-            potential_end = rms_times[start_idx + last_voiced]
+    first = np.minimum(start_idx, n_frames)
+    stop = np.clip(end_idx + 1, first, n_frames)
+    found, last_voiced = last_voiced_frames(rms, first, stop, 0.3)
 
-            # If there's a next word, don't overlap more than 100ms
-            if next_word_start is not None:
-                potential_end = min(potential_end, next_word_start - 0.1)
+    # If there's a next word, don't overlap more than 100ms
+    potential_ends = rms_times[np.minimum(last_voiced, n_frames - 1)]
+    potential_ends = np.where(np.isnan(next_starts), potential_ends, np.minimum(potential_ends, next_starts - 0.1))
 
-            # Ensure minimum duration and maximum extension
-            end = max(end, min(potential_end, start + 5.0))  # Max 5 seconds per word
+    # Ensure minimum duration and maximum extension
+    adjusted = np.maximum(ends, np.minimum(potential_ends, starts + 5.0))  # Max 5 seconds per word
+    return np.where(in_range & found, adjusted, ends)
 
-    return start, end
-
-def get_word_timings(video_path):
+def get_word_timings(video_path, profiler=NULL_PROFILER, store_path=None, draft_model=None):
     """Get word-level timestamps using Whisper with music optimization"""
-    print("Loading Whisper model...")
-    # Use larger model for better accuracy with music
-    model = whisper.load_model("large")
-
-    print("Extracting audio features...")
-    onset_times, rms, rms_times = get_audio_features(video_path)
+    # One 16 kHz decode feeds both Whisper and the onset/RMS analysis
+    with profiler.stage("audio_extraction"):
+        audio = DecodedAudio(video_path, store_path=store_path)
 
     print("Transcribing audio...")
-    result = model.transcribe(
-        video_path,
+    result = transcribe(
+        audio,
+        draft_model or "large",
+        escalate_to="large" if draft_model else None,  # Tiered: only the draft's unsure segments go to large
+        vad=False,  # Sung vocals over a steady backing track can read as music to the detector
+        profiler=profiler,
         language="en",
         word_timestamps=True,
         condition_on_previous_text=True,
@@ -92,35 +82,41 @@ def get_word_timings(video_path):
         compression_ratio_threshold=2.4,
         beam_size=5
     )
+    if not result['segments']:
+        return []
 
-    words_with_times = []
-    if 'segments' in result:
-        for segment in result['segments']:
-            if 'words' in segment:
-                for i, word_data in enumerate(segment['words']):
-                    word = word_data['word'].strip()
-                    if not word:
-                        continue
-
-                    start = word_data['start']
-                    end = word_data['end']
-
-                    # Get next word's start time if available
-                    next_word_start = None
-                    if i < len(segment['words']) - 1:
-                        next_word_start = segment['words'][i + 1]['start']
-
-                    # Adjust timing based on audio features
-                    adjusted_start, adjusted_end = adjust_word_timing(
-                        word, start, end, onset_times, rms, rms_times, next_word_start
-                    )
+    print("Extracting audio features...")
+    with profiler.stage("audio_features"):
+        rms, rms_times = get_audio_features(audio)
 
-                    words_with_times.append({
-                        'word': word,
-                        'start': adjusted_start,
-                        'end': adjusted_end,
-                        'confidence': word_data.get('confidence', 0.0)
-                    })
+    with profiler.stage("word_grouping"):
+        words = []
+        next_starts = []
+        for segment in result['segments']:
+            segment_words = segment.get('words', [])
+            for i, word_data in enumerate(segment_words):
+                if not word_data['word'].strip():
+                    continue
+                words.append(word_data)
+                # Get next word's start time if available
+                next_starts.append(
+                    segment_words[i + 1]['start'] if i < len(segment_words) - 1 else np.nan
+                )
+
+    with profiler.stage("word_refinement"):
+        starts = np.array([word_data['start'] for word_data in words], dtype=np.float64)
+        ends = np.array([word_data['end'] for word_data in words], dtype=np.float64)
+        adjusted_ends = adjust_word_timings(starts, ends, np.array(next_starts, dtype=np.float64), rms, rms_times)
+
+        words_with_times = [
+            {
+                'word': word_data['word'].strip(),
+                'start': float(start),
+                'end': float(end),
+                'confidence': word_data.get('confidence', 0.0)
+            }
+            for word_data, start, end in zip(words, starts, adjusted_ends)
+        ]
 
     print(f"Found {len(words_with_times)} words in the audio")
     return words_with_times
@@ -145,14 +141,20 @@ def create_caption_clip(word_data, video_width, video_height):
                          stroke_width=4)  # Thicker stroke for better visibility
                  .set_start(word_data['start'])
                  .set_duration(word_data['end'] - word_data['start'])
-                 .set_position(('center', 0.85, 'center'))  # Position near bottom
                  .set_opacity(opacity))
 
-    return text_clip
+    # Position near bottom
+    return text_clip.set_position(caption_position(text_clip.size, video_width, video_height))
 
-def add_live_captions(video_path, output_path):
+def add_live_captions(video_path, output_path, engine="moviepy", profile_path=None, trace_path=None, draft_model=None):
     """Main function optimized for music videos"""
     print("Starting video processing...")
+    profiler = Profiler(
+        "sentence",
+        enabled=profile_path is not None or trace_path is not None
+    )
+    # Decoded PCM is memory-mapped from disk next to the output, not held in RAM
+    store_path = os.path.splitext(output_path)[0] + '_audio.npy'
 
     try:
         video = VideoFileClip(video_path)
@@ -163,42 +165,55 @@ def add_live_captions(video_path, output_path):
         print(f"Video FPS: {video.fps}")
 
         print("Getting word timings...")
-        word_timings = get_word_timings(video_path)
+        word_timings = get_word_timings(video_path, profiler, store_path, draft_model)
 
         if not word_timings:
             print("No words were detected in the audio.")
             return
 
         print("Creating caption clips...")
-        text_clips = []
-
-        # Process words with overlap consideration
-        for i, word_data in enumerate(word_timings):
-            if word_data['word'].strip():
-                try:
-                    clip = create_caption_clip(word_data, video.w, video.h)
-                    text_clips.append(clip)
-                except Exception as e:
-                    print(f"Error with word {word_data['word']}: {e}")
-                    continue
-            print(f"Processed {i+1}/{len(word_timings)} words")
-
-        print("Compositing final video...")
-        final_video = CompositeVideoClip([video] + text_clips)
-        final_video.fps = video.fps
-
-        print("Writing final video...")
-        final_video.write_videofile(
-            output_path,
-            codec='libx264',
-            audio_codec='aac',
-            threads=8,
-            fps=video.fps,
-            bitrate="6000k",  # Higher bitrate for better quality
-            preset='medium',  # Better quality preset
-            audio=True,
-            logger=None
-        )
+        with profiler.stage("caption_clips"):
+            text_clips = []
+
+            # Process words with overlap consideration
+            for i, word_data in enumerate(word_timings):
+                if word_data['word'].strip():
+                    try:
+                        clip = create_caption_clip(word_data, video.w, video.h)
+                        text_clips.append(clip)
+                    except Exception as e:
+                        print(f"Error with word {word_data['word']}: {e}")
+                        continue
+                print(f"Processed {i+1}/{len(word_timings)} words")
+
+        if check_engine(engine) == "ffmpeg":
+            print("Writing final video through ffmpeg...")
+            with profiler.stage("encode"):
+                render_clips(
+                    video_path,
+                    output_path,
+                    text_clips,
+                    encoder_params=['-c:v', 'libx264', '-preset', 'medium', '-b:v', '6000k', '-threads', '8'],
+                    composite=profiler.timed("composite", composite_frame)
+                )
+        else:
+            print("Compositing final video...")
+            final_video = composite_clips(video, text_clips, profiler.timed)
+            final_video.fps = video.fps
+
+            print("Writing final video...")
+            with profiler.stage("encode"):
+                final_video.write_videofile(
+                    output_path,
+                    codec='libx264',
+                    audio_codec='aac',
+                    threads=8,
+                    fps=video.fps,
+                    bitrate="6000k",  # Higher bitrate for better quality
+                    preset='medium',  # Better quality preset
+                    audio=True,
+                    logger=None
+                )
 
     except Exception as e:
         print(f"An error occurred: {str(e)}")
@@ -206,13 +221,17 @@ def add_live_captions(video_path, output_path):
 
     finally:
         # Clean up
-        try:
-            video.close()
-            final_video.close()
-            for clip in text_clips:
-                clip.close()
-        except:
-            pass
+        with profiler.stage("cleanup"):
+            try:
+                video.close()
+                final_video.close()
+                for clip in text_clips:
+                    clip.close()
+            except:
+                pass
+            if os.path.exists(store_path):
+                os.remove(store_path)
+        profiler.save(profile_path, trace_path)
 
     print("Video processing complete!")
 
@@ -0,0 +1,103 @@
+from typing import List, Hashable, Optional, Tuple
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+from moviepy.editor import TextClip
+from PIL import ImageColor
+
+
+class LRUByteCache:
+    """Least-recently-used cache of numpy arrays bounded by their total size"""
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items = OrderedDict()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        """Return the cached array and mark it as recently used"""
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: np.ndarray):
+        """Store an array, evicting the oldest entries once over budget"""
+        if key in self._items:
+            self.nbytes -= self._items.pop(key).nbytes
+        self._items[key] = value
+        self.nbytes += value.nbytes
+
+        # Always keep the newest entry, even if it alone exceeds the budget
+        while self.nbytes > self.max_bytes and len(self._items) > 1:
+            _, evicted = self._items.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+
+@lru_cache(maxsize=1024)
+def parse_color(color: str) -> Tuple[int, int, int]:
+    """Convert a color name, hex or rgb(r,g,b) string into an RGB tuple"""
+    return ImageColor.getrgb(color)[:3]
+
+
+def textclip_to_rgba(clip: TextClip) -> np.ndarray:
+    """Rasterize a TextClip once into an RGBA uint8 array"""
+    rgb = clip.get_frame(0)
+    if clip.mask is not None:
+        alpha = np.round(clip.mask.get_frame(0) * 255)
+    else:
+        alpha = np.full(rgb.shape[:2], 255)
+    return np.dstack([rgb, alpha]).astype(np.uint8)
+
+
+def textclip_to_mask(clip: TextClip) -> np.ndarray:
+    """Rasterize a white-on-black-stroke TextClip into a (fill, alpha) mask pair"""
+    rgba = textclip_to_rgba(clip)
+    return np.dstack([rgba[:, :, 0], rgba[:, :, 3]])
+
+
+def tint_mask(
+    mask: np.ndarray,
+    color: Tuple[int, int, int],
+    stroke_color: Tuple[int, int, int] = (0, 0, 0)
+) -> np.ndarray:
+    """Color a (fill, alpha) mask pair into an RGBA sprite"""
+    fill = mask[:, :, 0:1].astype(np.uint32)
+    rgb = (
+        fill * np.array(color, dtype=np.uint32)
+        + (255 - fill) * np.array(stroke_color, dtype=np.uint32)
+        + 127
+    ) // 255
+    return np.dstack([rgb.astype(np.uint8), mask[:, :, 1]])
+
+
+def blit(canvas: np.ndarray, sprite: np.ndarray, x: int, y: int):
+    """Copy a sprite into a canvas at (x, y), clipped to the canvas bounds"""
+    h, w = canvas.shape[:2]
+    sh, sw = sprite.shape[:2]
+
+    # Visible part of the sprite after clipping
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + sw, w), min(y + sh, h)
+    if x0 >= x1 or y0 >= y1:
+        return
+
+    canvas[y0:y1, x0:x1] = sprite[y0 - y:y1 - y, x0 - x:x1 - x]
+
+
+def hstack_sprites(sprites: List[np.ndarray], height: int, spacing: int = 0) -> np.ndarray:
+    """Lay RGBA sprites out left to right on a transparent strip"""
+    width = sum(s.shape[1] for s in sprites) + spacing * max(len(sprites) - 1, 0)
+    strip = np.zeros((height, width, 4), dtype=np.uint8)
+
+    x_offset = 0
+    for sprite in sprites:
+        blit(strip, sprite, x_offset, 0)
+        x_offset += sprite.shape[1] + spacing
+
+    return strip
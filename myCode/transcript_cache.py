@@ -0,0 +1,124 @@
+from typing import Dict, Optional
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+# Only what the captioners read, to keep entries small
+SEGMENT_KEYS = ("start", "end", "text", "avg_logprob", "no_speech_prob")
+WORD_KEYS = ("word", "start", "end", "probability")
+
+# Options that change the transcript; anything else (e.g. verbose) is ignored
+KEY_OPTIONS = (
+    "language", "task", "temperature", "initial_prompt", "beam_size", "best_of",
+    "patience", "condition_on_previous_text", "word_timestamps", "no_speech_threshold",
+    "compression_ratio_threshold", "logprob_threshold", "prepend_punctuations",
+    "append_punctuations", "fp16"
+)
+
+
+def cache_key(audio_hash: str, model_name: str, options: Dict) -> str:
+    """Content address of a transcript: decoded audio, model and transcribe options"""
+    relevant = {k: options[k] for k in KEY_OPTIONS if k in options}
+    payload = json.dumps([audio_hash, model_name, relevant], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def compact_result(result: Dict) -> Dict:
+    """Drop token ids and other fields nothing downstream uses"""
+    return {
+        "text": result.get("text", ""),
+        "language": result.get("language"),
+        "segments": [
+            dict(
+                {k: segment[k] for k in SEGMENT_KEYS if k in segment},
+                words=[
+                    {k: word[k] for k in WORD_KEYS if k in word}
+                    for word in segment.get("words", [])
+                ]
+            )
+            for segment in result.get("segments", [])
+        ]
+    }
+
+
+class TranscriptCache:
+    """Gzipped JSON transcripts on disk with size-bounded LRU eviction
+
+    Writes go to a temporary file in the same directory and are moved into
+    place with os.replace, so concurrent processes never see a partial entry.
+    Reads refresh the file's mtime, which orders eviction.
+    """
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json.gz")
+
+    def get(self, key: str) -> Optional[Dict]:
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                result = json.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, ValueError):
+            # Truncated or corrupt: drop the entry so the next put rewrites it
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return result
+
+    def put(self, key: str, result: Dict):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+                f.write(json.dumps(compact_result(result), separators=(",", ":")).encode("utf-8"))
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json.gz"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # Evicted by another process
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+TRANSCRIPT_CACHE = TranscriptCache(
+    os.environ.get(
+        "TRANSCRIPT_CACHE_DIR",
+        os.path.join(os.path.expanduser("~"), ".cache", "captioner", "transcripts")
+    ),
+    int(os.environ.get("TRANSCRIPT_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+)
@@ -0,0 +1,144 @@
+from typing import Dict, List, Optional, Sequence, Union
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+import numpy as np
+
+from audio import SAMPLE_RATE, DecodedAudio
+from model_pool import MODEL_POOL
+from profiling import Profiler, NULL_PROFILER
+from transcript_cache import TRANSCRIPT_CACHE, TranscriptCache, cache_key
+from chunked_transcribe import transcribe_chunked
+from batch_transcribe import batch_transcriber
+from escalation import transcribe_tiered
+from vad import speech_regions, extract_speech
+
+
+def empty_result(language: Optional[str] = None) -> Dict:
+    return {"text": "", "segments": [], "language": language}
+
+
+def transcribe(
+    media: Union[str, DecodedAudio],
+    model_name: str,
+    device: Optional[str] = None,
+    profiler: Profiler = NULL_PROFILER,
+    cache: Optional[TranscriptCache] = TRANSCRIPT_CACHE,
+    chunk_seconds: Optional[float] = None,
+    workers: Optional[int] = None,
+    vad: bool = True,
+    batched: bool = False,
+    escalate_to: Optional[str] = None,
+    **options
+) -> Dict:
+    """Whisper transcription that reuses a cached transcript of the same audio
+
+    The cache key covers the decoded audio, the model and the options, so a
+    style-only re-render never loads a model. With chunk_seconds, long audio
+    is split at pauses and the chunks are transcribed in a process pool, or
+    batched together when batched is set.
+    With vad, Whisper only hears the detected speech regions; sources without
+    audio or speech return an empty result before any model is loaded.
+    Pass a DecodedAudio to share one decode with other analysis of the file.
+    With batched, every Whisper call goes through the process-wide
+    BatchTranscriber, whose windows are decoded in batches with those of
+    concurrent calls. With escalate_to, model_name drafts the transcript and
+    only its low-confidence segments are transcribed again by the
+    escalate_to model. Escalation is not done per chunk, so it cannot be
+    combined with chunk_seconds.
+    """
+    if escalate_to is not None and chunk_seconds is not None:
+        raise ValueError("escalate_to cannot be combined with chunk_seconds")
+    if isinstance(media, str):
+        # Decode once: the same samples are hashed for the cache and fed to Whisper
+        with profiler.stage("audio_extraction"):
+            media = DecodedAudio(media)
+    if not media.has_audio:
+        print("No audio stream found, skipping transcription")
+        return empty_result(options.get("language"))
+
+    if cache is not None:
+        with profiler.stage("audio_hash"):
+            # Chunking, VAD, escalation and batching change the transcript, so they get their own entries
+            cache_model = model_name
+            if chunk_seconds is not None:
+                cache_model += f"@chunks{chunk_seconds:g}"
+            if vad:
+                cache_model += "+vad"
+            if escalate_to is not None:
+                cache_model += f">{escalate_to}"
+            if batched:
+                cache_model += "+batched"
+            key = cache_key(media.digest, cache_model, options)
+        result = cache.get(key)
+        if result is not None:
+            print("Using cached transcription")
+            return result
+
+    samples = media.samples
+    timeline = None
+    if vad:
+        with profiler.stage("vad"):
+            regions = speech_regions(samples)
+        if not regions:
+            # Not cached: a detector miss would otherwise hide the audio from Whisper for good
+            print("No speech detected, skipping transcription")
+            return empty_result(options.get("language"))
+
+        speech_seconds = sum(end - start for start, end in regions)
+        print(f"Speech detected in {speech_seconds:.1f}s of {len(samples) / SAMPLE_RATE:.1f}s of audio")
+        samples, timeline = extract_speech(samples, regions)
+
+    if chunk_seconds is not None and batched:
+        with profiler.stage("transcription"), batch_transcriber(model_name, device) as service:
+            # Windows are submitted from threads so they share batches instead of taking turns
+            result = transcribe_chunked(
+                samples, model_name, device,
+                workers=workers, max_seconds=chunk_seconds, transcriber=service, **options
+            )
+    elif chunk_seconds is not None:
+        with profiler.stage("transcription"):
+            result = transcribe_chunked(
+                samples, model_name, device,
+                workers=workers, max_seconds=chunk_seconds, **options
+            )
+    else:
+        # The only place the whole (speech) audio is loaded: Whisper computes one spectrogram over
+        # its input. Until here a PcmStore, and the speech view over it, are read in windows;
+        # chunk_seconds keeps peak memory bounded by the window size instead.
+        audio = np.asarray(samples[:])
+        if escalate_to is not None:
+            result = transcribe_tiered(audio, model_name, escalate_to, device, profiler, batched=batched, **options)
+        elif batched:
+            with profiler.stage("transcription"), batch_transcriber(model_name, device) as service:
+                result = service.transcribe(audio, **options)
+        else:
+            with ExitStack() as stack:
+                # Pinned, so a concurrent load of another model cannot evict it mid-transcription
+                with profiler.stage("model_load"):
+                    model = stack.enter_context(MODEL_POOL.use(model_name, device))
+
+                with profiler.stage("transcription"):
+                    result = model.transcribe(audio, **options)
+
+    if timeline is not None:
+        result = timeline.remap(result)
+
+    if cache is not None:
+        cache.put(key, result)
+    return result
+
+
+def transcribe_many(
+    media: Sequence[Union[str, DecodedAudio]],
+    model_name: str,
+    device: Optional[str] = None,
+    jobs: int = 4,
+    **options
+) -> List[Dict]:
+    """Transcribe several files concurrently, sharing batched decoding of one model"""
+    # Held open across the files so they all join one service, released when the last one is done
+    with batch_transcriber(model_name, device), ThreadPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(
+            lambda item: transcribe(item, model_name, device, batched=True, **options),
+            media
+        ))
@@ -0,0 +1,178 @@
+from typing import Dict, List, Tuple
+from bisect import bisect_right
+import numpy as np
+
+from audio import SAMPLE_RATE
+
+Region = Tuple[float, float]
+
+
+def frame_features(
+    samples: np.ndarray,
+    sample_rate: int = SAMPLE_RATE,
+    frame_seconds: float = 0.03,
+    block_frames: int = 8192
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-frame level in dBFS and spectral flatness, computed in blocks to bound memory"""
+    frame = max(int(frame_seconds * sample_rate), 1)
+    n_frames = len(samples) // frame
+    window = np.hanning(frame).astype(np.float32)
+
+    level = np.empty(n_frames, dtype=np.float32)
+    flatness = np.empty(n_frames, dtype=np.float32)
+    for lo in range(0, n_frames, block_frames):
+        hi = min(lo + block_frames, n_frames)
+        frames = samples[lo * frame:hi * frame].reshape(hi - lo, frame).astype(np.float32)
+
+        power = np.einsum('ij,ij->i', frames, frames) / frame
+        level[lo:hi] = 10 * np.log10(power + 1e-10)
+
+        # Geometric over arithmetic mean of the power spectrum: ~1 for noise, ~0 for tones
+        spectrum = np.abs(np.fft.rfft(frames * window, axis=1)) ** 2 + 1e-10
+        flatness[lo:hi] = np.exp(np.log(spectrum).mean(axis=1)) / spectrum.mean(axis=1)
+
+    return level, flatness
+
+
+def _runs(mask: np.ndarray) -> List[Tuple[int, int]]:
+    """(start, end) index pairs of each run of True"""
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+def speech_regions(
+    samples: np.ndarray,
+    sample_rate: int = SAMPLE_RATE,
+    frame_seconds: float = 0.03,
+    min_level_db: float = -50.0,
+    noise_margin_db: float = 10.0,
+    max_flatness: float = 0.5,
+    min_modulation_db: float = 3.0,
+    min_speech: float = 0.25,
+    merge_gap: float = 0.5,
+    padding: float = 0.2
+) -> List[Region]:
+    """Time ranges that likely contain speech, from frame energy and spectral flatness
+
+    A frame is voiced when it is louder than both min_level_db and the noise
+    floor plus noise_margin_db, and not noise-like. Runs closer than
+    merge_gap are joined. Regions whose level barely moves (steady
+    instrumental music, hum) are dropped: speech swings with its syllables.
+    """
+    level, flatness = frame_features(samples, sample_rate, frame_seconds)
+    if len(level) == 0:
+        return []
+
+    noise_floor = np.percentile(level, 10)
+    voiced = (level > max(min_level_db, noise_floor + noise_margin_db)) & (flatness < max_flatness)
+
+    # Close short gaps between voiced runs
+    gap_frames = int(merge_gap / frame_seconds)
+    for start, end in _runs(~voiced):
+        if start > 0 and end < len(voiced) and end - start <= gap_frames:
+            voiced[start:end] = True
+
+    duration = len(samples) / sample_rate
+    regions = []
+    for start, end in _runs(voiced):
+        if (end - start) * frame_seconds < min_speech:
+            continue
+        if np.std(level[start:end]) < min_modulation_db:
+            continue
+        region = (
+            max(start * frame_seconds - padding, 0.0),
+            min(end * frame_seconds + padding, duration)
+        )
+        if regions and region[0] <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], region[1])
+        else:
+            regions.append(region)
+    return regions
+
+
+class TimelineMap:
+    """Maps times in speech-only audio (regions joined by short gaps) back to the source"""
+    def __init__(self, regions: List[Region], gap: float = 0.3):
+        self.regions = regions
+        self.gap = gap
+        self._starts = []
+        cursor = 0.0
+        for start, end in regions:
+            self._starts.append(cursor)
+            cursor += (end - start) + gap
+
+    def to_source(self, t: float) -> float:
+        index = max(bisect_right(self._starts, t) - 1, 0)
+        start, end = self.regions[index]
+        # Times inside a joining gap stick to the end of the region before it
+        return min(start + (t - self._starts[index]), end)
+
+    def remap(self, result: Dict) -> Dict:
+        """Shift every segment and word timestamp of a Whisper result to the source timeline"""
+        segments = []
+        for segment in result.get("segments", []):
+            words = [
+                dict(word, start=self.to_source(word["start"]), end=self.to_source(word["end"]))
+                for word in segment.get("words", [])
+            ]
+            segments.append(dict(
+                segment,
+                start=self.to_source(segment["start"]),
+                end=self.to_source(segment["end"]),
+                words=words
+            ))
+        return dict(result, segments=segments)
+
+
+class JoinedRegions:
+    """Sample ranges of a source joined by silent gaps, assembled one window at a time
+
+    Slicing reads just the source samples that window covers, so speech
+    extracted from a memory-mapped PcmStore stays on disk until it is read.
+    """
+    dtype = np.dtype(np.float32)
+
+    def __init__(self, samples: np.ndarray, bounds: List[Tuple[int, int]], gap: int):
+        self.samples = samples
+        self.bounds = bounds
+        self.gap = gap
+        self._starts = []
+        cursor = 0
+        for lo, hi in bounds:
+            self._starts.append(cursor)
+            cursor += (hi - lo) + gap
+        self._length = cursor
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, key: slice) -> np.ndarray:
+        start, stop, step = key.indices(self._length)
+        if step != 1:
+            raise ValueError("JoinedRegions only supports contiguous slices")
+        window = np.zeros(max(stop - start, 0), dtype=np.float32)
+        index = max(bisect_right(self._starts, start) - 1, 0)
+        while index < len(self.bounds) and self._starts[index] < stop:
+            (lo, hi), offset = self.bounds[index], self._starts[index]
+            first, last = max(start, offset), min(stop, offset + hi - lo)
+            if first < last:
+                window[first - start:last - start] = self.samples[lo + first - offset:lo + last - offset]
+            index += 1
+        return window
+
+
+def extract_speech(
+    samples: np.ndarray,
+    regions: List[Region],
+    sample_rate: int = SAMPLE_RATE,
+    gap: float = 0.3
+) -> Tuple[JoinedRegions, TimelineMap]:
+    """Join the speech regions with short silences and return the map back to the source
+
+    The joined audio is a lazy JoinedRegions view; nothing is copied until it is sliced.
+    """
+    bounds = [(int(start * sample_rate), int(end * sample_rate)) for start, end in regions]
+    gap_samples = int(gap * sample_rate)
+    # The map uses the sample-grid edges, so offsets match the joined audio exactly
+    exact = [(lo / sample_rate, hi / sample_rate) for lo, hi in bounds]
+    return JoinedRegions(samples, bounds, gap_samples), TimelineMap(exact, gap_samples / sample_rate)
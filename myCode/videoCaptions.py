@@ -1,42 +1,101 @@
-from typing import List, Optional, Tuple, Dict
+from typing import List, Optional, Tuple, Dict, Hashable, Callable
+from bisect import bisect_right
 from moviepy.editor import (
     VideoFileClip, AudioFileClip, TextClip, CompositeVideoClip,
     ColorClip, VideoClip
 )
-import whisper
 import numpy as np
 import os
 from multiprocessing import cpu_count
 
+from sprites import (
+    LRUByteCache, parse_color, textclip_to_mask, tint_mask,
+    hstack_sprites
+)
+from compositor import PremultipliedSprite, Placement, burn_in, composite_frame
+from ffmpeg_pipe import ENGINES, check_engine, probe_video, render_video
+from ass_export import write_ass, burn_in_ass
+from overlay_track import merge_spans, render_overlay_track, overlay_onto
+from profiling import Profiler
+from transcription import transcribe
+import shutil
+import tempfile
+
+# Optimized encoding settings for 1080p, shared by both render engines
+ENCODER_PARAMS = [
+    '-crf', '20',  # Quality setting (20 is high quality, visually lossless)
+    '-tune', 'fastdecode',
+    '-movflags', '+faststart',
+    '-bf', '2',
+    '-g', '30',
+    '-profile:v', 'high',
+    '-level', '4.1',  # Optimal for 1080p
+    '-bufsize', '20000k',  # Larger buffer size for better quality
+    '-maxrate', '25000k',  # Maximum bitrate
+    '-pix_fmt', 'yuv420p'  # Ensure compatibility
+]
+
+# Word masks are shared by every group and keyed by text, so repeated words
+# are rasterized once and memory stays flat on long videos
+MASK_CACHE = LRUByteCache(64 * 1024 * 1024)
+
 class WordAnimator:
-    def __init__(self, word: str, start_time: float, end_time: float):
+    def __init__(self, word: str, start_time: float, end_time: float, fade_steps: int = 8):
         self.word = word
         self.start_time = start_time
         self.end_time = end_time
         self.duration = end_time - start_time
+        self.fade_duration = 0.1  # Duration of fade in/out
+        self.fade_steps = fade_steps  # Distinct colors per fade (0 for continuous)
+
+    def change_points(self) -> Tuple[float, ...]:
+        """Times at which the word's color starts or stops changing"""
+        return (
+            self.start_time,
+            self.start_time + self.fade_duration,
+            self.end_time - self.fade_duration,
+            self.end_time
+        )
+
+    def is_fading(self, current_time: float) -> bool:
+        """Whether the color is mid-transition at the given time"""
+        return (
+            self.start_time < current_time < self.start_time + self.fade_duration
+            or self.end_time - self.fade_duration < current_time < self.end_time
+        )
 
     def get_color(self, current_time: float) -> str:
         """Get color based on word timing with smooth transition"""
-        fade_duration = 0.1  # Duration of fade in/out
+        fade_duration = self.fade_duration
 
         # Before word starts
         if current_time < self.start_time:
             return "white"
         # During fade in
         elif current_time < self.start_time + fade_duration:
-            progress = (current_time - self.start_time) / fade_duration
+            progress = self._quantize((current_time - self.start_time) / fade_duration)
             return self._interpolate_color("white", "lime", progress)
         # During main word display
         elif current_time < self.end_time - fade_duration:
             return "lime"
         # During fade out
         elif current_time < self.end_time:
-            progress = (self.end_time - current_time) / fade_duration
+            progress = self._quantize((self.end_time - current_time) / fade_duration)
             return self._interpolate_color("lime", "white", 1 - progress)
         # After word ends
         else:
             return "white"
 
+    def get_rgb(self, current_time: float) -> Tuple[int, int, int]:
+        """Get the word color at the given time as an RGB tuple"""
+        return parse_color(self.get_color(current_time))
+
+    def _quantize(self, progress: float) -> float:
+        """Snap fade progress to one of fade_steps levels"""
+        if self.fade_steps <= 0:
+            return progress
+        return round(progress * self.fade_steps) / self.fade_steps
+
     def _interpolate_color(self, color1: str, color2: str, progress: float) -> str:
         """Smoothly interpolate between two colors"""
         if color1 == "white" and color2 == "lime":
@@ -51,46 +110,103 @@ class WordAnimator:
             return f"rgb({r},{g},{b})"
 
 class CaptionGroup:
-    def __init__(self, words: List[Dict], font_size: int = 70, font: str = "Arial-Bold"):
+    def __init__(
+        self,
+        words: List[Dict],
+        font_size: int = 70,
+        font: str = "Arial-Bold",
+        fade_steps: int = 8
+    ):
         self.words = [
-            WordAnimator(w["word"], w["start"], w["end"])
+            WordAnimator(w["word"], w["start"], w["end"], fade_steps)
             for w in words
         ]
         self.start_time = words[0]["start"]
         self.end_time = words[-1]["end"]
         self.font_size = font_size
         self.font = font
-        self._clip_cache = {}  # Cache for word clips
-
-    def create_frame(self, t: float) -> VideoClip:
-        """Create a frame with animated words"""
-        word_clips = []
-        x_offset = 0
-
-        for word_animator in self.words:
-            color = word_animator.get_color(t)
-
-            # Create or get cached clip
-            cache_key = f"{word_animator.word}_{color}"
-            if cache_key not in self._clip_cache:
-                self._clip_cache[cache_key] = TextClip(
-                    txt=word_animator.word,
-                    fontsize=self.font_size,
-                    font=self.font,
-                    color=color,
-                    stroke_color='black',
-                    stroke_width=4,
-                    method='caption'
-                ).set_duration(0.1)
 
-            word_clip = self._clip_cache[cache_key]
-            word_clips.append(word_clip.set_position((x_offset, 0)))
-            x_offset += word_clip.w + 20
+    def _get_mask(self, word: str) -> np.ndarray:
+        """Rasterize a word once as a (fill, alpha) mask pair"""
+        cache_key = (word, self.font, self.font_size)
+        mask = MASK_CACHE.get(cache_key)
+        if mask is None:
+            mask = textclip_to_mask(TextClip(
+                txt=word,
+                fontsize=self.font_size,
+                font=self.font,
+                color='white',
+                stroke_color='black',
+                stroke_width=4,
+                method='caption'
+            ))
+            MASK_CACHE.put(cache_key, mask)
+        return mask
+
+    def create_frame(self, t: float) -> np.ndarray:
+        """Create an RGBA frame with animated words"""
+        sprites = [
+            tint_mask(self._get_mask(word_animator.word), word_animator.get_rgb(t))
+            for word_animator in self.words
+        ]
+        height = max(sprite.shape[0] for sprite in sprites)
+        return hstack_sprites(sprites, height, spacing=20)
+
+class CaptionTimeline:
+    """Sorted change-point schedule over all caption groups"""
+    def __init__(self, caption_groups: List[CaptionGroup]):
+        self.groups = sorted(caption_groups, key=lambda g: g.start_time)
+        self._group_starts = [g.start_time for g in self.groups]
+
+        # Every time at which the visible caption can change
+        points = set()
+        for group in self.groups:
+            points.update((group.start_time, group.end_time))
+            for word_animator in group.words:
+                points.update(word_animator.change_points())
+        self.change_points = sorted(points)
+
+        # Intervals between change points are static unless a word is mid-fade
+        self._fading = [
+            self._is_fading((a + b) / 2)
+            for a, b in zip(self.change_points, self.change_points[1:])
+        ]
 
-        return CompositeVideoClip(word_clips)
+    def _is_fading(self, t: float) -> bool:
+        group_index = self.group_index(t)
+        if group_index is None:
+            return False
+        return any(w.is_fading(t) for w in self.groups[group_index].words)
+
+    def group_index(self, t: float) -> Optional[int]:
+        """Index of the caption group shown at time t, if any"""
+        i = bisect_right(self._group_starts, t) - 1
+        if i >= 0 and t <= self.groups[i].end_time:
+            return i
+        return None
+
+    def state_at(self, t: float) -> Optional[Hashable]:
+        """Key identifying the visual state at time t (None when nothing is shown)"""
+        group_index = self.group_index(t)
+        if group_index is None:
+            return None
+
+        segment = bisect_right(self.change_points, t)
+        if 0 < segment < len(self.change_points) and self._fading[segment - 1]:
+            colors = tuple(w.get_color(t) for w in self.groups[group_index].words)
+            return (group_index, segment, colors)
+        return (group_index, segment)
 
 class VideoProcessor:
-    def __init__(self, input_path: str, output_path: str):
+    def __init__(
+        self,
+        input_path: str,
+        output_path: str,
+        engine: str = "moviepy",
+        profile_path: Optional[str] = None,
+        trace_path: Optional[str] = None,
+        draft_model: Optional[str] = None
+    ):
         self.input_path = input_path
         self.output_path = output_path
         self.video_size = (1920, 1080)  # Maintaining 1080p resolution
@@ -98,6 +214,17 @@ class VideoProcessor:
         self.font_size = 70
         self.font = "Arial-Bold"
         self.n_cores = max(cpu_count() - 1, 1)
+        self.fade_steps = 8
+        self.overlay_cache_bytes = 64 * 1024 * 1024
+        self.engine = check_engine(engine, ENGINES + ("ass", "overlay"))
+        self.profile_path = profile_path
+        self.trace_path = trace_path
+        self.profiler = Profiler(
+            "videoCaptions",
+            enabled=profile_path is not None or trace_path is not None
+        )
+        # Opt-in tiered mode: a smaller model drafts and only its unsure segments go to "small"
+        self.draft_model = draft_model
 
     def process(self):
         """Main processing pipeline"""
@@ -109,32 +236,75 @@ class VideoProcessor:
             video.close()
 
             transcriptions = self._transcribe_video()
-            caption_groups = [
-                CaptionGroup(t["words"], self.font_size, self.font)
-                for t in transcriptions
-            ]
-            caption_video = self._create_caption_video(caption_groups)
-            self._create_final_video(caption_video)
+            if not transcriptions:
+                print("No speech was found in the video, nothing to caption.")
+                return
+
+            if self.engine == "ass":
+                self._burn_in_ass(transcriptions)
+                print("Processing complete!")
+                return
+
+            with self.profiler.stage("caption_clips"):
+                caption_groups = [
+                    CaptionGroup(t["words"], self.font_size, self.font, self.fade_steps)
+                    for t in transcriptions
+                ]
+            caption_layer = self._create_caption_layer(caption_groups)
+            if self.engine == "overlay":
+                self._overlay_caption_track(caption_groups, caption_layer)
+            else:
+                self._create_final_video(caption_layer)
             print("Processing complete!")
         except Exception as e:
             print(f"An error occurred: {str(e)}")
             import traceback
             traceback.print_exc()
+        finally:
+            self.profiler.save(self.profile_path, self.trace_path)
+
+    def _burn_in_ass(self, transcriptions: List[Dict]):
+        """Render the white-to-lime word fades as ASS transforms in one ffmpeg pass"""
+        print("Burning in ASS karaoke captions...")
+        with tempfile.TemporaryDirectory() as work_dir:
+            ass_path = os.path.join(work_dir, "captions.ass")
+            with self.profiler.stage("caption_clips"):
+                fonts_dir = write_ass(
+                    transcriptions,
+                    ass_path,
+                    self.video_size,
+                    font=self.font,
+                    font_size=self.font_size,
+                    margin=150 - self.font_size,  # Matches the sprite placement near the bottom
+                    fade=0.1
+                )
+            with self.profiler.stage("encode"):
+                burn_in_ass(
+                    self.input_path,
+                    self.output_path,
+                    ass_path,
+                    encoder_params=[
+                        '-c:v', 'libx264',
+                        '-preset', 'veryfast',
+                        '-threads', str(self.n_cores)
+                    ] + ENCODER_PARAMS,
+                    fonts_dir=fonts_dir
+                )
 
     def _transcribe_video(self) -> List[Dict]:
-        """Extract audio and transcribe with word-level timing"""
-        print("Loading Whisper model...")
-        model = whisper.load_model("small")
-
-        print("Extracting audio and transcribing...")
-        audio_path = "temp_audio.wav"
-        video = VideoFileClip(self.input_path)
-        video.audio.write_audiofile(audio_path, fps=16000, verbose=False, logger=None)
-
-        result = model.transcribe(audio_path, language="en", word_timestamps=True)
-        os.remove(audio_path)
+        """Transcribe with word-level timing, reusing a cached transcript when the audio is unchanged"""
+        print("Transcribing audio...")
+        result = transcribe(
+            self.input_path,
+            self.draft_model or "small",
+            escalate_to="small" if self.draft_model else None,
+            profiler=self.profiler,
+            language="en",
+            word_timestamps=True
+        )
 
-        return self._process_transcription(result)
+        with self.profiler.stage("word_grouping"):
+            return self._process_transcription(result)
 
     def _process_transcription(self, result: Dict) -> List[Dict]:
         """Process whisper output into word groups"""
@@ -177,75 +347,109 @@ class VideoProcessor:
 
         return transcriptions
 
-    def _create_caption_video(self, caption_groups: List[CaptionGroup]) -> VideoClip:
-        """Create transparent video with animated captions (optimized for 1080p)"""
-        print("Creating animated caption video...")
-
-        # Pre-create background frame
-        bg = ColorClip(self.video_size, color=(0,0,0,0)).set_duration(0.1)
-        bg_frame = bg.get_frame(0)
-
-        def make_frame(t):
-            # Find the current caption group
-            current_group = None
-            for group in caption_groups:
-                if group.start_time <= t <= group.end_time:
-                    current_group = group
-                    break
-
-            if not current_group:
-                return bg_frame
-
-            # Create caption frame
-            caption = current_group.create_frame(t)
-
-            # Center the caption
-            x_pos = (self.video_size[0] - caption.w) // 2
-            y_pos = self.video_size[1] - 150  # Position captions near bottom
-            caption = caption.set_position((x_pos, y_pos))
-
-            return CompositeVideoClip([bg, caption]).get_frame(0)
-
-        video = VideoFileClip(self.input_path)
-        duration = video.duration
-        video.close()
-
-        return VideoClip(make_frame, duration=duration)
+    def _create_caption_layer(self, caption_groups: List[CaptionGroup]) -> Callable[[float], List[Placement]]:
+        """Create the animated caption layer as premultiplied sprites placed per frame"""
+        print("Creating animated caption layer...")
+
+        timeline = CaptionTimeline(caption_groups)
+        overlay_cache = LRUByteCache(self.overlay_cache_bytes)  # Sprites by visual state
+
+        def placements_at(t):
+            state = timeline.state_at(t)
+            if state is None:
+                return []
+
+            overlay = overlay_cache.get(state)
+            if overlay is None:
+                # Create caption frame
+                current_group = timeline.groups[state[0]]
+                caption = current_group.create_frame(t)
+
+                # Center the caption near the bottom
+                x_pos = (self.video_size[0] - caption.shape[1]) // 2
+                y_pos = self.video_size[1] - 150
+                overlay = PremultipliedSprite(caption, x_pos, y_pos)
+                overlay_cache.put(state, overlay)
+            return [(overlay, 0, 0)]
+
+        return self.profiler.timed("caption_render", placements_at)
+
+    def _overlay_caption_track(
+        self,
+        caption_groups: List[CaptionGroup],
+        caption_layer: Callable[[float], List[Placement]]
+    ):
+        """Encode only the visible caption spans, then overlay them in one ffmpeg pass"""
+        print("Rendering caption track...")
+        info = probe_video(self.input_path)
+        spans = merge_spans(
+            [(g.start_time, g.end_time) for g in caption_groups],
+            info['duration']
+        )
 
-    def _create_final_video(self, caption_video: VideoClip):
-        """Overlay captions on original video with optimized encoding"""
+        with tempfile.TemporaryDirectory() as work_dir:
+            with self.profiler.stage("overlay_track"):
+                track = render_overlay_track(
+                    caption_layer, spans, info['fps'], work_dir,
+                    state_at=CaptionTimeline(caption_groups).state_at
+                )
+            if track is None:
+                shutil.copyfile(self.input_path, self.output_path)
+                return
+
+            list_path, origin = track
+            with self.profiler.stage("encode"):
+                overlay_onto(
+                    self.input_path,
+                    self.output_path,
+                    list_path,
+                    origin,
+                    encoder_params=[
+                        '-c:v', 'libx264',
+                        '-preset', 'veryfast',
+                        '-threads', str(self.n_cores)
+                    ] + ENCODER_PARAMS
+                )
+
+    def _create_final_video(self, caption_layer: Callable[[float], List[Placement]]):
+        """Blend captions onto the original video with optimized encoding"""
         print("Creating final video...")
-        original_video = VideoFileClip(self.input_path)
-        final_video = CompositeVideoClip([original_video, caption_video])
-
-        # Optimized encoding settings for 1080p
-        final_video.write_videofile(
-            self.output_path,
-            codec='libx264',
-            audio_codec='aac',
-            temp_audiofile='temp_audio_final.m4a',
-            remove_temp=True,
-            fps=original_video.fps,
-            threads=self.n_cores,
-            preset='veryfast',  # Using veryfast preset for better speed
-            ffmpeg_params=[
-                '-crf', '20',  # Quality setting (20 is high quality, visually lossless)
-                '-tune', 'fastdecode',
-                '-movflags', '+faststart',
-                '-bf', '2',
-                '-g', '30',
-                '-profile:v', 'high',
-                '-level', '4.1',  # Optimal for 1080p
-                '-bufsize', '20000k',  # Larger buffer size for better quality
-                '-maxrate', '25000k',  # Maximum bitrate
-                '-pix_fmt', 'yuv420p'  # Ensure compatibility
-            ],
-            verbose=False,
-            logger=None
-        )
+        composite = self.profiler.timed("composite", composite_frame)
+        if self.engine == "ffmpeg":
+            with self.profiler.stage("encode"):
+                render_video(
+                    self.input_path,
+                    self.output_path,
+                    lambda frame, t: composite(frame, caption_layer(t)),
+                    encoder_params=[
+                        '-c:v', 'libx264',
+                        '-preset', 'veryfast',
+                        '-threads', str(self.n_cores)
+                    ] + ENCODER_PARAMS
+                )
+            return
 
-        original_video.close()
-        final_video.close()
+        original_video = VideoFileClip(self.input_path)
+        final_video = burn_in(original_video, caption_layer, composite=composite)
+
+        with self.profiler.stage("encode"):
+            final_video.write_videofile(
+                self.output_path,
+                codec='libx264',
+                audio_codec='aac',
+                temp_audiofile=os.path.splitext(self.output_path)[0] + '_temp_audio.m4a',  # Unique per job
+                remove_temp=True,
+                fps=original_video.fps,
+                threads=self.n_cores,
+                preset='veryfast',  # Using veryfast preset for better speed
+                ffmpeg_params=ENCODER_PARAMS,
+                verbose=False,
+                logger=None
+            )
+
+        with self.profiler.stage("cleanup"):
+            original_video.close()
+            final_video.close()
 
 if __name__ == "__main__":
     processor = VideoProcessor("default.mp4", "output.mp4")
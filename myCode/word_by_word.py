@@ -4,66 +4,54 @@ import subprocess
 import os
 import numpy as np
 from moviepy.config import change_settings
-import whisper
-import soundfile as sf
-from scipy.io import wavfile
 import numpy as np
 
+from compositor import caption_position, composite_clips, composite_frame
+from ffmpeg_pipe import check_engine, render_clips
+from profiling import Profiler, NULL_PROFILER
+from transcription import transcribe
+from audio import DecodedAudio, frame_energy, last_voiced_frames
+
 # Configure MoviePy to use ImageMagick
 change_settings({"IMAGEMAGICK_BINARY": "convert"})
 
-def analyze_audio_energy(video_path, word_data):
-    """Analyze audio energy to detect word elongation"""
-    # Extract audio from the relevant segment
-    video = VideoFileClip(video_path)
-    audio = video.audio
-
-    # Save audio segment to temporary file
-    temp_audio = "temp_audio.wav"
-    audio.write_audiofile(temp_audio, fps=16000, nbytes=2, codec='pcm_s16le')
-
-    # Read audio data
-    sample_rate, audio_data = wavfile.read(temp_audio)
-
-    # Convert to mono if stereo
-    if len(audio_data.shape) > 1:
-        audio_data = np.mean(audio_data, axis=1)
-
-    # Calculate start and end indices
-    start_idx = int(word_data['start'] * sample_rate)
-    end_idx = int((word_data['end'] + 1.0) * sample_rate)  # Look ahead 1 second
-
-    if end_idx > len(audio_data):
-        end_idx = len(audio_data)
-
-    # Get the segment of audio for this word
-    word_audio = audio_data[start_idx:end_idx]
-
-    # Calculate energy in small windows
-    window_size = int(0.03 * sample_rate)  # 30ms windows
-    energy = []
-
-    for i in range(0, len(word_audio) - window_size, window_size):
-        window = word_audio[i:i + window_size]
-        energy.append(np.sum(window ** 2))
-
-    energy = np.array(energy)
-
-    # Clean up
-    os.remove(temp_audio)
-    video.close()
-    audio.close()
-
-    return energy, sample_rate
+def refine_word_ends(starts, ends, next_starts, energy, frame_seconds=0.03, look_ahead=1.0):
+    """Move every word's end to its last voiced frame, for all words at once
+
+    A frame is voiced when its energy is above 30% of the mean energy from
+    the word's start to one second past its end. The new end may overlap the
+    next word in the segment by at most 100ms (NaN marks the last word).
+    """
+    n_frames = len(energy)
+    if n_frames == 0:
+        return ends
+    first = np.minimum((starts / frame_seconds).astype(np.intp), n_frames)
+    stop = np.clip(((ends + look_ahead) / frame_seconds).astype(np.intp), first, n_frames)
+
+    found, last_voiced = last_voiced_frames(energy, first, stop, 0.3)
+    potential_ends = np.maximum(last_voiced * frame_seconds, starts)
+
+    # Allow small overlap for flowing lyrics
+    clamped = np.where(
+        np.isnan(next_starts),
+        potential_ends,
+        np.minimum(potential_ends, next_starts + 0.1)  # 100ms overlap allowed
+    )
+    return np.where(found, clamped, ends)
 
-def get_word_timings(video_path):
+def get_word_timings(video_path, profiler=NULL_PROFILER, store_path=None, draft_model=None):
     """Get word-level timestamps using Whisper with improved timing"""
-    print("Loading Whisper model...")
-    model = whisper.load_model("large")  # Use larger model for better accuracy
+    # One decode feeds both Whisper and the energy envelope
+    with profiler.stage("audio_extraction"):
+        audio = DecodedAudio(video_path, store_path=store_path)
 
     print("Transcribing audio...")
-    result = model.transcribe(
-        video_path,
+    result = transcribe(
+        audio,
+        draft_model or "large",
+        escalate_to="large" if draft_model else None,  # Tiered: only the draft's unsure segments go to large
+        vad=False,  # Sung vocals over a steady backing track can read as music to the detector
+        profiler=profiler,
         language="en",
         word_timestamps=True,
         initial_prompt="♪ Music Lyrics: ",  # Help model recognize it's music
@@ -71,47 +59,43 @@ def get_word_timings(video_path):
         temperature=0.0
     )
 
-    words_with_times = []
-    if 'segments' in result:
+    if not result['segments']:
+        return []
+
+    with profiler.stage("word_grouping"):
+        words_with_times = []
+        next_starts = []
         for segment in result['segments']:
-            if 'words' in segment:
-                for i, word_data in enumerate(segment['words']):
-                    word = word_data['word'].strip()
-                    if not word:
-                        continue
+            segment_words = segment.get('words', [])
+            for i, word_data in enumerate(segment_words):
+                word = word_data['word'].strip()
+                if not word:
+                    continue
 
-                    # Get initial timing
-                    timing = {
-                        'word': word,
-                        'start': word_data['start'],
-                        'end': word_data['end']
-                    }
-
-                    # Analyze audio energy for this word
-                    energy, sample_rate = analyze_audio_energy(video_path, timing)
-
-                    if len(energy) > 0:
-                        # Find significant energy dropoff
-                        threshold = np.mean(energy) * 0.3
-                        above_threshold = energy > threshold
-
-                        # Find the last point where energy is above threshold
-                        if np.any(above_threshold):
-                            last_voiced = np.where(above_threshold)[0][-1]
-                            potential_end = timing['start'] + (last_voiced * 0.03)
-
-                            # Check next word to prevent overlap
-                            if i < len(segment['words']) - 1:
-                                next_word_start = segment['words'][i + 1]['start']
-                                # Allow small overlap for flowing lyrics
-                                timing['end'] = min(
-                                    potential_end,
-                                    next_word_start + 0.1  # 100ms overlap allowed
-                                )
-                            else:
-                                timing['end'] = potential_end
-
-                    words_with_times.append(timing)
+                words_with_times.append({
+                    'word': word,
+                    'start': word_data['start'],
+                    'end': word_data['end']
+                })
+                # Check next word to prevent overlap
+                next_starts.append(
+                    segment_words[i + 1]['start'] if i < len(segment_words) - 1 else np.nan
+                )
+
+    # One energy envelope for the whole track
+    with profiler.stage("audio_features"):
+        energy = frame_energy(audio.samples, audio.sample_rate, 0.03)
+
+    with profiler.stage("word_refinement"):
+        if words_with_times:
+            ends = refine_word_ends(
+                np.array([w['start'] for w in words_with_times]),
+                np.array([w['end'] for w in words_with_times]),
+                np.array(next_starts),
+                energy
+            )
+            for timing, end in zip(words_with_times, ends):
+                timing['end'] = float(end)
 
     print(f"Found {len(words_with_times)} words in the audio")
     return words_with_times
@@ -135,14 +119,20 @@ def create_caption_clip(word_data, video_width, video_height):
                          stroke_width=4)  # Thicker stroke for better visibility
                  .set_start(word_data['start'])
                  .set_duration(word_data['end'] - word_data['start'])
-                 .set_position(('center', 0.85, 'center'))  # Position near bottom
                  .set_opacity(opacity))
 
-    return text_clip
+    # Position near bottom
+    return text_clip.set_position(caption_position(text_clip.size, video_width, video_height))
 
-def add_live_captions(video_path, output_path):
+def add_live_captions(video_path, output_path, engine="moviepy", profile_path=None, trace_path=None, draft_model=None):
     """Main function optimized for music videos"""
     print("Starting video processing...")
+    profiler = Profiler(
+        "word_by_word",
+        enabled=profile_path is not None or trace_path is not None
+    )
+    # Decoded PCM is memory-mapped from disk next to the output, not held in RAM
+    store_path = os.path.splitext(output_path)[0] + '_audio.npy'
 
     try:
         # Load video
@@ -154,42 +144,55 @@ def add_live_captions(video_path, output_path):
 
         print(f"Video FPS: {video.fps}")
 
-        word_timings = get_word_timings(video_path)
+        word_timings = get_word_timings(video_path, profiler, store_path, draft_model)
 
         if not word_timings:
             print("No words were detected in the audio.")
             return
 
         print("Creating caption clips...")
-        text_clips = []
-
-        # Process words
-        for i, word_data in enumerate(word_timings):
-            if word_data['word'].strip():
-                try:
-                    clip = create_caption_clip(word_data, video.w, video.h)
-                    text_clips.append(clip)
-                except Exception as e:
-                    print(f"Error with word {word_data['word']}: {e}")
-                    continue
-            print(f"Processed {i+1}/{len(word_timings)} words")
-
-        print("Compositing final video...")
-        final_video = CompositeVideoClip([video] + text_clips)
-        final_video.fps = video.fps
-
-        print("Writing final video...")
-        final_video.write_videofile(
-            output_path,
-            codec='libx264',
-            audio_codec='aac',
-            threads=8,
-            fps=video.fps,
-            bitrate="6000k",  # Higher bitrate for better quality
-            preset='medium',  # Better quality preset
-            audio=True,
-            logger=None
-        )
+        with profiler.stage("caption_clips"):
+            text_clips = []
+
+            # Process words
+            for i, word_data in enumerate(word_timings):
+                if word_data['word'].strip():
+                    try:
+                        clip = create_caption_clip(word_data, video.w, video.h)
+                        text_clips.append(clip)
+                    except Exception as e:
+                        print(f"Error with word {word_data['word']}: {e}")
+                        continue
+                print(f"Processed {i+1}/{len(word_timings)} words")
+
+        if check_engine(engine) == "ffmpeg":
+            print("Writing final video through ffmpeg...")
+            with profiler.stage("encode"):
+                render_clips(
+                    video_path,
+                    output_path,
+                    text_clips,
+                    encoder_params=['-c:v', 'libx264', '-preset', 'medium', '-b:v', '6000k', '-threads', '8'],
+                    composite=profiler.timed("composite", composite_frame)
+                )
+        else:
+            print("Compositing final video...")
+            final_video = composite_clips(video, text_clips, profiler.timed)
+            final_video.fps = video.fps
+
+            print("Writing final video...")
+            with profiler.stage("encode"):
+                final_video.write_videofile(
+                    output_path,
+                    codec='libx264',
+                    audio_codec='aac',
+                    threads=8,
+                    fps=video.fps,
+                    bitrate="6000k",  # Higher bitrate for better quality
+                    preset='medium',  # Better quality preset
+                    audio=True,
+                    logger=None
+                )
 
     except Exception as e:
         print(f"An error occurred: {str(e)}")
@@ -197,13 +200,17 @@ def add_live_captions(video_path, output_path):
 
     finally:
         # Clean up
-        try:
-            video.close()
-            final_video.close()
-            for clip in text_clips:
-                clip.close()
-        except:
-            pass
+        with profiler.stage("cleanup"):
+            try:
+                video.close()
+                final_video.close()
+                for clip in text_clips:
+                    clip.close()
+            except:
+                pass
+            if os.path.exists(store_path):
+                os.remove(store_path)
+        profiler.save(profile_path, trace_path)
 
     print("Video processing complete!")
 
@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# The pipeline modules import each other as top-level modules from myCode/,
+# the caption package is imported from the repository root
+sys.path.insert(0, os.path.join(ROOT, "myCode"))
+sys.path.insert(0, ROOT)
@@ -0,0 +1,142 @@
+from contextlib import contextmanager
+
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+whisper = pytest.importorskip("whisper")
+
+from whisper.decoding import DecodingResult
+from whisper.model import ModelDimensions, Whisper
+from whisper.tokenizer import get_tokenizer
+
+import batch_transcribe
+from batch_transcribe import BatchTranscriber
+
+SEGMENT_KEYS = ("seek", "start", "end", "text", "tokens", "temperature", "avg_logprob", "compression_ratio", "no_speech_prob")
+# A multiple of the hop length, so both sides count the same number of content frames
+AUDIO = np.zeros(10 * 16000, dtype=np.float32)
+
+
+@pytest.fixture(scope="module")
+def model():
+    # Decoding is scripted below, so a small untrained model is enough
+    dims = ModelDimensions(
+        n_mels=80, n_audio_ctx=1500, n_audio_state=64, n_audio_head=2, n_audio_layer=1,
+        n_vocab=51865, n_text_ctx=448, n_text_state=64, n_text_head=2, n_text_layer=1
+    )
+    return Whisper(dims).eval()
+
+
+@pytest.fixture
+def tokenizer(model):
+    return get_tokenizer(model.is_multilingual, num_languages=model.num_languages, language="en", task="transcribe")
+
+
+def timestamp(tokenizer, seconds):
+    return tokenizer.timestamp_begin + round(seconds / 0.02)
+
+
+def script(model, monkeypatch, tokens, **stats):
+    """Make both whisper.transcribe and BatchTranscriber decode to the same result; returns the call counts"""
+    calls = {"whisper": 0, "batched": 0}
+
+    def result(options):
+        return DecodingResult(
+            audio_features=None, language="en", tokens=list(tokens),
+            temperature=options.temperature, **stats
+        )
+
+    def whisper_decode(mel, options):
+        calls["whisper"] += 1
+        return result(options)
+
+    def batched_decode(model, mel, options):
+        calls["batched"] += 1
+        return [result(options) for _ in range(len(mel))]
+
+    @contextmanager
+    def use(name, device=None):
+        yield model
+
+    monkeypatch.setattr(model, "decode", whisper_decode, raising=False)
+    monkeypatch.setattr(batch_transcribe, "decode", batched_decode)
+    monkeypatch.setattr(batch_transcribe.MODEL_POOL, "use", use)
+    return calls
+
+
+def both(model, **options):
+    options = dict(options, language="en", fp16=False)
+    expected = whisper.transcribe(model, AUDIO, verbose=None, **options)
+    transcriber = BatchTranscriber("scripted", "cpu")
+    try:
+        actual = transcriber.transcribe(AUDIO, **options)
+    finally:
+        transcriber.close()
+    return expected, actual
+
+
+def assert_same_segments(expected, actual):
+    assert [{k: s[k] for k in SEGMENT_KEYS} for s in actual["segments"]] == \
+        [{k: s[k] for k in SEGMENT_KEYS} for s in expected["segments"]]
+    assert actual["text"] == expected["text"]
+
+
+def test_segments_split_at_timestamp_pairs_like_whisper(model, tokenizer, monkeypatch):
+    tokens = (
+        [timestamp(tokenizer, 0.0)] + tokenizer.encode(" Hello there.") + [timestamp(tokenizer, 1.0)]
+        + [timestamp(tokenizer, 1.2)] + tokenizer.encode(" General Kenobi.") + [timestamp(tokenizer, 2.4)]
+    )
+    script(model, monkeypatch, tokens, avg_logprob=-0.2, no_speech_prob=0.01, compression_ratio=1.1)
+    expected, actual = both(model, temperature=0.0)
+    assert len(expected["segments"]) == 2
+    assert_same_segments(expected, actual)
+
+
+def test_unfinished_tail_is_decoded_again_like_whisper(model, tokenizer, monkeypatch):
+    # Dense speech that hit the sample length: the last segment never got its closing timestamp
+    tokens = (
+        [timestamp(tokenizer, 0.0)] + tokenizer.encode(" Hello there.") + [timestamp(tokenizer, 2.0)]
+        + [timestamp(tokenizer, 2.0)] + tokenizer.encode(" And then")
+    )
+    calls = script(model, monkeypatch, tokens, avg_logprob=-0.2, no_speech_prob=0.01, compression_ratio=1.1)
+    expected, actual = both(model, temperature=0.0, condition_on_previous_text=False)
+
+    # Each pass keeps the finished segment and resumes 2 s later, until the 10 s of audio are covered
+    assert [(s["start"], s["end"]) for s in expected["segments"]] == [(t, t + 2.0) for t in (0.0, 2.0, 4.0, 6.0, 8.0)]
+    assert calls["batched"] == calls["whisper"] == 5
+    assert_same_segments(expected, actual)
+
+
+def test_segment_without_timestamp_pairs_ends_at_its_last_timestamp(model, tokenizer, monkeypatch):
+    tokens = [timestamp(tokenizer, 0.0)] + tokenizer.encode(" Just one line") + [timestamp(tokenizer, 3.5)]
+    script(model, monkeypatch, tokens, avg_logprob=-0.2, no_speech_prob=0.01, compression_ratio=1.1)
+    expected, actual = both(model, temperature=0.0)
+    assert expected["segments"][0]["end"] == pytest.approx(3.5)
+    assert_same_segments(expected, actual)
+
+
+def test_silence_is_skipped_like_whisper(model, tokenizer, monkeypatch):
+    tokens = [timestamp(tokenizer, 0.0)] + tokenizer.encode(" Thanks for watching") + [timestamp(tokenizer, 2.0)]
+    script(model, monkeypatch, tokens, avg_logprob=-1.5, no_speech_prob=0.9, compression_ratio=1.1)
+    expected, actual = both(model, temperature=0.0)
+    assert expected["segments"] == [] and actual["segments"] == []
+
+
+@pytest.mark.parametrize("stats", [
+    dict(avg_logprob=-0.2, no_speech_prob=0.01, compression_ratio=1.1),  # Confident
+    dict(avg_logprob=-0.2, no_speech_prob=0.01, compression_ratio=3.0),  # Repetitive
+    dict(avg_logprob=-1.5, no_speech_prob=0.01, compression_ratio=1.1),  # Improbable
+    dict(avg_logprob=-1.5, no_speech_prob=0.9, compression_ratio=1.1),  # Silence
+    dict(avg_logprob=-0.2, no_speech_prob=0.9, compression_ratio=3.0),  # Repetitive but probable "silence"
+])
+def test_temperature_fallback_matches_whisper(model, tokenizer, monkeypatch, stats):
+    tokens = [timestamp(tokenizer, 0.0)] + tokenizer.encode(" la la la") + [timestamp(tokenizer, 1.0)]
+    calls = script(model, monkeypatch, tokens, **stats)
+    expected, actual = both(model, temperature=(0.0, 0.5))
+
+    assert calls["batched"] == calls["whisper"]
+    job_options = {"compression_ratio_threshold": 2.4, "logprob_threshold": -1.0, "no_speech_threshold": 0.6}
+    result = DecodingResult(audio_features=None, language="en", **stats)
+    assert BatchTranscriber._needs_fallback(result, job_options) == (calls["whisper"] == 2)
+    assert_same_segments(expected, actual)
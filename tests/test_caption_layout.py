@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("moviepy")
+
+from caption.animations.keyframes import sample_scales, scale_keyframes
+from caption.layout import get_metrics, layout_text
+from caption.text import rasterize_text
+from caption.types import CaptionStyle
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "myCode", "PermanentMarker-Regular.ttf")
+TEXT = "the quick brown fox jumps over the lazy dog while everyone watches tonight"
+
+
+@pytest.fixture
+def style():
+    return CaptionStyle(font_path=FONT_PATH, font_size=40, color="white", stroke_width=3)
+
+
+def test_layout_wraps_greedily_within_max_width(style):
+    max_width = 400
+    layout = layout_text(TEXT, style, max_width)
+    metrics = get_metrics(style.font_path, style.font_size, style.stroke_width, style.backend)
+    lines = [box.text for box in layout.lines]
+
+    assert " ".join(lines) == TEXT
+    assert len(lines) > 1
+    for box in layout.lines:
+        assert box.width <= max_width
+    # Greedy: each line's successor could not have taken one more word
+    for line, following in zip(lines, lines[1:]):
+        longer = f"{line} {following.split()[0]}"
+        assert metrics.text_width(longer) + 2 * style.stroke_width > max_width
+
+
+def test_layout_boxes_stack_and_center(style):
+    layout = layout_text(TEXT, style, 400)
+    metrics = get_metrics(style.font_path, style.font_size, style.stroke_width, style.backend)
+
+    assert layout.width == max(box.width for box in layout.lines)
+    assert layout.height == len(layout.lines) * metrics.line_height
+    for i, box in enumerate(layout.lines):
+        assert box.y == i * metrics.line_height
+        assert box.x == (layout.width - box.width) // 2
+
+
+def test_layout_keeps_an_overlong_word_on_its_own_line(style):
+    layout = layout_text("a supercalifragilistic b", style, 60)
+    assert [box.text for box in layout.lines] == ["a", "supercalifragilistic", "b"]
+
+
+def test_layout_width_matches_the_rendered_line(style):
+    # Layout measures pen advances, the raster its ink: they differ by the side bearings
+    for box in layout_text(TEXT, style, 400).lines:
+        assert abs(rasterize_text(box.text, style).shape[1] - box.width) <= style.font_size // 4
+
+
+def test_rasterized_text_has_ink_and_tracking_widens_it(style):
+    plain = rasterize_text("caption", style)
+    tracked = rasterize_text("caption", style, kerning=4)
+    assert plain.dtype == np.uint8 and plain.shape[2] == 4
+    assert plain[..., 3].any()
+    assert tracked.shape[1] == plain.shape[1] + 4 * (len("caption") - 1)
+
+
+def test_sampled_scales_are_quantized_per_frame():
+    scales = sample_scales(lambda t: 1 + 0.5 * t, duration=1.0, fps=10, quantum=0.05)
+    assert len(scales) == 10
+    np.testing.assert_allclose(scales, np.round((1 + 0.05 * np.arange(10)) / 0.05) * 0.05)
+
+
+def test_scale_keyframes_shares_one_sprite_per_scale():
+    from moviepy.editor import ColorClip
+
+    clip = ColorClip((40, 20), color=(255, 0, 0), duration=1.0)
+    animated = scale_keyframes(clip, lambda t: 1.0 if t < 0.5 else 1.5, fps=10)
+
+    assert animated.get_frame(0.0).shape == (20, 40, 3)
+    assert animated.get_frame(0.7).shape == (30, 60, 3)
+    assert animated.mask.get_frame(0.7).shape == (30, 60)
+    assert np.shares_memory(animated.get_frame(0.6), animated.get_frame(0.9))
+    assert not np.shares_memory(animated.get_frame(0.0), animated.get_frame(0.9))
@@ -0,0 +1,131 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("torch")
+pytest.importorskip("whisper")
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from chunked_transcribe import _map_bounded, _window_jobs, merge_segments, plan_chunks
+
+
+def word(text, start, end=None):
+    return {"word": text, "start": start, "end": start + 0.2 if end is None else end}
+
+
+def segment(*words):
+    return {
+        "start": words[0]["start"],
+        "end": words[-1]["end"],
+        "text": "".join(w["word"] for w in words),
+        "words": list(words),
+    }
+
+
+def test_merge_segments_concatenates_chunks():
+    first = [segment(word(" hello", 0.0), word(" there", 0.3))]
+    second = [segment(word(" general", 5.0), word(" kenobi", 5.4))]
+    merged = merge_segments([first, second])
+    assert [w["word"] for s in merged for w in s["words"]] == [" hello", " there", " general", " kenobi"]
+
+
+def test_merge_segments_drops_every_repeated_seam_word():
+    first = [segment(word(" one", 9.0), word(" two", 9.4), word(" three", 9.8))]
+    # Both windows heard "two three" around the seam, with slightly different timestamps
+    second = [segment(word(" Two", 9.45), word(" three.", 9.75), word(" four", 10.2))]
+    merged = merge_segments([first, second])
+
+    words = [w["word"] for s in merged for w in s["words"]]
+    assert words == [" one", " two", " three", " four"]
+    assert merged[-1]["start"] == 10.2
+    assert merged[-1]["text"] == " four"
+
+
+def test_merge_segments_keeps_repeated_words_away_from_the_seam():
+    first = [segment(word(" la", 9.0))]
+    second = [segment(word(" la", 10.0), word(" la", 10.5))]
+    merged = merge_segments([first, second])
+    assert [w["start"] for s in merged for w in s["words"]] == [9.0, 10.0, 10.5]
+
+
+def test_merge_segments_drops_a_fully_repeated_segment():
+    first = [segment(word(" yes", 4.0))]
+    second = [segment(word(" yes", 4.1)), segment(word(" no", 6.0))]
+    merged = merge_segments([first, second])
+    assert [s["text"] for s in merged] == [" yes", " no"]
+
+
+def test_plan_chunks_cuts_in_the_quietest_pause():
+    sr = 16000
+    rng = np.random.default_rng(0)
+    samples = (0.3 * rng.standard_normal(12 * sr)).astype(np.float32)
+    samples[int(8.5 * sr):int(9.0 * sr)] = 0  # A pause inside the search window
+
+    windows = plan_chunks(samples, sr, max_seconds=10.0, search_seconds=3.0)
+    assert windows[0][0] == 0 and windows[-1][1] == len(samples)
+    assert 8.5 * sr <= windows[0][1] <= 9.0 * sr
+    assert all(end - start <= 10.0 * sr for start, end in windows)
+
+
+def test_plan_chunks_handles_tiny_windows():
+    sr = 16000
+    samples = np.ones(sr, dtype=np.float32)
+    windows = plan_chunks(samples, sr, max_seconds=0.06, search_seconds=30.0)
+    assert all(0 < end - start <= int(0.06 * sr) for start, end in windows)
+    assert windows[-1][1] == len(samples)
+
+    with pytest.raises(ValueError):
+        plan_chunks(samples, sr, max_seconds=0.01)
+
+
+class SliceLog:
+    """A sample source that records which windows were sliced"""
+    def __init__(self, n):
+        self.samples = np.arange(n, dtype=np.float32)
+        self.sliced = []
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, key):
+        self.sliced.append((key.start, key.stop))
+        return self.samples[key]
+
+
+def test_window_jobs_slice_lazily_with_padding():
+    source = SliceLog(100)
+    jobs = _window_jobs(source, [(0, 40), (40, 100)], pad=5, sample_rate=10, model_name="tiny")
+    assert source.sliced == []
+
+    first = next(jobs)
+    assert source.sliced == [(0, 45)]
+    assert first["offset"] == 0.0 and first["keep"] == (0.0, 4.0) and first["model_name"] == "tiny"
+
+    second = next(jobs)
+    assert source.sliced[-1] == (35, 100)
+    assert second["offset"] == 3.5 and second["keep"] == (4.0, float("inf"))
+
+
+def test_map_bounded_keeps_order_and_limits_jobs_in_flight():
+    drawn, in_flight, peak = [0], [0], [0]
+    lock = threading.Lock()
+
+    def jobs():
+        for i in range(12):
+            drawn[0] += 1
+            yield i
+
+    def work(i):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.01 * (i % 3))
+        with lock:
+            in_flight[0] -= 1
+        return i * i
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        assert _map_bounded(pool, work, jobs(), limit=3) == [i * i for i in range(12)]
+    assert drawn[0] == 12 and peak[0] <= 3
@@ -0,0 +1,101 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("moviepy")
+
+from compositor import IntervalIndex, PremultipliedSprite, blend, composite_frame, render_rgba, sprite_bounds
+
+
+def random_rgba(rng, height, width, transparent_border=2):
+    rgba = rng.integers(0, 256, size=(height, width, 4), dtype=np.uint8)
+    if transparent_border:
+        b = transparent_border
+        rgba[:b, :, 3] = rgba[-b:, :, 3] = rgba[:, :b, 3] = rgba[:, -b:, 3] = 0
+    return rgba
+
+
+def over(dst_rgb, dst_alpha, rgba):
+    """Straight-alpha 'over' in floating point: (premultiplied rgb, alpha) in [0, 1]"""
+    a = rgba[..., 3:4] / 255.0
+    return rgba[..., :3] / 255.0 * a + dst_rgb * (1 - a), a + dst_alpha * (1 - a)
+
+
+def test_sprite_is_cropped_to_its_ink():
+    rgba = np.zeros((10, 12, 4), dtype=np.uint8)
+    rgba[3:6, 4:9] = (200, 100, 50, 128)
+    sprite = PremultipliedSprite(rgba, x=100, y=20)
+
+    assert sprite.offset == (104, 23)
+    assert sprite.rgb.shape == (3, 5, 3)
+    assert sprite_bounds(sprite, 1, 2) == (105, 25, 110, 28)
+    assert tuple(sprite.rgb[0, 0]) == (100, 50, 25)
+    assert int(sprite.inv_alpha[0, 0, 0]) == 127
+
+
+def test_blank_sprite_blends_nothing():
+    sprite = PremultipliedSprite(np.zeros((4, 4, 4), dtype=np.uint8))
+    frame = np.full((8, 8, 3), 77, dtype=np.uint8)
+    blend(frame, sprite, 0, 0)
+    assert (frame == 77).all()
+
+
+@pytest.mark.parametrize("x, y", [(5, 7), (-6, 3), (30, 25), (-50, 0)])
+def test_blend_matches_float_reference(x, y):
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, size=(32, 40, 3), dtype=np.uint8)
+    rgba = random_rgba(rng, 16, 20)
+
+    # The reference draws the uncropped sprite onto a padded canvas, then cuts the frame back out
+    pad = 64
+    canvas = np.zeros((32 + 2 * pad, 40 + 2 * pad, 3))
+    canvas[pad:-pad, pad:-pad] = frame / 255.0
+    region = canvas[pad + y:pad + y + 16, pad + x:pad + x + 20]
+    region[:], _ = over(region, 1.0, rgba)
+    expected = np.round(canvas[pad:-pad, pad:-pad] * 255)
+
+    actual = frame.copy()
+    blend(actual, PremultipliedSprite(rgba), x, y)
+    assert np.abs(actual.astype(int) - expected).max() <= 1
+
+
+def test_render_rgba_matches_float_reference():
+    rng = np.random.default_rng(1)
+    placed = [(random_rgba(rng, 12, 15), x, y) for x, y in [(3, 4), (10, 8), (-4, 14)]]
+    origin, size = (2, 3), (24, 20)
+
+    # Later sprites go over earlier ones, clipped to the canvas
+    rgb, alpha = np.zeros((20, 24, 3)), np.zeros((20, 24, 1))
+    for rgba, x, y in placed:
+        left, top = x - origin[0], y - origin[1]
+        x0, y0 = max(left, 0), max(top, 0)
+        x1, y1 = min(left + 15, size[0]), min(top + 12, size[1])
+        dst = (slice(y0, y1), slice(x0, x1))
+        src = rgba[y0 - top:y1 - top, x0 - left:x1 - left]
+        rgb[dst], alpha[dst] = over(rgb[dst], alpha[dst], src)
+
+    placements = [(PremultipliedSprite(rgba), x, y) for rgba, x, y in placed]
+    actual = render_rgba(placements, origin, size).astype(float)
+    assert np.abs(actual[..., 3:] - alpha * 255).max() <= 1
+    # Compare premultiplied: straight color is meaningless where coverage is near zero
+    assert np.abs(actual[..., :3] * actual[..., 3:] / 255 - rgb * 255).max() <= 2
+
+
+def test_composite_frame_passes_empty_frames_through():
+    frame = np.zeros((4, 4, 3), dtype=np.uint8)
+    frame.flags.writeable = False
+    assert composite_frame(frame, []) is frame
+
+    rgba = np.full((2, 2, 4), 255, dtype=np.uint8)
+    out = composite_frame(frame, [(PremultipliedSprite(rgba), 1, 1)])
+    assert out is not frame and (out[1:3, 1:3] == 255).all() and out[0, 0].sum() == 0
+
+
+def test_interval_index_finds_half_open_intervals():
+    items = [(0.0, 1.0, "a"), (0.5, 3.0, "b"), (2.0, 2.5, "c")]
+    index = IntervalIndex(items, start=lambda i: i[0], end=lambda i: i[1])
+    labels = lambda t: [i[2] for i in index.active(t)]
+    assert labels(0.0) == ["a"]
+    assert labels(0.7) == ["a", "b"]
+    assert labels(1.0) == ["b"]
+    assert labels(2.2) == ["b", "c"]
+    assert labels(3.0) == []
@@ -0,0 +1,79 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("torch")
+pytest.importorskip("whisper")
+
+from escalation import _inside, _keep_words, merge_spans, snap_spans, weak_segments
+
+
+def word(text, start, end):
+    return {"word": text, "start": start, "end": end}
+
+
+def segment(*words, **stats):
+    return dict(
+        start=words[0]["start"],
+        end=words[-1]["end"],
+        text="".join(w["word"] for w in words),
+        words=list(words),
+        **stats
+    )
+
+
+def test_weak_segments_flags_each_kind_of_doubt():
+    segments = [
+        segment(word(" fine", 0.0, 0.5), avg_logprob=-0.2, compression_ratio=1.2, no_speech_prob=0.01),
+        segment(word(" mumble", 1.0, 1.5), avg_logprob=-1.2, compression_ratio=1.2, no_speech_prob=0.01),
+        segment(word(" la la la", 2.0, 2.5), avg_logprob=-0.2, compression_ratio=3.1, no_speech_prob=0.01),
+        segment(word(" hm", 3.0, 3.5), avg_logprob=-0.2, compression_ratio=1.2, no_speech_prob=0.6),
+        segment(word(" unscored", 4.0, 4.5)),
+    ]
+    assert weak_segments(segments) == [(1.0, 1.5), (2.0, 2.5), (3.0, 3.5)]
+
+
+def test_merge_spans_pads_clips_and_joins_close_spans():
+    spans = [(5.0, 6.0), (0.2, 1.0), (6.8, 7.5), (12.0, 14.9)]
+    assert merge_spans(spans, duration=15.0) == [(0.0, 1.5), (4.5, 8.0), (11.5, 15.0)]
+    assert merge_spans([], duration=15.0) == []
+
+
+def test_keep_words_filters_and_shifts_words():
+    segments = [
+        segment(word(" a", 0.0, 0.4), word(" b", 0.5, 0.9)),
+        segment(word(" c", 1.0, 1.4)),
+    ]
+    kept = _keep_words(segments, lambda t: t < 11.0, offset=10.0)
+    assert len(kept) == 1
+    assert [w["word"] for w in kept[0]["words"]] == [" a", " b"]
+    assert (kept[0]["start"], kept[0]["end"], kept[0]["text"]) == (10.0, 10.9, " a b")
+
+
+def test_inside_uses_half_open_spans():
+    spans = [(1.0, 2.0), (4.0, 5.0)]
+    starts = [start for start, _ in spans]
+    assert [_inside(t, spans, starts) for t in (0.5, 1.0, 1.99, 2.0, 4.5, 6.0)] == \
+        [False, True, True, False, True, False]
+
+
+def test_snap_spans_moves_edges_out_of_words():
+    words = [word(" one", 0.0, 0.8), word(" two", 1.0, 1.9), word(" three", 2.3, 3.0), word(" four", 3.4, 4.0)]
+    # Starts inside "two" and ends inside "three"
+    assert snap_spans([(1.5, 2.6)], words, duration=5.0) == [(0.9, 3.2)]
+    # Edges already in pauses stay put
+    assert snap_spans([(0.9, 2.1)], words, duration=5.0) == [(0.9, 2.1)]
+    # The last word runs to the end of the audio
+    assert snap_spans([(3.6, 3.8)], words, duration=5.0) == [(3.2, 4.5)]
+
+
+def test_snapped_spans_keep_whole_words_on_one_side():
+    words = [word(" one", 0.0, 0.8), word(" two", 1.0, 1.9), word(" three", 2.3, 3.0)]
+    spans = snap_spans([(0.5, 2.5)], words, duration=3.5)
+    starts = [start for start, _ in spans]
+    for w in words:
+        assert _inside(w["start"], spans, starts) == _inside(w["end"] - 1e-6, spans, starts)
+
+
+def test_snap_spans_joins_spans_that_meet():
+    words = [word(" one", 0.0, 0.8), word(" two", 1.0, 1.9), word(" three", 2.3, 3.0)]
+    assert snap_spans([(0.0, 1.5), (1.7, 2.6)], words, duration=3.5) == [(0.0, 3.25)]
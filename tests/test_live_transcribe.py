@@ -0,0 +1,85 @@
+import struct
+from contextlib import contextmanager
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("torch")
+pytest.importorskip("whisper")
+
+import live_transcribe
+from live_transcribe import LiveTranscriber, _moov_first
+
+SR = 16000
+
+
+def box(kind, payload=b""):
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+@pytest.mark.parametrize("boxes, expected", [
+    ([box(b"ftyp", b"isom"), box(b"moov"), box(b"moof"), box(b"mdat", b"\0" * 16)], True),
+    ([box(b"ftyp", b"isom"), box(b"mdat", b"\0" * 16), box(b"moov")], False),
+    ([box(b"ftyp", b"isom")], False),
+])
+def test_moov_first(tmp_path, boxes, expected):
+    path = tmp_path / "recording.mp4"
+    path.write_bytes(b"".join(boxes))
+    assert _moov_first(str(path)) is expected
+
+
+class ScriptedModel:
+    """Hears a fixed list of words, with timestamps that jitter from pass to pass"""
+    def __init__(self, words, transcriber_ref):
+        self.words = words
+        self.ref = transcriber_ref
+        self.calls = 0
+
+    def transcribe(self, buffer, initial_prompt=None, **options):
+        transcriber = self.ref[0]
+        self.calls += 1
+        jitter = 0.05 if self.calls % 2 else -0.05
+        start, end = transcriber._buffer_start, transcriber._buffer_start + len(buffer) / SR
+        words = [
+            {"word": f" {text}", "start": max(s + jitter, start) - start, "end": min(e + jitter, end) - start}
+            for text, s, e in self.words
+            if s >= start and e <= end
+        ]
+        return {"segments": [{"words": words}] if words else []}
+
+
+def run(monkeypatch, words, seconds, **kwargs):
+    ref = []
+    model = ScriptedModel(words, ref)
+
+    @contextmanager
+    def whisper_transcriber(model_name, device, batched):
+        yield model
+
+    monkeypatch.setattr(live_transcribe, "whisper_transcriber", whisper_transcriber)
+    monkeypatch.setattr(live_transcribe, "speech_regions", lambda samples, sample_rate: [(0.0, 1.0)])
+    transcriber = LiveTranscriber(**kwargs)
+    ref.append(transcriber)
+
+    emitted, longest = [], 0
+    block = np.zeros(SR // 2, dtype=np.float32)
+    for _ in range(int(seconds * 2)):
+        emitted += transcriber.feed(block)
+        longest = max(longest, len(transcriber._buffer))
+    emitted += transcriber.flush()
+    transcriber.close()
+    return emitted, longest
+
+
+def test_words_are_emitted_once_and_in_order(monkeypatch):
+    words = [(f"w{i}", i * 0.5, i * 0.5 + 0.4) for i in range(20)]
+    emitted, _ = run(monkeypatch, words, 10.0)
+    assert [word["word"] for word in emitted] == [text for text, _, _ in words]
+
+
+def test_full_window_commits_before_trimming(monkeypatch):
+    words = [(f"w{i}", i * 0.5, i * 0.5 + 0.4) for i in range(60)]
+    # A finalize lag longer than the window: only the window cap moves it on
+    emitted, longest = run(monkeypatch, words, 30.0, max_window=6.0, look_behind=1.0, finalize_lag=8.0)
+    assert [word["word"] for word in emitted] == [text for text, _, _ in words]
+    assert longest <= (6.0 + 2.0 + 0.5) * SR
@@ -0,0 +1,39 @@
+import gzip
+import os
+
+import pytest
+
+from transcript_cache import TranscriptCache
+
+RESULT = {"text": " hi", "language": "en", "segments": [
+    {"start": 0.0, "end": 0.5, "text": " hi", "words": [{"word": " hi", "start": 0.0, "end": 0.5}]}
+]}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return TranscriptCache(str(tmp_path), max_bytes=1 << 20)
+
+
+def test_round_trip(cache):
+    cache.put("ab" * 32, RESULT)
+    assert cache.get("ab" * 32) == RESULT
+    assert cache.get("cd" * 32) is None
+
+
+@pytest.mark.parametrize("damage", [
+    lambda data: data[:len(data) // 2],  # Truncated gzip stream
+    lambda data: b"not gzip at all",
+    lambda data: gzip.compress(b"{not json"),
+])
+def test_corrupt_entry_is_a_miss_and_removed(cache, damage):
+    key = "ab" * 32
+    cache.put(key, RESULT)
+    path = cache._path(key)
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(damage(data))
+
+    assert cache.get(key) is None
+    assert not os.path.exists(path)
@@ -0,0 +1,71 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from vad import speech_regions
+
+SR = 16000
+
+
+def tone(seconds, freqs, sr=SR):
+    t = np.arange(int(seconds * sr)) / sr
+    return sum(np.sin(2 * np.pi * f * t) for f in freqs) / len(freqs)
+
+
+def speech_like(seconds, sr=SR):
+    """A harmonic voice whose loudness swings at a syllable rate of ~4 Hz"""
+    t = np.arange(int(seconds * sr)) / sr
+    syllables = 0.1 + 0.9 * np.abs(np.sin(2 * np.pi * 2 * t))
+    return 0.3 * syllables * tone(seconds, [150, 300, 450, 600], sr)
+
+
+def with_noise(samples, level=1e-4):
+    rng = np.random.default_rng(0)
+    return (samples + level * rng.standard_normal(len(samples))).astype(np.float32)
+
+
+def test_speech_is_found_between_silences():
+    silence = np.zeros(SR)
+    samples = with_noise(np.concatenate([silence, speech_like(3.0), silence]))
+    regions = speech_regions(samples)
+
+    assert len(regions) == 1
+    start, end = regions[0]
+    assert 0.6 <= start <= 1.1
+    assert 3.9 <= end <= 4.4
+
+
+def test_steady_music_is_not_speech():
+    samples = with_noise(0.3 * tone(5.0, [220, 277, 330]))
+    assert speech_regions(samples) == []
+
+
+def test_music_next_to_speech_keeps_only_the_speech():
+    music = 0.3 * tone(3.0, [220, 277, 330])
+    samples = with_noise(np.concatenate([np.zeros(SR), speech_like(2.0), np.zeros(SR), music]))
+    regions = speech_regions(samples)
+    assert regions and all(end <= 4.5 for _, end in regions)
+
+
+def test_silence_and_empty_audio_have_no_speech():
+    assert speech_regions(np.zeros(3 * SR, dtype=np.float32)) == []
+    assert speech_regions(with_noise(np.zeros(3 * SR))) == []
+    assert speech_regions(np.zeros(0, dtype=np.float32)) == []
+
+
+def test_extracted_speech_reads_the_same_samples_as_a_copy():
+    from vad import extract_speech
+
+    samples = np.arange(10 * SR, dtype=np.float32)
+    regions = [(0.5, 2.0), (4.0, 4.25), (7.0, 10.0)]
+    joined, timeline = extract_speech(samples, regions)
+
+    gap = np.zeros(int(0.3 * SR), dtype=np.float32)
+    copy = np.concatenate([
+        piece for start, end in regions for piece in (samples[int(start * SR):int(end * SR)], gap)
+    ])
+    assert len(joined) == len(copy)
+    np.testing.assert_array_equal(joined[:], copy)
+    for lo, hi in [(0, 100), (23990, 29000), (30000, 40000), (len(copy) - 7, len(copy) + 5)]:
+        np.testing.assert_array_equal(joined[lo:hi], copy[lo:hi])
+    assert timeline.to_source(1.8) == pytest.approx(4.0, abs=1e-3)
@@ -0,0 +1,79 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+for module in ("moviepy", "speech_recognition", "librosa", "torch", "whisper"):
+    pytest.importorskip(module)
+
+from sentence import adjust_word_timings
+from word_by_word import refine_word_ends
+
+
+def random_words(rng, n, frame_seconds, n_frames):
+    """Sorted word spans over the envelope, some running off its end; NaN after each segment's last word"""
+    starts = np.sort(rng.uniform(0, n_frames * frame_seconds * 1.05, n))
+    ends = starts + rng.uniform(0.05, 0.6, n)
+    next_starts = np.append(starts[1:], np.nan)
+    next_starts[rng.random(n) < 0.2] = np.nan
+    return starts, ends, next_starts
+
+
+def refine_word_end(start, end, next_start, energy, frame_seconds=0.03, look_ahead=1.0):
+    """One word at a time, as the docstring of refine_word_ends describes it"""
+    n_frames = len(energy)
+    first = min(int(start / frame_seconds), n_frames)
+    stop = min(max(int((end + look_ahead) / frame_seconds), first), n_frames)
+    window = energy[first:stop]
+    if len(window) == 0:
+        return end
+    voiced = np.flatnonzero(window > 0.3 * window.mean())
+    if len(voiced) == 0:
+        return end
+    new_end = max((first + voiced[-1]) * frame_seconds, start)
+    if not np.isnan(next_start):
+        new_end = min(new_end, next_start + 0.1)
+    return new_end
+
+
+def adjust_word_timing(start, end, next_start, rms, rms_times):
+    """One word at a time, as the docstring of adjust_word_timings describes it"""
+    start_idx = np.searchsorted(rms_times, start)
+    end_idx = np.searchsorted(rms_times, end)
+    if start_idx >= len(rms) or end_idx >= len(rms):
+        return end
+    window = rms[start_idx:end_idx + 1]
+    voiced = np.flatnonzero(window > 0.3 * window.mean())
+    if len(voiced) == 0:
+        return end
+    potential_end = rms_times[start_idx + voiced[-1]]
+    if not np.isnan(next_start):
+        potential_end = min(potential_end, next_start - 0.1)
+    return max(end, min(potential_end, start + 5.0))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_refine_word_ends_matches_per_word_reference(seed):
+    rng = np.random.default_rng(seed)
+    energy = rng.gamma(0.5, size=400).astype(np.float32)
+    energy[rng.random(400) < 0.3] = 0  # Silent stretches
+    starts, ends, next_starts = random_words(rng, 60, 0.03, len(energy))
+
+    expected = [refine_word_end(*word, energy) for word in zip(starts, ends, next_starts)]
+    np.testing.assert_allclose(refine_word_ends(starts, ends, next_starts, energy), expected)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_adjust_word_timings_matches_per_word_reference(seed):
+    rng = np.random.default_rng(seed)
+    rms = rng.gamma(0.5, size=500).astype(np.float32)
+    rms[rng.random(500) < 0.3] = 0
+    rms_times = np.arange(500) * 512 / 16000
+    starts, ends, next_starts = random_words(rng, 80, 512 / 16000, len(rms))
+
+    expected = [adjust_word_timing(*word, rms, rms_times) for word in zip(starts, ends, next_starts)]
+    np.testing.assert_allclose(adjust_word_timings(starts, ends, next_starts, rms, rms_times), expected)
+
+
+def test_empty_envelopes_keep_whisper_ends():
+    starts, ends, next_starts = np.array([0.5]), np.array([0.8]), np.array([np.nan])
+    assert refine_word_ends(starts, ends, next_starts, np.zeros(0)) is ends
+    assert adjust_word_timings(starts, ends, next_starts, np.zeros(0), np.zeros(0)) is ends